@@ -1,9 +1,13 @@
+import argparse
 import json
 import os
 import sys
+import threading
+import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 
 # --- Cấu hình đường dẫn import ---
@@ -37,8 +41,31 @@ except ImportError:
 
 # Import RAG Components từ Backend
 from backend.rag_pipeline.rag import RAGRetriever, answer_question_with_store
+from backend.rag_pipeline.vector_store import store_exists
 from backend.ai_deps import get_embedder
 from backend.config import settings
+from langchain_core.embeddings import Embeddings
+
+
+class SharedEmbedderEmbeddings(Embeddings):
+    """
+    Adapter LangChain Embeddings dùng lại Embedder đã nạp của pipeline,
+    tránh nạp bản thứ hai của model embedding cho Ragas judge.
+    Dùng prefix "query" cho cả hai phía (e5 khuyến nghị cho so khớp đối xứng
+    như answer_relevancy: câu hỏi gốc vs câu hỏi sinh lại).
+    """
+    
+    def __init__(self, embedder, prefix: str = "query"):
+        self.embedder = embedder
+        self.prefix = prefix
+        self._lock = threading.Lock()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            return self.embedder.encode(texts, prefix=self.prefix).tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
 
 
 class RagasEvaluator:
@@ -52,7 +79,9 @@ class RagasEvaluator:
         meta_path: str,
         test_data_path: str = "test_data.json",
         llm_model: str = None,
-        embedding_model: str = None
+        embedding_model: str = None,
+        max_workers: int = 4,
+        judge_workers: int = 2
     ):
         """
         Args:
@@ -60,13 +89,17 @@ class RagasEvaluator:
             meta_path: Đường dẫn file .json
             test_data_path: Đường dẫn file test data
             llm_model: Tên model LLM (mặc định từ settings)
-            embedding_model: Tên model embedding (mặc định từ settings)
+            embedding_model: Tên model embedding cho judge (mặc định: dùng lại embedder của pipeline)
+            max_workers: Số câu hỏi sinh câu trả lời song song (nên <= OLLAMA_NUM_PARALLEL)
+            judge_workers: Số worker của Ragas khi chấm điểm
         """
+        self.max_workers = max(1, max_workers)
+        self.judge_workers = max(1, judge_workers)
         # 1. Khởi tạo Pipeline
         print("🚀 Đang khởi tạo RAG components thực tế...")
         self.system_embedder = get_embedder()
         
-        if not os.path.exists(index_path) or not os.path.exists(meta_path):
+        if not store_exists(index_path, meta_path):
             raise FileNotFoundError(
                 f"Không tìm thấy file index hoặc meta tại:\n"
                 f"  Index: {index_path}\n"
@@ -90,10 +123,11 @@ class RagasEvaluator:
         # 3. Cấu hình Judge Models
         self.llm_model = llm_model or settings.LLM_MODEL
         self.embedding_model = embedding_model or settings.EMBEDDING_MODEL
+        self.share_embedder = embedding_model in (None, settings.EMBEDDING_MODEL)
         
         print(f"⚖️  Cấu hình Ragas Judge:")
         print(f"   LLM Model: {self.llm_model}")
-        print(f"   Embedding: {self.embedding_model}")
+        print(f"   Embedding: {self.embedding_model}{' (shared with pipeline)' if self.share_embedder else ''}")
         print(f"   Ragas API: {'New (llm_factory)' if USE_NEW_RAGAS else 'Legacy (Wrapper)'}")
         
         # Setup Judge LLM và Embeddings
@@ -111,7 +145,6 @@ class RagasEvaluator:
         from ragas.llms import LangchainLLMWrapper
         from ragas.embeddings import LangchainEmbeddingsWrapper
         from langchain_ollama import ChatOllama
-        from langchain_huggingface import HuggingFaceEmbeddings
         
         # Config
         self.judge_llm = LangchainLLMWrapper(
@@ -125,80 +158,141 @@ class RagasEvaluator:
             )
         )
         
-        self.judge_embeddings = LangchainEmbeddingsWrapper(
-            HuggingFaceEmbeddings(
+        if self.share_embedder:
+            # Dùng lại model embedding đã nạp cho pipeline (không nạp bản thứ hai)
+            embeddings = SharedEmbedderEmbeddings(self.system_embedder)
+        else:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            embeddings = HuggingFaceEmbeddings(
                 model_name=self.embedding_model,
                 model_kwargs={'device': 'cpu'},
                 encode_kwargs={'normalize_embeddings': True}
             )
+        self.judge_embeddings = LangchainEmbeddingsWrapper(embeddings)
+
+    @staticmethod
+    def _strip_context_header(ctx: str) -> str:
+        """Bỏ dòng [Source | Page | Chunk] mà retriever thêm vào đầu mỗi context."""
+        return (ctx.split('\n', 1)[1] if '\n' in ctx else ctx).strip()
+
+    def _answer_one(self, index: int, question: str, use_reranker: bool) -> Dict:
+        """
+        Sinh câu trả lời cho một câu hỏi qua đúng pipeline production (retrieve có
+        validation, không có context thì trả câu "không tìm thấy").
+        Raise nếu sinh câu trả lời lỗi để câu này không được ghi vào checkpoint.
+        """
+        ground_truth = self.test_data["ground_truths"][index][0]
+        started = time.perf_counter()
+        
+        # Pipeline tự retrieve (một lần) và ghi contexts đã đưa vào prompt vào stats
+        stats: Dict = {}
+        answer = answer_question_with_store(
+            question=question,
+            retriever=self.retriever,
+            streaming=False,
+            use_reranker=use_reranker,
+            detect_language=True,
+            stats=stats
         )
+        if stats.get("outcome") == "error":
+            raise RuntimeError(f"Generation failed: {answer[:200]}")
+        
+        # Chấm điểm trên đúng các contexts đã được đưa vào prompt (sau rerank / packing)
+        used_contexts = stats.get("packed_contexts", [])
+        contexts_list = [self._strip_context_header(ctx) for ctx in used_contexts]
+        if not contexts_list:
+            contexts_list = ["Không tìm thấy thông tin liên quan trong tài liệu."]
+        
+        return {
+            "index": index,
+            "question": question,
+            "contexts": contexts_list,
+            "answer": answer,
+            "ground_truth": ground_truth,
+            "outcome": stats.get("outcome", "answered"),
+            "latency_s": round(time.perf_counter() - started, 3),
+        }
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path: Optional[str], questions: List[str]) -> Dict[int, Dict]:
+        """Đọc các câu trả lời đã sinh từ lần chạy trước (bỏ qua dòng không khớp câu hỏi)."""
+        done: Dict[int, Dict] = {}
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return done
+        
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # dòng ghi dở khi bị ngắt
+                index = record.get("index")
+                if isinstance(index, int) and index < len(questions) and record.get("question") == questions[index]:
+                    done[index] = record
+        return done
 
-    def generate_rag_responses(self, use_reranker: bool = False) -> List[Dict]:
+    def generate_rag_responses(
+        self,
+        use_reranker: bool = False,
+        checkpoint_path: Optional[str] = None
+    ) -> List[Dict]:
         """
-        Chạy RAG pipeline để sinh câu trả lời
+        Chạy RAG pipeline để sinh câu trả lời (song song max_workers câu hỏi).
+        
+        Mỗi câu trả lời thành công được ghi ngay vào checkpoint_path (JSONL); khi chạy
+        lại, các câu đã có trong checkpoint được bỏ qua. Câu bị lỗi không được ghi
+        nên sẽ được thử lại ở lần chạy sau.
         """
+        questions = self.test_data['questions']
+        total = len(questions)
+        
         print("\n" + "="*60)
         print("🔄 Đang chạy RAG Pipeline để sinh câu trả lời...")
         print(f"   Use Reranker: {use_reranker}")
+        print(f"   Workers: {self.max_workers}")
         print("="*60 + "\n")
         
-        results = []
+        results = self._load_checkpoint(checkpoint_path, questions)
+        if results:
+            print(f"♻️  Tiếp tục từ checkpoint: {len(results)}/{total} câu đã có ({checkpoint_path})")
         
-        for i, question in enumerate(self.test_data['questions'], 1):
-            print(f"[{i}/{len(self.test_data['questions'])}] Hỏi: {question}")
-            
-            try:
-                # 1. Retrieve contexts
-                retrieved_contexts_raw = self.retriever.retrieve(
-                    question=question,
-                    k_semantic=settings.TOP_K_RETRIEVE,
-                    k_keyword=settings.TOP_K_RETRIEVE,
-                    use_validation=False
-                )
+        pending = [i for i in range(total) if i not in results]
+        write_lock = threading.Lock()
+        started = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._answer_one, i, questions[i], use_reranker): i
+                for i in pending
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[{i + 1}/{total}] ❌ Lỗi khi xử lý câu hỏi: {e}")
+                    results[i] = {
+                        "index": i,
+                        "question": questions[i],
+                        "contexts": ["Error during retrieval"],
+                        "answer": f"Lỗi: {str(e)}",
+                        "ground_truth": self.test_data["ground_truths"][i][0]
+                    }
+                    continue
                 
-                # Xử lý contexts
-                if not retrieved_contexts_raw:
-                    contexts_list = ["Không tìm thấy thông tin liên quan trong tài liệu."]
-                    print("   ⚠️  Không tìm thấy context")
-                else:
-                    contexts_list = []
-                    for ctx in retrieved_contexts_raw:
-                        if '\n' in ctx:
-                            text = ctx.split('\n', 1)[1]
-                        else:
-                            text = ctx
-                        contexts_list.append(text.strip())
-                    
-                    print(f"   ✓ Contexts: {len(contexts_list)}")
-
-                # 2. Generate Answer
-                answer = answer_question_with_store(
-                    question=question,
-                    retriever=self.retriever,
-                    streaming=False,
-                    use_reranker=use_reranker,
-                    detect_language=True
+                results[i] = result
+                print(
+                    f"[{i + 1}/{total}] ✓ {result['latency_s']:.1f}s, "
+                    f"{len(result['contexts'])} contexts: {result['answer'][:60]}..."
                 )
-                
-                print(f"   ✓ Answer: {answer[:80]}...")
-                
-                results.append({
-                    "question": question,
-                    "contexts": contexts_list,
-                    "answer": answer,
-                    "ground_truth": self.test_data["ground_truths"][i-1][0]
-                })
-                
-            except Exception as e:
-                print(f"   ❌ Lỗi khi xử lý câu hỏi: {e}")
-                results.append({
-                    "question": question,
-                    "contexts": ["Error during retrieval"],
-                    "answer": f"Lỗi: {str(e)}",
-                    "ground_truth": self.test_data["ground_truths"][i-1][0]
-                })
+                if checkpoint_path:
+                    with write_lock, open(checkpoint_path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        
+        if pending:
+            print(f"\n⏱️  Sinh {len(pending)} câu trả lời trong {time.perf_counter() - started:.1f}s")
         
-        return results
+        return [results[i] for i in range(total)]
 
     def save_detailed_results(self, results, rag_results, output_dir: str = "evaluation_results"):
         """
@@ -267,6 +361,7 @@ class RagasEvaluator:
                     'answer': result['answer'],
                     'ground_truth': result['ground_truth'],
                     'num_contexts': len(result['contexts']),
+                    'latency_s': result.get('latency_s'),
                     'contexts': ' ||| '.join(result['contexts'])
                 }
                 
@@ -352,13 +447,17 @@ class RagasEvaluator:
         self, 
         use_all_metrics: bool = False,
         use_reranker: bool = False,
-        batch_size: int = 1
+        batch_size: int = 1,
+        checkpoint_path: Optional[str] = None
     ):
         """
         Thực hiện đánh giá
         """
         # 1. Thu thập dữ liệu
-        rag_results = self.generate_rag_responses(use_reranker=use_reranker)
+        rag_results = self.generate_rag_responses(
+            use_reranker=use_reranker,
+            checkpoint_path=checkpoint_path
+        )
         
         # 2. Chuyển sang Dataset
         data_dict = {
@@ -392,7 +491,7 @@ class RagasEvaluator:
             # Cấu hình RunConfig để kiểm soát timeout và worker của Ragas
             my_run_config = RunConfig(
                 timeout=3600,      # 1 giờ cho mỗi task (đủ lâu cho local LLM)
-                max_workers=1,     # Chỉ chạy 1 luồng để không làm nghẽn Ollama
+                max_workers=self.judge_workers,  # Nên <= OLLAMA_NUM_PARALLEL để không làm nghẽn Ollama
                 max_retries=3,     # Thử lại nếu lỗi
                 max_wait=180       # Thời gian chờ tối đa giữa các retry
             )
@@ -418,8 +517,21 @@ class RagasEvaluator:
             return None
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Đánh giá RAG pipeline bằng Ragas (local LLM)")
+    parser.add_argument("--workers", type=int, default=4, help="Số câu hỏi sinh câu trả lời song song")
+    parser.add_argument("--judge-workers", type=int, default=2, help="Số worker Ragas khi chấm điểm")
+    parser.add_argument("--reranker", action="store_true", help="Dùng reranker trong pipeline")
+    parser.add_argument("--quick", action="store_true", help="Chỉ chấm answer_relevancy")
+    parser.add_argument("--checkpoint", default=None, help="File JSONL checkpoint câu trả lời (mặc định trong evaluation_results/)")
+    parser.add_argument("--fresh", action="store_true", help="Bỏ checkpoint cũ, sinh lại toàn bộ câu trả lời")
+    return parser.parse_args()
+
+
 def main():
     """Main function để chạy evaluation"""
+    args = parse_args()
+    
     print("\n" + "="*70)
     print("🎯 RAG PIPELINE EVALUATION WITH RAGAS (LOCAL LLM)")
     print("="*70 + "\n")
@@ -462,19 +574,31 @@ def main():
         evaluator = RagasEvaluator(
             index_path=INDEX_FILE,
             meta_path=META_FILE,
-            test_data_path=TEST_DATA_FILE
+            test_data_path=TEST_DATA_FILE,
+            max_workers=args.workers,
+            judge_workers=args.judge_workers
+        )
+        
+        # Checkpoint câu trả lời: chạy lại sau khi bị ngắt sẽ tiếp tục từ câu chưa xong
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        checkpoint_path = args.checkpoint or os.path.join(
+            OUTPUT_DIR,
+            f"responses_checkpoint{'_rerank' if args.reranker else ''}.jsonl"
         )
+        if args.fresh and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
         
         print("\n💡 LƯU Ý:")
         print(f"   - Kết quả sẽ được lưu vào thư mục '{OUTPUT_DIR}/'")
         print("   - 4 file CSV: scores, summary, details, config")
-        print("   - Chỉ dùng answer_relevancy để tránh timeout\n")
+        print(f"   - Checkpoint câu trả lời: {checkpoint_path} (--fresh để chạy lại từ đầu)\n")
         
         # Chạy evaluation
         results = evaluator.run_evaluation(
-            use_all_metrics=True,  # True để test đầy đủ (rất chậm)
-            use_reranker=False,
-            batch_size=1
+            use_all_metrics=not args.quick,  # Đầy đủ metrics (rất chậm), --quick để chỉ dùng answer_relevancy
+            use_reranker=args.reranker,
+            batch_size=1,
+            checkpoint_path=checkpoint_path
         )
         
         if results:
@@ -0,0 +1,349 @@
+"""
+Retrieval-only evaluation (không cần LLM judge)
+-----------------------------------------------
+Chấm chất lượng retrieval trên test_data.json trong vài giây, để chạy sau mỗi thay đổi
+ở retriever / BM25 / reranker. Các cấu hình được so sánh:
+
+- semantic : chỉ FAISS (top-k theo cosine)
+- bm25     : chỉ BM25 (analyzer theo settings.BM25_ANALYZER hoặc --bm25-analyzer)
+- fused    : Retriever.retrieve (semantic + BM25 với ngưỡng trong settings, như production)
+- cascade  : fused nhưng bỏ qua / giới hạn BM25 khi semantic top-1 và margin đủ cao
+             (CASCADE_* trong settings hoặc --cascade-*); báo cáo kèm số lần mỗi nhánh được dùng
+- reranked : fused rồi rerank bằng cross-encoder (--reranker)
+
+Nhãn liên quan (theo thứ tự ưu tiên trong test_data.json):
+1. "relevant_chunk_ids": [[chunk_unique_id, ...], ...] - nhãn trực tiếp theo chunk
+2. "ground_truth_contexts": một chunk liên quan tới một context nếu chứa >= --overlap
+   tỷ lệ từ của context đó (context có "..." được tách thành nhiều đoạn)
+3. "ground_truths" (câu trả lời mẫu) với cùng quy tắc overlap
+
+Metrics @k: recall (tỷ lệ nhãn được bao phủ), MRR, nDCG (nhị phân), hit-rate,
+kèm latency từng query. Kết quả ghi ra evaluation_results/retrieval_<timestamp>.json.
+
+Chạy từ thư mục gốc project:
+    python -m backend.RagEvaluation.evaluate_retrieval --k 5
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+current_dir = Path(__file__).resolve().parent
+project_root = current_dir.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.append(str(project_root))
+
+from backend.ai_deps import get_embedder, get_reranker
+from backend.config import settings
+from backend.rag_pipeline.retriever import Retriever
+from backend.rag_pipeline.text_analyzer import ANALYZERS, get_analyzer
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Một cấu hình retrieval: (query, k) -> danh sách index chunk đã xếp hạng
+RankFn = Callable[[str, int], List[int]]
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(WORD_RE.findall(text.lower()))
+
+
+def _chunk_key(doc: Dict) -> str:
+    metadata = doc.get("metadata", {})
+    return str(metadata.get("chunk_unique_id") or metadata.get("chunk_id"))
+
+
+class RelevanceLabels:
+    """Tập nhãn của một câu hỏi: mỗi "target" là một nhóm chunk index cùng bao phủ nó."""
+
+    def __init__(self, targets: List[Set[int]]):
+        self.targets = [t for t in targets if t]
+        self.relevant: Set[int] = set().union(*self.targets) if self.targets else set()
+
+
+def build_labels(
+    test_data: Dict,
+    documents: List[Dict],
+    overlap: float
+) -> List[RelevanceLabels]:
+    """Sinh nhãn liên quan cho từng câu hỏi (xem docstring module)."""
+    questions = test_data["questions"]
+
+    if "relevant_chunk_ids" in test_data:
+        key_to_index = {_chunk_key(doc): i for i, doc in enumerate(documents)}
+        return [
+            RelevanceLabels([{key_to_index[k]} for k in ids if k in key_to_index])
+            for ids in test_data["relevant_chunk_ids"]
+        ]
+
+    references = test_data.get("ground_truth_contexts") or test_data["ground_truths"]
+    chunk_tokens = [_tokens(doc.get("text", "")) for doc in documents]
+
+    labels = []
+    for q_idx in range(len(questions)):
+        targets = []
+        for reference in references[q_idx]:
+            fragments = [_tokens(part) for part in reference.split("...")]
+            fragments = [f for f in fragments if len(f) >= 3]
+            if not fragments:
+                continue
+            # Chunk phải bao phủ đủ một đoạn bất kỳ của context
+            targets.append({
+                i for i, tokens in enumerate(chunk_tokens)
+                if any(len(f & tokens) / len(f) >= overlap for f in fragments)
+            })
+        labels.append(RelevanceLabels(targets))
+    return labels
+
+
+def score_ranking(ranked: List[int], labels: RelevanceLabels, k: int) -> Dict[str, float]:
+    """recall / MRR / nDCG / hit-rate @k cho một query."""
+    top = ranked[:k]
+    if not labels.targets:
+        return {}
+
+    covered = sum(1 for target in labels.targets if target & set(top))
+    first_rank = next((r for r, idx in enumerate(top, 1) if idx in labels.relevant), None)
+    dcg = sum(1 / math.log2(r + 1) for r, idx in enumerate(top, 1) if idx in labels.relevant)
+    ideal = sum(1 / math.log2(r + 1) for r in range(1, min(k, len(labels.relevant)) + 1))
+
+    return {
+        "recall": covered / len(labels.targets),
+        "mrr": 1 / first_rank if first_rank else 0.0,
+        "ndcg": dcg / ideal if ideal else 0.0,
+        "hit": 1.0 if first_rank else 0.0,
+    }
+
+
+class RetrievalEvaluator:
+    """Chạy các cấu hình retrieval trên cùng bộ câu hỏi và tổng hợp metrics."""
+
+    def __init__(
+        self,
+        index_path: str,
+        meta_path: str,
+        use_reranker: bool = False,
+        cascade: Optional[Dict[str, float]] = None,
+        bm25_analyzer: Optional[str] = None,
+        bm25_threshold: Optional[float] = None,
+        bm25_min_top1: float = 1.0
+    ):
+        # Analyzer khác với lúc build -> BM25 được build lại từ documents (xem Retriever.bm25)
+        self.retriever = Retriever(
+            index_path, meta_path, embedder=get_embedder(),
+            analyzer=get_analyzer(bm25_analyzer or settings.BM25_ANALYZER)
+        )
+        self.bm25_threshold = settings.BM25_THRESHOLD if bm25_threshold is None else bm25_threshold
+        self.bm25_min_top1 = bm25_min_top1
+        # Giống RAGRetriever: index nén được re-score trên vector fp32
+        self.retriever.store.rescore_factor = settings.VECTOR_RESCORE_FACTOR
+        self.documents = self.retriever.store.documents
+        self.key_to_index = {_chunk_key(doc): i for i, doc in enumerate(self.documents)}
+        self.reranker = get_reranker() if use_reranker else None
+        self.cascade = cascade or {
+            "cascade_min_top1": settings.CASCADE_MIN_TOP1,
+            "cascade_min_margin": settings.CASCADE_MIN_MARGIN,
+            "cascade_capped_k": settings.CASCADE_CAPPED_K,
+        }
+
+        self.configs: Dict[str, RankFn] = {
+            "semantic": self.rank_semantic,
+            "bm25": self.rank_bm25,
+            "fused": self.rank_fused,
+            "cascade": self.rank_cascade,
+        }
+        if self.reranker is not None:
+            self.configs["reranked"] = self.rank_reranked
+
+    # --- Các cấu hình ---------------------------------------------------
+
+    def rank_semantic(self, query: str, k: int) -> List[int]:
+        q_emb = self.retriever.embedder.encode([query], prefix="query")
+        # _search_ids như production: index nén (fp16 / sq8 / pq) được re-score trên fp32
+        _, idxs = self.retriever.store._search_ids(np.asarray(q_emb, dtype=np.float32).reshape(1, -1), k)
+        return [int(i) for i in idxs if i >= 0]
+
+    def rank_bm25(self, query: str, k: int) -> List[int]:
+        scores = self.retriever.keyword_scores(query)
+        return [int(i) for i in np.argsort(scores)[::-1][:k]]
+
+    def _fused_docs(self, query: str, k: int, **cascade) -> List[Dict]:
+        docs, _ = self.retriever.retrieve(
+            query,
+            k_semantic=k,
+            k_keyword=k,
+            semantic_threshold=settings.SIMILARITY_THRESHOLD,
+            bm25_threshold=self.bm25_threshold,
+            min_results=1,
+            bm25_min_top1=self.bm25_min_top1,
+            **cascade,
+        )
+        return docs
+
+    def rank_fused(self, query: str, k: int) -> List[int]:
+        return [self.key_to_index[_chunk_key(doc)] for doc in self._fused_docs(query, k)]
+
+    def rank_cascade(self, query: str, k: int) -> List[int]:
+        docs = self._fused_docs(query, k, **self.cascade)
+        return [self.key_to_index[_chunk_key(doc)] for doc in docs]
+
+    def rank_reranked(self, query: str, k: int) -> List[int]:
+        docs = self._fused_docs(query, k)
+        texts = [doc["text"] for doc in docs]
+        reranked = self.reranker.rerank(query=query, candidates=texts, topn=k)
+        by_text = {doc["text"]: self.key_to_index[_chunk_key(doc)] for doc in docs}
+        return [by_text[text] for text in reranked]
+
+    # --- Đánh giá -------------------------------------------------------
+
+    def evaluate(
+        self,
+        questions: List[str],
+        labels: List[RelevanceLabels],
+        k: int,
+        configs: Optional[List[str]] = None
+    ) -> Dict[str, Dict]:
+        results: Dict[str, Dict] = {}
+        for name in configs or list(self.configs):
+            rank_fn = self.configs[name]
+            rank_fn(questions[0], k)  # warmup (nạp model / cache)
+
+            self.retriever.path_counts.clear()
+            per_query = []
+            for question, label in zip(questions, labels):
+                start = time.perf_counter()
+                ranked = rank_fn(question, k)
+                latency_ms = (time.perf_counter() - start) * 1000
+                per_query.append({
+                    "question": question,
+                    "ranked": [_chunk_key(self.documents[i]) for i in ranked[:k]],
+                    "latency_ms": round(latency_ms, 3),
+                    **score_ranking(ranked, label, k),
+                })
+
+            scored = [q for q in per_query if "recall" in q]
+            latencies = np.array([q["latency_ms"] for q in per_query])
+            results[name] = {
+                "summary": {
+                    **{
+                        metric: round(float(np.mean([q[metric] for q in scored])), 4) if scored else None
+                        for metric in ("recall", "mrr", "ndcg", "hit")
+                    },
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                    "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                    "labelled_queries": len(scored),
+                },
+                "queries": per_query,
+            }
+            if name == "cascade":
+                results[name]["summary"]["paths"] = dict(self.retriever.path_counts)
+        return results
+
+
+def _print_summary(results: Dict[str, Dict], k: int) -> None:
+    header = f"{'config':<10} {'recall@' + str(k):>9} {'MRR':>7} {'nDCG':>7} {'hit':>7} {'p50 ms':>9} {'p95 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        s = result["summary"]
+        fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+        print(
+            f"{name:<10} {fmt(s['recall']):>9} {fmt(s['mrr']):>7} {fmt(s['ndcg']):>7} "
+            f"{fmt(s['hit']):>7} {s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f}"
+        )
+        if "paths" in s:
+            total = sum(s["paths"].values()) or 1
+            paths = ", ".join(f"{path}={n} ({n / total:.0%})" for path, n in sorted(s["paths"].items()))
+            print(f"{'':<10} paths: {paths}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Đánh giá retrieval không cần LLM (recall@k, MRR, nDCG, hit-rate)")
+    parser.add_argument("--index", default="backend/data/vectordb/index.faiss")
+    parser.add_argument("--meta", default="backend/data/vectordb/chunks.json")
+    parser.add_argument("--test-data", default=str(current_dir / "test_data.json"))
+    parser.add_argument("--k", type=int, default=settings.TOP_K_RETRIEVE)
+    parser.add_argument("--overlap", type=float, default=0.5, help="Tỷ lệ từ của context mẫu mà chunk phải chứa")
+    parser.add_argument("--configs", default=None, help="Danh sách cấu hình, ví dụ semantic,bm25,fused")
+    parser.add_argument("--reranker", action="store_true", help="Thêm cấu hình reranked")
+    parser.add_argument("--cascade-min-top1", type=float, default=settings.CASCADE_MIN_TOP1)
+    parser.add_argument("--cascade-min-margin", type=float, default=settings.CASCADE_MIN_MARGIN)
+    parser.add_argument("--cascade-capped-k", type=int, default=settings.CASCADE_CAPPED_K)
+    parser.add_argument("--bm25-analyzer", default=settings.BM25_ANALYZER, choices=list(ANALYZERS))
+    parser.add_argument("--bm25-threshold", type=float, default=settings.BM25_THRESHOLD)
+    parser.add_argument("--bm25-min-top1", type=float, default=1.0, help="Ngưỡng tuyệt đối cho điểm BM25 top1 (như rag.py)")
+    parser.add_argument("--output-dir", default=str(current_dir / "evaluation_results"))
+    args = parser.parse_args()
+
+    for path in (args.index, args.meta, args.test_data):
+        if not os.path.exists(path):
+            print(f"❌ Không tìm thấy {path}")
+            return 1
+
+    with open(args.test_data, "r", encoding="utf-8") as f:
+        test_data = json.load(f)
+
+    started = time.perf_counter()
+    cascade = {
+        "cascade_min_top1": args.cascade_min_top1,
+        "cascade_min_margin": args.cascade_min_margin,
+        "cascade_capped_k": args.cascade_capped_k,
+    }
+    evaluator = RetrievalEvaluator(
+        args.index, args.meta, use_reranker=args.reranker, cascade=cascade,
+        bm25_analyzer=args.bm25_analyzer, bm25_threshold=args.bm25_threshold, bm25_min_top1=args.bm25_min_top1,
+    )
+    labels = build_labels(test_data, evaluator.documents, args.overlap)
+    unlabelled = sum(1 for label in labels if not label.targets)
+    if unlabelled:
+        print(f"⚠️  {unlabelled}/{len(labels)} câu hỏi không có chunk nào khớp nhãn (bỏ qua khi tính metrics)")
+
+    configs = args.configs.split(",") if args.configs else None
+    unknown = set(configs or []) - set(evaluator.configs)
+    if unknown:
+        print(f"❌ Cấu hình không hợp lệ: {', '.join(sorted(unknown))} (có: {', '.join(evaluator.configs)})")
+        return 1
+    results = evaluator.evaluate(test_data["questions"], labels, args.k, configs)
+
+    print()
+    _print_summary(results, args.k)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = os.path.join(args.output_dir, f"retrieval_{timestamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "timestamp": timestamp,
+                "index_path": args.index,
+                "num_chunks": len(evaluator.documents),
+                "k": args.k,
+                "overlap": args.overlap,
+                "settings": {
+                    "SIMILARITY_THRESHOLD": settings.SIMILARITY_THRESHOLD,
+                    "BM25_THRESHOLD": args.bm25_threshold,
+                    "BM25_MIN_TOP1": args.bm25_min_top1,
+                    "BM25_ANALYZER": args.bm25_analyzer,
+                    "EMBEDDING_MODEL": settings.EMBEDDING_MODEL,
+                },
+                "cascade": cascade,
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"\n💾 Đã lưu kết quả vào: {output} ({time.perf_counter() - started:.1f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
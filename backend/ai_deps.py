@@ -1,9 +1,10 @@
 """
 AI Model Dependencies
 ---------------------
-Cung cấp các hàm singleton cho các model AI (Embedder, Reranker, Ollama client).
+Cung cấp các hàm singleton cho các model AI (Embedder, Reranker, Ollama client, Language detector).
 Các instance này được khởi tạo một lần và dùng chung cho toàn bộ ứng dụng.
 """
+import logging
 import ollama
 from functools import lru_cache
 from ollama import Client
@@ -11,6 +12,9 @@ from ollama import Client
 from .config import settings
 from .rag_pipeline.embedder import Embedder
 from .rag_pipeline.reranker import Reranker
+from .rag_pipeline.language_detector import LanguageDetector
+
+logger = logging.getLogger(__name__)
 
 
 @lru_cache(maxsize=1)
@@ -20,7 +24,7 @@ def get_embedder() -> Embedder:
     LƯU Ý: Chạy trên CPU để dành VRAM cho Ollama (Generator)
     """
     embedder = Embedder(model_name=settings.EMBEDDING_MODEL, device="cpu")
-    print("✅ Đã tải xong model Embedding.", flush=True)
+    logger.info("Đã tải xong model Embedding.")
     return embedder
 
 
@@ -32,7 +36,7 @@ def get_reranker() -> Reranker:
     """
     # Reranker class của bạn đã có logic nhận tham số device (xem file reranker.py cũ)
     reranker = Reranker(model_name=settings.RERANKER_MODEL, device="cpu")
-    print("✅ Đã tải xong model Reranker.", flush=True)
+    logger.info("Đã tải xong model Reranker.")
     return reranker
 
 
@@ -41,10 +45,20 @@ def get_ollama_client() -> Client:
     """Trả về Ollama client dùng chung."""
     return Client(host=settings.OLLAMA_BASE_URL)
 
+
+@lru_cache(maxsize=1)
+def get_language_detector() -> LanguageDetector:
+    """Trả về LanguageDetector dùng chung (giữ LRU cache và ngôn ngữ theo conversation)."""
+    return LanguageDetector(
+        cache_size=settings.LANGUAGE_CACHE_SIZE,
+        max_conversations=settings.LANGUAGE_MAX_CONVERSATIONS,
+    )
+
 def warmup_ai_models() -> None:
     """Khởi tạo sẵn các model AI khi server start."""
-    print("WARMUP: Initializing models on CPU to save VRAM for Ollama...")
+    logger.info("WARMUP: Initializing models on CPU to save VRAM for Ollama...")
     get_embedder()
     if settings.USE_RERANKER:
         get_reranker()
-    get_ollama_client()
\ No newline at end of file
+    get_ollama_client()
+    get_language_detector()
\ No newline at end of file
@@ -14,26 +14,26 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
 @router.post("/register", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED)
-def register(
+async def register(
     user_data: schemas.UserCreate,
     db: Session = Depends(get_db)
 ):
     """
     Đăng ký user mới
     """
-    user = user_service.create_user(db, user_data)
+    user = await user_service.create_user(db, user_data)
     return user
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     """
     Đăng nhập - trả về access token
     """
-    user = user_service.authenticate_user(
+    user = await user_service.authenticate_user(
         db,
         email=form_data.username,  # OAuth2 form dùng 'username'
         password=form_data.password
@@ -49,14 +49,14 @@ def login(
 
 
 @router.post("/login/json", response_model=schemas.Token)
-def login_json(
+async def login_json(
     login_data: schemas.UserLogin,
     db: Session = Depends(get_db)
 ):
     """
     Đăng nhập với JSON body (alternative endpoint)
     """
-    user = user_service.authenticate_user(
+    user = await user_service.authenticate_user(
         db,
         email=login_data.email,
         password=login_data.password
@@ -2,24 +2,129 @@
 Chat API - Endpoint chat với RAG
 """
 import asyncio
+import json
 import anyio
+from functools import partial
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from typing import AsyncGenerator
+from typing import AsyncGenerator, AsyncIterator, Iterator, List, Optional
 
 from .. import schemas, models
-from ..db import get_db
+from ..db import get_db, get_async_sessionmaker
 from ..deps import get_current_user, get_user_conversation
-from ..services import conversation_service, rag_service
+from ..config import settings
+from ..metrics import server_timing_header
+from ..services import conversation_service, memory_service, rag_service
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 
+def _sse_event(payload: dict) -> str:
+    """Encode một SSE event dạng JSON (newline trong token không phá vỡ framing SSE)."""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def _verify_conversation(db: Session, conversation_id: int, user_id: int) -> None:
+    """Kiểm tra quyền sở hữu conversation mà không chặn event loop."""
+    if settings.DB_ASYNC_ENABLED:
+        async with get_async_sessionmaker()() as async_db:
+            await conversation_service.get_conversation_by_id_async(
+                async_db, conversation_id, user_id
+            )
+    else:
+        await anyio.to_thread.run_sync(
+            conversation_service.get_conversation_by_id, db, conversation_id, user_id
+        )
+
+
+async def _save_message(db: Session, conversation_id: int, role: str, content: str) -> None:
+    """
+    Lưu message mà không chặn event loop: AsyncSession khi DB_ASYNC_ENABLED,
+    ngược lại chạy session đồng bộ trong worker thread.
+    """
+    if settings.DB_ASYNC_ENABLED:
+        async with get_async_sessionmaker()() as async_db:
+            await conversation_service.save_message_async(
+                async_db, conversation_id, role=role, content=content
+            )
+    else:
+        await anyio.to_thread.run_sync(
+            partial(
+                conversation_service.save_message,
+                db,
+                conversation_id,
+                role=role,
+                content=content
+            )
+        )
+
+
+_END = object()
+
+
+async def _batched_tokens(
+    iterator: Iterator[str],
+    flush_interval: float,
+    flush_max_bytes: int
+) -> AsyncIterator[List[str]]:
+    """
+    Đọc token từ generator đồng bộ (mỗi lần next() chạy trong worker thread) và gộp
+    thành từng batch: batch được flush khi đủ flush_max_bytes hoặc khi hết cửa sổ
+    flush_interval (giây) tính từ token đầu tiên của batch - kể cả khi token tiếp theo
+    chưa tới (chờ token với timeout = thời gian còn lại của cửa sổ).
+    Token đầu tiên của cả stream luôn được gửi ngay.
+    """
+    loop = asyncio.get_running_loop()
+    pending: Optional[asyncio.Future] = None
+    parts: List[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    first_batch = True
+    
+    try:
+        while True:
+            if pending is None:
+                pending = loop.run_in_executor(None, next, iterator, _END)
+            
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # Hết cửa sổ: flush phần đã gom, token đang chờ thuộc về batch sau
+                yield parts
+                parts, size, deadline = [], 0, None
+                continue
+            
+            chunk = pending.result()
+            pending = None
+            if chunk is _END:
+                break
+            if not chunk:
+                continue
+            
+            parts.append(chunk)
+            size += len(chunk.encode("utf-8"))
+            if first_batch or size >= flush_max_bytes:
+                first_batch = False
+                yield parts
+                parts, size, deadline = [], 0, None
+            elif deadline is None:
+                deadline = loop.time() + flush_interval
+        
+        if parts:
+            yield parts
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
 @router.post("", response_model=schemas.ChatResponse)
 def chat(
     chat_request: schemas.ChatRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -42,12 +147,14 @@ def chat(
     )
     
     try:
-        # Get answer từ RAG
+        # Get answer từ RAG (stats nhận thời gian từng stage cho header Server-Timing)
+        stats = {}
         answer = rag_service.answer_question_for_conversation(
             db,
             chat_request.conversation_id,
             chat_request.question,
-            streaming=False
+            streaming=False,
+            stats=stats
         )
         
         # Lưu assistant message
@@ -58,6 +165,17 @@ def chat(
             content=answer
         )
         
+        # Cập nhật summary của conversation sau khi đã trả response
+        if settings.MEMORY_ENABLED:
+            background_tasks.add_task(
+                memory_service.update_conversation_summary_task,
+                chat_request.conversation_id
+            )
+        
+        server_timing = server_timing_header(stats)
+        if server_timing:
+            response.headers["Server-Timing"] = server_timing
+        
         return schemas.ChatResponse(
             answer=answer,
             conversation_id=chat_request.conversation_id,
@@ -90,16 +208,19 @@ async def chat_stream(
 ):
     """
     Chat với AI - streaming response (SSE)
+    
+    DB I/O chạy trên event loop (kiểm tra quyền sở hữu, lưu message) dùng AsyncSession
+    khi DB_ASYNC_ENABLED. Các truy vấn còn lại vẫn dùng session đồng bộ nhưng đều chạy
+    trong worker thread, không chặn event loop:
+    - get_current_user: dependency đồng bộ, FastAPI chạy trong threadpool
+    - load conversation/vector meta và memory (rag_service.answer_question_for_conversation):
+      chạy cùng retrieve trong anyio.to_thread
     """
     # Verify conversation ownership
-    conversation = conversation_service.get_conversation_by_id(
-        db,
-        chat_request.conversation_id,
-        current_user.id
-    )
+    await _verify_conversation(db, chat_request.conversation_id, current_user.id)
     
     # Lưu user message
-    user_message = conversation_service.save_message(
+    await _save_message(
         db,
         chat_request.conversation_id,
         role="user",
@@ -111,52 +232,72 @@ async def chat_stream(
         Generator để stream response. 
         
         Chuyển phần sinh chuỗi đồng bộ sang thread để tránh block event loop
-        (quan trọng khi chạy trong container) và gửi SSE từng chunk.
+        (quan trọng khi chạy trong container) và gộp token thành từng SSE event
+        theo cửa sổ thời gian / số byte (token đầu tiên luôn được gửi ngay).
+        Header đã gửi trước body nên thời gian từng stage (dạng Server-Timing)
+        được gửi trong event {"server_timing": ...} ngay trước [DONE].
         """
         try:
-            full_answer = ""
+            answer_parts: List[str] = []
+            flush_interval = settings.STREAM_FLUSH_INTERVAL_MS / 1000
+            stats = {}
             
-            # Get streaming answer từ RAG
-            answer_generator = rag_service.answer_question_for_conversation(
-                db,
-                chat_request.conversation_id,
-                chat_request.question,
-                streaming=True
+            # Get streaming answer từ RAG (retrieve/rerank chạy trong thread)
+            answer_generator = await anyio.to_thread.run_sync(
+                partial(
+                    rag_service.answer_question_for_conversation,
+                    db,
+                    chat_request.conversation_id,
+                    chat_request.question,
+                    streaming=True,
+                    stats=stats
+                )
             )
             
             # Đọc generator đồng bộ trong thread để không chặn event loop
-            while True:
-                chunk = await anyio.to_thread.run_sync(next, answer_generator, None)
-                if chunk is None:
-                    break
-                
-                full_answer += chunk
-                # Format SSE
-                yield f"data: {chunk}\n\n"
-                
-                await asyncio.sleep(0)  # Nhả control cho event loop
+            async for parts in _batched_tokens(
+                answer_generator,
+                flush_interval,
+                settings.STREAM_FLUSH_MAX_BYTES
+            ):
+                answer_parts.extend(parts)
+                yield _sse_event({"content": "".join(parts)})
             
             # Lưu complete answer
-            conversation_service.save_message(
+            await _save_message(
                 db,
                 chat_request.conversation_id,
                 role="assistant",
-                content=full_answer
+                content="".join(answer_parts)
             )
             
+            server_timing = server_timing_header(stats)
+            if server_timing:
+                yield _sse_event({"server_timing": server_timing})
+            
             # Send done signal
             yield "data: [DONE]\n\n"
             
         except Exception as e:
-            error_message = f"Error: {str(e)}"
-            yield f"data: {error_message}\n\n"
+            yield _sse_event({"error": f"Error: {str(e)}"})
             yield "data: [DONE]\n\n"
     
+    # Cập nhật summary của conversation sau khi stream kết thúc
+    summary_task = (
+        BackgroundTask(
+            memory_service.update_conversation_summary_task,
+            chat_request.conversation_id
+        )
+        if settings.MEMORY_ENABLED
+        else None
+    )
+    
     return StreamingResponse(
         generate_response(),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
             "X-Accel-Buffering": "no"
-        }
+        },
+        background=summary_task
     )
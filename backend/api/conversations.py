@@ -1,9 +1,9 @@
 """
 Conversations API - Quản lý conversations
 """
-from fastapi import APIRouter, Depends, status, BackgroundTasks
+from fastapi import APIRouter, Depends, Query, status, BackgroundTasks
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
 
 from .. import schemas, models
 from ..db import get_db
@@ -77,17 +77,17 @@ def get_conversation(
     """
     Lấy thông tin chi tiết conversation
     """
-    conversation = conversation_service.get_conversation_by_id(
+    conversation = conversation_service.get_conversation_detail(
         db,
         conversation_id,
         current_user.id
     )
     
-    # Lấy documents
+    # Lấy documents (đã eager load)
     documents = [conv_doc.document for conv_doc in conversation.documents]
     
-    # Lấy vector store status cấp môn học
-    vector_meta = rag_service.get_subject_vector_meta(db, conversation.subject_id)
+    # Lấy vector store status cấp môn học (subject + meta đã eager load)
+    vector_meta = rag_service.get_vector_meta_for_subject(db, conversation.subject)
     vector_status = vector_meta.status if vector_meta else None
     
     return {
@@ -97,21 +97,31 @@ def get_conversation(
     }
 
 
-@router.get("/conversations/{conversation_id}/messages", response_model=List[schemas.MessageRead])
+@router.get("/conversations/{conversation_id}/messages", response_model=schemas.MessagePage)
 def get_conversation_messages(
     conversation_id: int,
+    limit: Optional[int] = Query(None, ge=1, description="Số message mỗi trang"),
+    cursor: Optional[str] = Query(None, description="next_cursor của trang trước"),
+    order: Literal["asc", "desc"] = Query("asc", description="desc = mới nhất trước"),
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Lấy tất cả messages trong conversation
+    Lấy messages trong conversation theo trang (cursor/keyset pagination)
     """
-    messages = conversation_service.get_conversation_messages(
+    messages, next_cursor = conversation_service.get_conversation_messages(
         db,
         conversation_id,
-        current_user.id
+        current_user.id,
+        limit=limit,
+        cursor=cursor,
+        latest_first=(order == "desc")
     )
-    return messages
+    return {
+        "items": messages,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    }
 
 
 @router.delete("/conversations/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
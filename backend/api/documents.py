@@ -8,7 +8,7 @@ from typing import List
 from .. import schemas, models
 from ..db import get_db
 from ..deps import get_current_user, get_user_subject
-from ..services import document_service, rag_service
+from ..services import document_service, page_cache, rag_service
 
 router = APIRouter(tags=["Documents"])
 
@@ -35,7 +35,7 @@ def list_documents(
     response_model=schemas.DocumentRead,
     status_code=status.HTTP_201_CREATED
 )
-def upload_document(
+async def upload_document(
     subject_id: int,
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
@@ -43,16 +43,76 @@ def upload_document(
     db: Session = Depends(get_db)
 ):
     """
-    Upload tài liệu PDF
+    Upload tài liệu PDF (stream theo chunk, giới hạn MAX_UPLOAD_SIZE_MB)
     """
-    document = document_service.save_uploaded_file(
+    document = await document_service.save_uploaded_file(
         db,
         subject_id,
         current_user.id,
         file
     )
     
-    # Trigger rebuild vector store ở cấp môn học sau khi upload
+    # Trích text từng trang một lần (page cache), rồi rebuild vector store ở cấp môn học
+    background_tasks.add_task(
+        page_cache.ensure_pages,
+        document.content_hash,
+        document.filepath
+    )
+    background_tasks.add_task(
+        rag_service.build_vector_store_for_subject,
+        db,
+        subject_id
+    )
+    return document
+
+
+@router.get("/documents/hash/{content_hash}", response_model=schemas.DocumentHashCheck)
+def check_document_hash(
+    content_hash: str,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Kiểm tra nội dung (SHA-256) đã có trên server chưa, để client bỏ qua upload.
+    
+    Lưu ý: "exists" tính trên upload của mọi user, nên tiết lộ việc có ai đó đã upload
+    file có hash này (chỉ hỏi được khi đã biết hash, tức thường là đã có file).
+    Nội dung thì không lộ: from-hash cần proof = sha256(challenge + nội dung file).
+    """
+    content_hash = document_service.validate_content_hash(content_hash)
+    return {
+        "content_hash": content_hash,
+        "exists": document_service.find_blob(db, content_hash) is not None,
+        "challenge": document_service.possession_challenge(current_user.id, content_hash),
+    }
+
+
+@router.post(
+    "/subjects/{subject_id}/documents/from-hash",
+    response_model=schemas.DocumentRead,
+    status_code=status.HTTP_201_CREATED
+)
+def add_document_from_hash(
+    subject_id: int,
+    payload: schemas.DocumentFromHash,
+    background_tasks: BackgroundTasks,
+    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Thêm tài liệu đã có trên server (theo SHA-256) vào môn học, không cần upload lại.
+    payload.proof = sha256(challenge từ GET /documents/hash/{hash} + nội dung file)
+    """
+    document = document_service.create_document_from_hash(
+        db,
+        subject_id,
+        current_user.id,
+        payload.content_hash,
+        payload.filename,
+        payload.proof
+    )
+    
+    # Chunks/embeddings của nội dung này được dùng lại từ content cache
     background_tasks.add_task(
         rag_service.build_vector_store_for_subject,
         db,
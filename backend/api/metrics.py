@@ -0,0 +1,65 @@
+"""
+Metrics API - Prometheus scrape endpoint
+"""
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from ..ai_deps import get_language_detector
+from ..services.password_hasher import password_hasher
+from ..services.user_cache import user_cache
+from ..services.vector_store_cache import vector_store_cache
+
+router = APIRouter(tags=["Metrics"])
+
+
+class _CacheQueueCollector:
+    """Đọc thống kê cache / hàng đợi tại thời điểm scrape (không cần cập nhật gauge thủ công)."""
+
+    def collect(self):
+        users = user_cache.stats()
+        yield GaugeMetricFamily("user_cache_size", "Cached authenticated users", value=users["size"])
+        hits = CounterMetricFamily("user_cache_lookups", "User cache lookups", labels=["result"])
+        hits.add_metric(["hit"], users["hits"])
+        hits.add_metric(["miss"], users["misses"])
+        yield hits
+
+        stores = vector_store_cache.stats()
+        yield GaugeMetricFamily(
+            "vector_store_cache_size", "Retrievers held in the vector store cache", value=stores["size"]
+        )
+        yield GaugeMetricFamily(
+            "vector_store_cache_chunks", "Chunks loaded by cached retrievers", value=stores["chunks"]
+        )
+
+        if get_language_detector.cache_info().currsize:
+            info = get_language_detector().cache_info()
+            yield GaugeMetricFamily(
+                "language_cache_size", "Cached language detections", value=info.currsize
+            )
+            lookups = CounterMetricFamily(
+                "language_cache_lookups", "Language detection cache lookups", labels=["result"]
+            )
+            lookups.add_metric(["hit"], info.hits)
+            lookups.add_metric(["miss"], info.misses)
+            yield lookups
+
+        hasher = password_hasher.stats()
+        yield GaugeMetricFamily(
+            "password_hash_in_flight", "Password hash jobs running or queued", value=hasher["in_flight"]
+        )
+        yield GaugeMetricFamily(
+            "password_hash_queue_depth", "Password hash jobs waiting for a worker", value=hasher["queue_depth"]
+        )
+        yield CounterMetricFamily(
+            "password_hash_rejected", "Password hash jobs rejected (queue full)", value=hasher["rejected"]
+        )
+
+
+REGISTRY.register(_CacheQueueCollector())
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics (histogram từng stage RAG + gauge cache / hàng đợi)"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,14 +1,14 @@
 """
 Subjects API - CRUD môn học
 """
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, BackgroundTasks, Depends, status
 from sqlalchemy.orm import Session
 from typing import List
 
 from .. import schemas, models
 from ..db import get_db
 from ..deps import get_current_user, get_user_subject
-from ..services import subject_service
+from ..services import rag_service, subject_service
 
 router = APIRouter(prefix="/subjects", tags=["Subjects"])
 
@@ -52,18 +52,29 @@ def get_subject(
 def update_subject(
     subject_id: int,
     subject_data: schemas.SubjectUpdate,
+    background_tasks: BackgroundTasks,
     current_user: models.User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Cập nhật môn học
+    Cập nhật môn học (đổi tham số chunk / loại index -> rebuild vector store, không parse lại PDF)
     """
+    old_params = rag_service.get_build_params(
+        subject_service.get_subject_by_id(db, subject_id, current_user.id)
+    )
     subject = subject_service.update_subject(
         db,
         subject_id,
         current_user.id,
         subject_data
     )
+    
+    if rag_service.get_build_params(subject) != old_params and subject.documents:
+        background_tasks.add_task(
+            rag_service.build_vector_store_for_subject,
+            db,
+            subject_id
+        )
     return subject
 
 
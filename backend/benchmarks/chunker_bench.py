@@ -0,0 +1,192 @@
+"""
+Chunker benchmark + equivalence check
+-------------------------------------
+So sánh data_loader.chunk_documents với chunker="langchain" (RecursiveCharacterTextSplitter)
+và chunker="native" (RecursiveTextSplitter):
+
+- Tốc độ: chunks/sec và MB/s trên trang tổng hợp (nhiều kích thước trang, để thấy chi phí
+  text.find() của add_start_index tăng theo độ dài trang) hoặc trên các file PDF truyền vào.
+- Tương đương: text và metadata (page, chunk_id, content_length) của từng chunk phải giống
+  hệt nhau. start_index được kiểm tra riêng: offset hợp lệ khi text[start:start+len] == chunk
+  (LangChain có thể trỏ sai khi đoạn text lặp lại; native luôn đúng).
+
+Thoát với mã lỗi 1 nếu có chunk khác nhau -> dùng được trong CI.
+
+Chạy từ thư mục gốc project:
+    python -m backend.benchmarks.chunker_bench
+    python -m backend.benchmarks.chunker_bench --pdfs backend/uploads/blobs --length-unit tokens --chunk-size 256 --overlap 32
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Cho phép chạy trực tiếp file (python backend/benchmarks/chunker_bench.py)
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.append(str(project_root))
+
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.rag_pipeline.data_loader import chunk_documents, iter_document
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+CHUNKERS = ["langchain", "native"]
+COMPARED_METADATA = ("page", "chunk_id", "content_length", "source", "filename")
+
+WORDS = (
+    "Apache Airflow là công cụ điều phối quy trình dữ liệu Scheduler kích hoạt các task "
+    "theo lịch và DAG mô tả phụ thuộc giữa chúng Executor quyết định task chạy ở đâu "
+    "LocalExecutor chạy trên cùng máy còn CeleryExecutor phân tán qua message broker"
+).split()
+
+
+def make_pages(num_pages: int, page_chars: int, rng: np.random.Generator) -> List[Document]:
+    """Trang tổng hợp: câu ngẫu nhiên, xuống dòng và đoạn văn, có câu lặp lại (như header/footer)."""
+    pages = []
+    boilerplate = "Trường Đại học - Tài liệu môn học. "
+    for page in range(num_pages):
+        parts: List[str] = [boilerplate]
+        size = len(boilerplate)
+        while size < page_chars:
+            sentence = " ".join(rng.choice(WORDS, size=int(rng.integers(5, 25)))) + ". "
+            if rng.random() < 0.1:
+                sentence += "\n\n" if rng.random() < 0.5 else "\n"
+            if rng.random() < 0.05:
+                sentence += boilerplate
+            parts.append(sentence)
+            size += len(sentence)
+        pages.append(Document(page_content="".join(parts)[:page_chars], metadata={"source": "synthetic.pdf", "page": page}))
+    return pages
+
+
+def time_chunker(docs: List[Document], chunker: str, args) -> Dict[str, Any]:
+    samples = []
+    chunks: List[Document] = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        chunks = chunk_documents(
+            docs, chunk_size=args.chunk_size, overlap=args.overlap,
+            chunker=chunker, length_unit=args.length_unit,
+        )
+        samples.append(time.perf_counter() - start)
+
+    best = min(samples)
+    chars = sum(len(doc.page_content) for doc in docs)
+    return {
+        "chunks": chunks,
+        "summary": {
+            "chunker": chunker,
+            "num_chunks": len(chunks),
+            "best_s": round(best, 4),
+            "median_s": round(float(np.median(samples)), 4),
+            "chunks_per_sec": round(len(chunks) / best, 1) if best else None,
+            "mb_per_sec": round(chars / best / 1e6, 2) if best else None,
+        },
+    }
+
+
+def compare(docs: List[Document], reference: List[Document], native: List[Document]) -> Dict[str, Any]:
+    pages = {doc.metadata.get("page"): doc.page_content for doc in docs}
+
+    def offset_ok(chunk: Document) -> bool:
+        text = pages.get(chunk.metadata.get("page"), "")
+        start = chunk.metadata.get("start_index")
+        return start is not None and start >= 0 and text[start:start + len(chunk.page_content)] == chunk.page_content
+
+    mismatches = []
+    for i, (a, b) in enumerate(zip(reference, native)):
+        diff = [key for key in COMPARED_METADATA if a.metadata.get(key) != b.metadata.get(key)]
+        if a.page_content != b.page_content:
+            diff.insert(0, "text")
+        if diff:
+            mismatches.append({"chunk": i, "fields": diff})
+
+    return {
+        "equivalent": len(reference) == len(native) and not mismatches,
+        "count": [len(reference), len(native)],
+        "mismatches": mismatches[:20],
+        "start_index_differs": sum(
+            a.metadata.get("start_index") != b.metadata.get("start_index") for a, b in zip(reference, native)
+        ),
+        "invalid_offsets": {
+            "langchain": sum(not offset_ok(c) for c in reference),
+            "native": sum(not offset_ok(c) for c in native),
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark + kiểm tra tương đương của chunker native và LangChain")
+    parser.add_argument("--pdfs", nargs="*", default=None, help="File PDF / thư mục thay cho trang tổng hợp")
+    parser.add_argument("--page-chars", default="3000,30000,300000", help="Kích thước trang tổng hợp (ký tự)")
+    parser.add_argument("--pages", type=int, default=20, help="Số trang tổng hợp mỗi kích thước")
+    parser.add_argument("--chunk-size", type=int, default=800)
+    parser.add_argument("--overlap", type=int, default=120)
+    parser.add_argument("--length-unit", choices=["chars", "tokens"], default="chars")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định benchmarks/results/chunker_<timestamp>.json)")
+    args = parser.parse_args()
+
+    datasets: Dict[str, List[Document]] = {}
+    if args.pdfs:
+        for path in map(Path, args.pdfs):
+            for file in (sorted(path.rglob("*.pdf")) if path.is_dir() else [path]):
+                datasets[str(file)] = list(iter_document(str(file)))
+    else:
+        rng = np.random.default_rng(args.seed)
+        for page_chars in (int(c) for c in args.page_chars.split(",") if c):
+            pages = args.pages if page_chars <= 30000 else max(1, args.pages // 10)
+            datasets[f"synthetic_{page_chars}"] = make_pages(pages, page_chars, rng)
+
+    results = []
+    all_equivalent = True
+    for name, docs in datasets.items():
+        runs = {chunker: time_chunker(docs, chunker, args) for chunker in CHUNKERS}
+        equivalence = compare(docs, runs["langchain"]["chunks"], runs["native"]["chunks"])
+        all_equivalent &= equivalence["equivalent"]
+        speedup = runs["langchain"]["summary"]["best_s"] / max(runs["native"]["summary"]["best_s"], 1e-9)
+        results.append({
+            "dataset": name,
+            "pages": len(docs),
+            "chars": sum(len(d.page_content) for d in docs),
+            "runs": [run["summary"] for run in runs.values()],
+            "speedup": round(speedup, 2),
+            "equivalence": equivalence,
+        })
+        status = "✅" if equivalence["equivalent"] else "❌"
+        print(
+            f"{status} {name:<24} chunks={len(runs['native']['chunks']):>6} "
+            f"langchain {runs['langchain']['summary']['chunks_per_sec']:>10} chunks/s  "
+            f"native {runs['native']['summary']['chunks_per_sec']:>10} chunks/s  "
+            f"x{speedup:.1f}  invalid offsets {equivalence['invalid_offsets']}"
+        )
+
+    timestamp = datetime.now(timezone.utc)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"chunker_{timestamp:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "benchmark": "chunker",
+        "timestamp": timestamp.isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "params": vars(args),
+        "results": results,
+    }
+    output.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n💾 Results written to {output}")
+
+    if not all_equivalent:
+        print("❌ Native chunker khác với LangChain splitter")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
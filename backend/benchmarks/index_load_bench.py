@@ -0,0 +1,281 @@
+"""
+Index cold-load benchmark
+-------------------------
+Đo thời gian từ lúc mở vector store của một môn học "lạnh" (chưa có trong page cache)
+tới khi trả lời được câu hỏi đầu tiên - đúng những gì request đầu tiên phải chờ:
+
+- construct: Retriever(...) = đọc manifest (documents) + FAISS index (đọc toàn bộ hoặc mmap)
+- first query: Retriever.retrieve đầu tiên = FAISS + BM25 (nạp lười: mmap index BM25 đã lưu
+  lúc build, hoặc build lại từ documents với store không có BM25) + fusion
+
+Với mỗi tổ hợp (loại index, số chunk) và mỗi biến thể BM25 (persisted / rebuilt):
+- Build store trên vector + văn bản tổng hợp, lưu ra thư mục tạm.
+- Bỏ mọi file của store khỏi page cache (posix_fadvise DONTNEED, chỉ Linux) rồi đo theo
+  hai chế độ đọc index (read / mmap): construct, query đầu, p50 các query sau, RSS tăng thêm.
+- Lặp lại khi file đã nằm trong page cache (warm) để so sánh.
+
+Kết quả top-k của hai chế độ phải giống nhau (cột "same_results").
+Lưu ý: bản FAISS chưa có IO_FLAG_MMAP_IFC chỉ mmap được index IVF; cột "mmapped"
+cho biết index có thật sự được map hay không.
+
+Chạy từ thư mục gốc project:
+    python -m backend.benchmarks.index_load_bench
+    python -m backend.benchmarks.index_load_bench --sizes 10000,100000,1000000 --index-types flat,sq8
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+# Cho phép chạy trực tiếp file (python backend/benchmarks/index_load_bench.py)
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.append(str(project_root))
+
+import faiss
+import numpy as np
+
+from backend.benchmarks.retrieval_bench import (
+    make_documents,
+    make_query_vectors,
+    make_text_queries,
+    make_texts,
+    make_vectors,
+    rss_bytes,
+)
+from backend.rag_pipeline.bm25_index import BM25Index
+from backend.rag_pipeline.retriever import Retriever
+from backend.rag_pipeline.text_analyzer import get_analyzer
+from backend.rag_pipeline.vector_store import INDEX_TYPES, VectorStore, mmap_io_flag, store_files
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+MODES = {"read": False, "mmap": True}
+BM25_VARIANTS = ("persisted", "rebuilt")
+ANALYZER = "standard"
+
+
+class BenchEmbedder:
+    """Thay Embedder thật: trả lần lượt các query vector sinh sẵn (không nạp model)."""
+
+    def __init__(self, dim: int, queries: np.ndarray):
+        self.model = SimpleNamespace(get_sentence_embedding_dimension=lambda: dim)
+        self.queries = queries
+        self.calls = 0
+
+    def encode(self, texts, prefix=None) -> np.ndarray:
+        query = self.queries[self.calls % len(self.queries)]
+        self.calls += 1
+        return query.reshape(1, -1)
+
+
+def drop_page_cache(paths: List[str]) -> bool:
+    """Bỏ các file khỏi page cache của OS (False nếu nền tảng không hỗ trợ)."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        if os.path.isdir(path):
+            drop_page_cache([os.path.join(path, entry) for entry in os.listdir(path)])
+            continue
+        if not os.path.exists(path):
+            continue
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def measure(
+    store_path: str,
+    meta_path: str,
+    embedder: BenchEmbedder,
+    text_queries: List[str],
+    k: int,
+    mmap: bool,
+    cold: bool
+) -> Dict[str, Any]:
+    gc.collect()
+    embedder.calls = 0
+    dropped = drop_page_cache(store_files(store_path, meta_path)) if cold else False
+
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    retriever = Retriever(
+        store_path, meta_path, embedder=embedder, analyzer=get_analyzer(ANALYZER), mmap=mmap
+    )
+    construct_s = time.perf_counter() - start
+    rss_after_construct = rss_bytes()
+
+    def query(text: str, stats: Dict[str, Any]):
+        docs, _ = retriever.retrieve(
+            text, k_semantic=k, k_keyword=k, semantic_threshold=0.0,
+            bm25_threshold=0.0, bm25_min_top1=0.0, stats=stats,
+        )
+        return docs
+
+    first_stats: Dict[str, Any] = {}
+    start = time.perf_counter()
+    first = query(text_queries[0], first_stats)
+    first_query_s = time.perf_counter() - start
+
+    samples = []
+    for text in text_queries[1:]:
+        start = time.perf_counter()
+        query(text, {})
+        samples.append(time.perf_counter() - start)
+
+    result = {
+        "cold": cold,
+        "page_cache_dropped": dropped,
+        "mmapped": retriever.store.mmapped,
+        "construct_ms": round(construct_s * 1000, 3),
+        "first_query_ms": round(first_query_s * 1000, 3),
+        "first_query_stages_ms": {
+            name: round(first_stats[name], 3) for name in ("faiss_ms", "bm25_ms", "fusion_ms") if name in first_stats
+        },
+        "ready_ms": round((construct_s + first_query_s) * 1000, 3),
+        "query_p50_ms": round(float(np.median(samples)) * 1000, 4) if samples else None,
+        "rss_after_construct_mb": round((rss_after_construct - rss_before) / 1e6, 2),
+        "rss_after_queries_mb": round((rss_bytes() - rss_before) / 1e6, 2),
+        "top_ids": [doc["metadata"]["chunk_unique_id"] for doc in first],
+    }
+    del retriever
+    return result
+
+
+def build_store(
+    workdir: str, index_type: str, n: int, variant: str,
+    vectors: np.ndarray, documents: List[Dict[str, Any]], dim: int
+) -> Tuple[str, str, str]:
+    """Lưu store (variant "persisted": kèm BM25 như build hiện tại, "rebuilt": như store cũ)."""
+    store_path = os.path.join(workdir, f"{index_type}_{n}_{variant}.index")
+    meta_path = os.path.join(workdir, f"{index_type}_{n}_{variant}.json")
+    store = VectorStore(dim=dim, path=store_path, meta_path=meta_path, index_type=index_type)
+    store.add(vectors, documents)
+    if variant == "persisted":
+        analyzer = get_analyzer(ANALYZER)
+        bm25 = BM25Index(analyzer.analyze(doc["text"]) for doc in documents)
+        store.save(bm25=bm25, bm25_analyzer=repr(analyzer))
+    else:
+        store.save()
+    return store_path, meta_path, store.index_type
+
+
+def bench(index_type: str, n: int, args, rng: np.random.Generator, workdir: str) -> List[Dict[str, Any]]:
+    vectors = make_vectors(n, args.dim, rng)
+    texts = make_texts(n, rng)
+    documents = make_documents(n, texts)
+    embedder = BenchEmbedder(args.dim, make_query_vectors(vectors, args.queries, rng))
+    text_queries = [text for _, text in make_text_queries(texts, args.queries, rng)]
+
+    results = []
+    for variant in args.bm25.split(","):
+        store_path, meta_path, actual_type = build_store(
+            workdir, index_type, n, variant, vectors, documents, args.dim
+        )
+        gc.collect()
+
+        runs = {}
+        for mode, mmap in MODES.items():
+            runs[mode] = {
+                "cold": measure(store_path, meta_path, embedder, text_queries, args.k, mmap, cold=True),
+                "warm": measure(store_path, meta_path, embedder, text_queries, args.k, mmap, cold=False),
+            }
+
+        same = runs["read"]["cold"].pop("top_ids") == runs["mmap"]["cold"].pop("top_ids")
+        for mode_runs in runs.values():
+            mode_runs["warm"].pop("top_ids")
+
+        file_bytes = 0
+        for path in store_files(store_path, meta_path):
+            if os.path.isdir(path):
+                file_bytes += sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            else:
+                file_bytes += os.path.getsize(path)
+        results.append({
+            "index_type": actual_type,
+            "vectors": n,
+            "bm25": variant,
+            "file_mb": round(file_bytes / 1e6, 2),
+            "same_results": same,
+            "runs": runs,
+        })
+    return results
+
+
+def _print_row(result: Dict[str, Any]) -> None:
+    read, mmap = result["runs"]["read"]["cold"], result["runs"]["mmap"]["cold"]
+    status = "✅" if result["same_results"] else "❌"
+    print(
+        f"{status} {result['index_type']:<5} n={result['vectors']:>8} bm25={result['bm25']:<9} "
+        f"file={result['file_mb']:>8} MB  "
+        f"read: construct {read['construct_ms']:>9} ms + 1st query {read['first_query_ms']:>8} ms, "
+        f"rss +{read['rss_after_construct_mb']} MB  "
+        f"mmap{'' if mmap['mmapped'] else ' (fallback)'}: construct {mmap['construct_ms']:>9} ms "
+        f"+ 1st query {mmap['first_query_ms']:>8} ms, rss +{mmap['rss_after_construct_mb']} MB"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Thời gian tới câu trả lời đầu tiên của môn học lạnh: đọc toàn bộ vs mmap")
+    parser.add_argument("--sizes", default="10000,100000", help="Số chunk, cách nhau bởi dấu phẩy")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES), help=f"Trong {', '.join(INDEX_TYPES)}")
+    parser.add_argument("--bm25", default=",".join(BM25_VARIANTS), help="persisted (BM25 lưu lúc build) và/hoặc rebuilt (store cũ)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Thư mục lưu index tạm (mặc định tempdir, nên cùng ổ đĩa với INDEX_DIR)")
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định benchmarks/results/index_load_<timestamp>.json)")
+    args = parser.parse_args()
+
+    unknown = set(args.bm25.split(",")) - set(BM25_VARIANTS)
+    if unknown:
+        parser.error(f"Unknown BM25 variants: {', '.join(sorted(unknown))}")
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        for index_type in (t for t in args.index_types.split(",") if t):
+            for n in (int(s) for s in args.sizes.split(",") if s):
+                for result in bench(index_type, n, args, rng, workdir):
+                    results.append(result)
+                    _print_row(result)
+
+    timestamp = datetime.now(timezone.utc)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"index_load_{timestamp:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "benchmark": "index_load",
+        "timestamp": timestamp.isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "faiss": getattr(faiss, "__version__", None),
+            "mmap_flag": mmap_io_flag(),
+        },
+        "params": vars(args),
+        "results": results,
+    }
+    output.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n💾 Results written to {output}")
+
+    if not all(r["same_results"] for r in results):
+        print("❌ Kết quả tìm kiếm khác nhau giữa read và mmap")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+Load test cho /api/v1/chat và /api/v1/chat/stream
+-------------------------------------------------
+Mô phỏng nhiều người dùng đồng thời:
+
+1. Setup: đăng ký / đăng nhập N user, mỗi user có một subject "Load test" với một
+   PDF mẫu (tạo sẵn trong script), chờ vector store sẵn sàng rồi tạo conversation.
+2. Load: `--concurrency` worker gửi câu hỏi liên tục trong `--duration` giây, trộn
+   streaming / không streaming theo `--stream-ratio`.
+3. Báo cáo: TTFT (streaming: tới SSE event đầu tiên), latency tổng, throughput
+   (request/s, ký tự/s), tỷ lệ lỗi theo loại - p50/p90/p95/p99. Ghi JSON nếu có --output.
+   Lỗi sinh câu trả lời của backend là HTTP 500 (/chat) hoặc SSE event {"error": ...}
+   (/chat/stream); request lỗi không được tính vào TTFT / latency.
+   Với --mock-url, số lỗi mock Ollama đã inject (/mock/stats) được báo cáo cạnh số lỗi
+   harness quan sát được để kiểm tra --error-rate đi hết đường tới client.
+
+Không cần GPU: chạy kèm mock Ollama.
+    python -m backend.benchmarks.mock_ollama --port 11500 --ttft-ms 300 --tokens-per-sec 40
+    OLLAMA_BASE_URL=http://localhost:11500 LLM_MODEL=mock uvicorn backend.main:app --port 8000
+    python -m backend.benchmarks.load_test --base-url http://localhost:8000 --users 10 --concurrency 20 --duration 60 \
+        --mock-url http://localhost:11500
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+QUESTIONS = [
+    "Apache Airflow là gì?",
+    "Scheduler trong Airflow có chức năng gì?",
+    "So sánh LocalExecutor và CeleryExecutor.",
+    "DAG là gì và vì sao phải acyclic?",
+    "What is the role of the metadata database?",
+    "How does the CeleryExecutor distribute tasks?",
+]
+
+PDF_LINES = [
+    "Apache Airflow is an open source tool to author, schedule and monitor workflows.",
+    "The Scheduler triggers tasks and submits them to the Executor.",
+    "LocalExecutor runs tasks on the same machine as the Scheduler.",
+    "CeleryExecutor distributes tasks to many workers through a message broker.",
+    "A DAG is a directed acyclic graph describing task dependencies.",
+    "The metadata database stores the state of DAG runs and task instances.",
+]
+
+
+def make_pdf(lines: List[str]) -> bytes:
+    """Tạo một PDF 1 trang tối giản (font Helvetica chuẩn) - đủ để PyPDFLoader trích text."""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    stream = "BT /F1 11 Tf 50 780 Td 14 TL " + " ".join(f"({escape(l)}) '" for l in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+        "/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+    ]
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+# ---------------------------------------------------------------------------
+# Setup
+# ---------------------------------------------------------------------------
+
+@dataclass
+class VirtualUser:
+    email: str
+    token: str
+    conversation_ids: List[int] = field(default_factory=list)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+def _check(resp: httpx.Response, action: str) -> Dict[str, Any]:
+    if resp.status_code >= 400:
+        raise RuntimeError(f"{action} failed: HTTP {resp.status_code} {resp.text[:200]}")
+    return resp.json() if resp.content else {}
+
+
+async def setup_user(
+    client: httpx.AsyncClient,
+    api: str,
+    index: int,
+    password: str,
+    conversations: int,
+    ready_timeout: float
+) -> VirtualUser:
+    email = f"loadtest{index}@example.com"
+    resp = await client.post(f"{api}/auth/register", json={"email": email, "password": password, "full_name": f"Load {index}"})
+    if resp.status_code not in (201, 400):  # 400 = đã đăng ký từ lần chạy trước
+        _check(resp, "register")
+
+    token = (_check(
+        await client.post(f"{api}/auth/login/json", json={"email": email, "password": password}), "login"
+    ))["access_token"]
+    user = VirtualUser(email=email, token=token)
+
+    subjects = _check(await client.get(f"{api}/subjects", headers=user.headers), "list subjects")
+    subject = next((s for s in subjects if s["name"] == "Load test"), None)
+    if subject is None:
+        subject = _check(
+            await client.post(f"{api}/subjects", json={"name": "Load test"}, headers=user.headers), "create subject"
+        )
+
+    documents = _check(
+        await client.get(f"{api}/subjects/{subject['id']}/documents", headers=user.headers), "list documents"
+    )
+    if not documents:
+        documents = [_check(
+            await client.post(
+                f"{api}/subjects/{subject['id']}/documents",
+                files={"file": ("loadtest.pdf", make_pdf(PDF_LINES), "application/pdf")},
+                headers=user.headers,
+            ),
+            "upload document",
+        )]
+
+    for n in range(conversations):
+        conversation = _check(
+            await client.post(
+                f"{api}/subjects/{subject['id']}/conversations",
+                json={"subject_id": subject["id"], "title": f"Load {n}", "document_ids": [d["id"] for d in documents]},
+                headers=user.headers,
+            ),
+            "create conversation",
+        )
+        user.conversation_ids.append(conversation["id"])
+
+    # Chờ vector store của subject sẵn sàng
+    deadline = time.monotonic() + ready_timeout
+    while True:
+        status = _check(
+            await client.get(f"{api}/conversations/{user.conversation_ids[0]}/vector-status", headers=user.headers),
+            "vector status",
+        )
+        if status.get("status") == "ready":
+            break
+        if status.get("status") == "error" or time.monotonic() > deadline:
+            raise RuntimeError(f"Vector store for {email} not ready: {status}")
+        await asyncio.sleep(1)
+
+    return user
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Sample:
+    mode: str  # "stream" | "chat"
+    ok: bool
+    total_s: float
+    ttft_s: Optional[float] = None
+    chars: int = 0
+    error: Optional[str] = None
+
+
+async def stream_once(client: httpx.AsyncClient, api: str, user: VirtualUser, conversation_id: int) -> Sample:
+    started = time.perf_counter()
+    ttft = None
+    chars = 0
+    try:
+        async with client.stream(
+            "POST",
+            f"{api}/chat/stream",
+            json={"conversation_id": conversation_id, "question": random.choice(QUESTIONS)},
+            headers=user.headers,
+        ) as resp:
+            if resp.status_code != 200:
+                await resp.aread()
+                return Sample("stream", False, time.perf_counter() - started, error=f"http_{resp.status_code}")
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    return Sample("stream", False, time.perf_counter() - started, ttft, chars, error="sse_error")
+                if "content" not in event:
+                    continue  # server_timing
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                chars += len(event["content"])
+    except httpx.HTTPError as e:
+        return Sample("stream", False, time.perf_counter() - started, ttft, chars, error=type(e).__name__)
+    return Sample("stream", True, time.perf_counter() - started, ttft, chars)
+
+
+async def chat_once(client: httpx.AsyncClient, api: str, user: VirtualUser, conversation_id: int) -> Sample:
+    started = time.perf_counter()
+    try:
+        resp = await client.post(
+            f"{api}/chat",
+            json={"conversation_id": conversation_id, "question": random.choice(QUESTIONS)},
+            headers=user.headers,
+        )
+    except httpx.HTTPError as e:
+        return Sample("chat", False, time.perf_counter() - started, error=type(e).__name__)
+    total = time.perf_counter() - started
+    if resp.status_code != 200:
+        return Sample("chat", False, total, error=f"http_{resp.status_code}")
+
+    # TTFT phía server (nếu backend gửi Server-Timing)
+    ttft = None
+    for part in resp.headers.get("server-timing", "").split(","):
+        name, _, dur = part.strip().partition(";dur=")
+        if name == "ttft" and dur:
+            ttft = float(dur) / 1000
+    return Sample("chat", True, total, ttft, len(resp.json().get("answer", "")))
+
+
+async def worker(
+    client: httpx.AsyncClient,
+    api: str,
+    users: List[VirtualUser],
+    stream_ratio: float,
+    deadline: float,
+    samples: List[Sample]
+) -> None:
+    while time.monotonic() < deadline:
+        user = random.choice(users)
+        conversation_id = random.choice(user.conversation_ids)
+        if random.random() < stream_ratio:
+            samples.append(await stream_once(client, api, user, conversation_id))
+        else:
+            samples.append(await chat_once(client, api, user, conversation_id))
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ms = np.asarray(values) * 1000
+    return {f"p{p}_ms": round(float(np.percentile(ms, p)), 1) for p in (50, 90, 95, 99)}
+
+
+def build_report(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"elapsed_s": round(elapsed, 2), "modes": {}}
+    for mode in ("stream", "chat"):
+        subset = [s for s in samples if s.mode == mode]
+        if not subset:
+            continue
+        ok = [s for s in subset if s.ok]
+        report["modes"][mode] = {
+            "requests": len(subset),
+            "errors": len(subset) - len(ok),
+            "error_rate": round((len(subset) - len(ok)) / len(subset), 4),
+            "error_types": dict(Counter(s.error for s in subset if not s.ok)),
+            "requests_per_s": round(len(ok) / elapsed, 2),
+            "chars_per_s": round(sum(s.chars for s in ok) / elapsed, 1),
+            "ttft": _percentiles([s.ttft_s for s in ok if s.ttft_s is not None]),
+            "latency": _percentiles([s.total_s for s in ok]),
+        }
+    return report
+
+
+async def mock_stats(client: httpx.AsyncClient, mock_url: Optional[str]) -> Optional[Dict[str, int]]:
+    """Bộ đếm request / lỗi đã inject của mock Ollama (None nếu không dùng mock)."""
+    if not mock_url:
+        return None
+    resp = await client.get(mock_url.rstrip("/") + "/mock/stats")
+    resp.raise_for_status()
+    return resp.json()
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n📊 Load test results ({report['elapsed_s']}s)")
+    for mode, r in report["modes"].items():
+        print(f"\n  [{mode}] {r['requests']} requests, {r['requests_per_s']} req/s, "
+              f"{r['chars_per_s']} chars/s, errors {r['errors']} ({r['error_rate']:.1%}) {r['error_types'] or ''}")
+        for name in ("ttft", "latency"):
+            if r[name]:
+                values = "  ".join(f"{k[:-3]}={v:.0f}ms" for k, v in r[name].items())
+                print(f"    {name:<8} {values}")
+    mock = report.get("mock")
+    if mock:
+        observed = sum(r["errors"] for r in report["modes"].values())
+        print(f"\n  [mock] {mock['requests']} LLM calls, {mock['injected_errors']} injected errors "
+              f"(observed by harness: {observed}; summary calls can also hit injected errors)")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    api = args.base_url.rstrip("/") + args.api_prefix
+    limits = httpx.Limits(max_connections=args.concurrency + args.users, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        print(f"👥 Setting up {args.users} users...")
+        users = await asyncio.gather(*[
+            setup_user(client, api, i, args.password, args.conversations_per_user, args.ready_timeout)
+            for i in range(args.users)
+        ])
+
+        print(f"🚀 Running {args.concurrency} workers for {args.duration}s (stream ratio {args.stream_ratio})...")
+        samples: List[Sample] = []
+        mock_before = await mock_stats(client, args.mock_url)
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*[
+            worker(client, api, users, args.stream_ratio, deadline, samples)
+            for _ in range(args.concurrency)
+        ])
+        report = build_report(samples, time.monotonic() - started)
+
+        mock_after = await mock_stats(client, args.mock_url)
+        if mock_before is not None and mock_after is not None:
+            report["mock"] = {
+                "requests": mock_after["requests"] - mock_before["requests"],
+                "injected_errors": mock_after["errors"] - mock_before["errors"],
+            }
+        return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test cho chat API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--api-prefix", default="/api/v1")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--conversations-per-user", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60.0, help="Thời gian chạy load (giây)")
+    parser.add_argument("--stream-ratio", type=float, default=0.8, help="Tỷ lệ request dùng /chat/stream (0-1)")
+    parser.add_argument("--password", default="loadtest-password")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="Thời gian chờ vector store sẵn sàng")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--mock-url", default=None, help="URL mock Ollama để đối chiếu số lỗi đã inject")
+    parser.add_argument("--output", default=None, help="Ghi báo cáo JSON")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.output:
+        report["params"] = vars(args)
+        report["timestamp"] = datetime.now(timezone.utc).isoformat()
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\n💾 Report written to {args.output}")
+
+    # Mã lỗi 1 nếu không có request nào thành công
+    succeeded = sum(r["requests"] - r["errors"] for r in report["modes"].values())
+    return 0 if succeeded else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Mock Ollama server
+------------------
+Server HTTP tương thích Ollama (/api/chat, /api/generate, streaming và không streaming)
+để load-test backend mà không cần GPU. Độ trễ token đầu (TTFT), tốc độ sinh token,
+tỷ lệ lỗi, thời gian nạp model lần đầu (cold start) và số request xử lý song song
+(giống OLLAMA_NUM_PARALLEL) đều cấu hình được.
+
+Chạy từ thư mục gốc project:
+    python -m backend.benchmarks.mock_ollama --port 11500 --ttft-ms 300 --tokens-per-sec 40 --error-rate 0.01
+
+Rồi chạy backend với OLLAMA_BASE_URL=http://localhost:11500 (xem benchmarks/load_test.py).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Từ dùng để ghép câu trả lời giả (mỗi từ ~ một token)
+WORDS = (
+    "Apache Airflow là công cụ điều phối quy trình dữ liệu , Scheduler kích hoạt các task "
+    "theo lịch và DAG mô tả phụ thuộc giữa chúng . Executor quyết định task chạy ở đâu ; "
+    "LocalExecutor chạy trên cùng máy còn CeleryExecutor phân tán qua message broker ."
+).split()
+
+
+@dataclass
+class MockConfig:
+    ttft_ms: float = 300.0
+    tokens_per_sec: float = 40.0
+    answer_tokens: int = 200
+    error_rate: float = 0.0
+    jitter: float = 0.1  # dao động ngẫu nhiên (tỷ lệ) cho TTFT và thời gian mỗi token
+    max_parallel: int = 0  # 0 = không giới hạn
+    load_ms: float = 0.0  # thời gian nạp model, chỉ request đầu tiên (model chưa nạp) phải chờ
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _jittered(value: float, jitter: float) -> float:
+    return max(0.0, value * (1 + random.uniform(-jitter, jitter)))
+
+
+def _prompt_tokens(payload: Dict[str, Any]) -> int:
+    """Ước lượng số token prompt (~4 ký tự / token)."""
+    if "messages" in payload:
+        text = "".join(m.get("content", "") for m in payload.get("messages") or [])
+    else:
+        text = (payload.get("system") or "") + (payload.get("prompt") or "")
+    return max(1, len(text) // 4)
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock Ollama")
+    slots: Optional[asyncio.Semaphore] = (
+        asyncio.Semaphore(config.max_parallel) if config.max_parallel > 0 else None
+    )
+    counters = {"requests": 0, "errors": 0, "in_flight": 0}
+    model_state = {"loaded": config.load_ms <= 0}
+    load_lock = asyncio.Lock()
+
+    async def _ensure_loaded() -> float:
+        """Giống Ollama: request gặp model chưa nạp chờ nạp xong; trả về load_duration (ms)."""
+        if model_state["loaded"]:
+            return 0.0
+        async with load_lock:
+            if model_state["loaded"]:
+                return 0.0
+            await asyncio.sleep(config.load_ms / 1000)
+            model_state["loaded"] = True
+            return config.load_ms
+
+    async def _tokens(payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Sinh token theo TTFT / tokens_per_sec đã cấu hình."""
+        options = payload.get("options") or {}
+        num_predict = options.get("num_predict")
+        count = config.answer_tokens if not num_predict or num_predict < 0 else min(num_predict, config.answer_tokens)
+
+        await asyncio.sleep(_jittered(config.ttft_ms, config.jitter) / 1000)
+        interval = 1 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+        for i in range(count):
+            if i:
+                await asyncio.sleep(_jittered(interval, config.jitter))
+            yield WORDS[i % len(WORDS)] + " "
+
+    def _final_stats(
+        payload: Dict[str, Any], started: float, eval_started: float, first_token: float,
+        eval_count: int, load_ms: float
+    ) -> Dict[str, Any]:
+        end = time.perf_counter()
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((end - started) * 1e9),
+            "load_duration": int(load_ms * 1e6),
+            "prompt_eval_count": _prompt_tokens(payload),
+            "prompt_eval_duration": int((first_token - eval_started) * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int((end - first_token) * 1e9),
+        }
+
+    def _chunk(kind: str, model: str, content: str) -> Dict[str, Any]:
+        if kind == "chat":
+            return {"model": model, "created_at": _now(), "message": {"role": "assistant", "content": content}, "done": False}
+        return {"model": model, "created_at": _now(), "response": content, "done": False}
+
+    async def _handle(request: Request, kind: str):
+        payload = await request.json()
+        model = payload.get("model", "mock")
+        counters["requests"] += 1
+
+        if random.random() < config.error_rate:
+            counters["errors"] += 1
+            return JSONResponse({"error": "mock ollama: injected failure"}, status_code=500)
+
+        async def run() -> AsyncIterator[Dict[str, Any]]:
+            if slots is not None:
+                await slots.acquire()
+            counters["in_flight"] += 1
+            try:
+                started = time.perf_counter()
+                load_ms = await _ensure_loaded()
+                eval_started = time.perf_counter()
+                first_token = None
+                eval_count = 0
+                async for token in _tokens(payload):
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    eval_count += 1
+                    yield _chunk(kind, model, token)
+                final = _chunk(kind, model, "")
+                final.update(_final_stats(
+                    payload, started, eval_started, first_token or time.perf_counter(), eval_count, load_ms
+                ))
+                yield final
+            finally:
+                counters["in_flight"] -= 1
+                if slots is not None:
+                    slots.release()
+
+        # Ollama mặc định stream=True
+        if payload.get("stream", True):
+            async def ndjson() -> AsyncIterator[str]:
+                async for chunk in run():
+                    yield json.dumps(chunk, ensure_ascii=False) + "\n"
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        content: List[str] = []
+        final: Dict[str, Any] = {}
+        async for chunk in run():
+            if chunk.get("done"):
+                final = chunk
+            else:
+                content.append(chunk["message"]["content"] if kind == "chat" else chunk["response"])
+        if kind == "chat":
+            final["message"] = {"role": "assistant", "content": "".join(content)}
+        else:
+            final["response"] = "".join(content)
+        return JSONResponse(final)
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        return await _handle(request, "chat")
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        return await _handle(request, "generate")
+
+    @app.get("/api/tags")
+    def tags():
+        return {"models": [{"name": "mock:latest", "model": "mock:latest", "modified_at": _now(), "size": 0}]}
+
+    @app.get("/api/version")
+    def version():
+        return {"version": "0.0.0-mock"}
+
+    @app.get("/mock/stats")
+    def stats():
+        return counters
+
+    return app
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Mock Ollama server cho load test")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Độ trễ trước token đầu tiên")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0)
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Số token mỗi câu trả lời (bị giới hạn bởi options.num_predict)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Tỷ lệ request trả HTTP 500 (0-1)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--max-parallel", type=int, default=0, help="Giống OLLAMA_NUM_PARALLEL (0 = không giới hạn)")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Thời gian nạp model (cold start), chỉ request đầu tiên phải chờ")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    config = MockConfig(
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate,
+        jitter=args.jitter,
+        max_parallel=args.max_parallel,
+        load_ms=args.load_ms,
+    )
+    print(f"🧪 Mock Ollama on http://{args.host}:{args.port} ({config})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
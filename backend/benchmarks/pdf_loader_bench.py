@@ -0,0 +1,173 @@
+"""
+PDF loader benchmark
+--------------------
+So sánh các loader trong data_loader.PDF_LOADERS trên một tập file PDF thật:
+
+- Tốc độ: pages/sec (và thời gian tới trang đầu tiên - lợi ích của lazy iteration)
+  với từng số worker trong --workers.
+- Parity: text trích ra so với loader tham chiếu (--reference, mặc định pypdf) theo
+  từng trang: tỷ lệ ký tự giống nhau (difflib) và Jaccard trên tập từ, sau khi chuẩn
+  hóa khoảng trắng. Chỉ so khi hai loader ra cùng số trang.
+
+Chạy từ thư mục gốc project:
+    python -m backend.benchmarks.pdf_loader_bench backend/uploads/blobs --loaders pypdf,pypdfium2,pymupdf --workers 1,4
+"""
+import argparse
+import difflib
+import json
+import platform
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Cho phép chạy trực tiếp file (python backend/benchmarks/pdf_loader_bench.py)
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.append(str(project_root))
+
+import numpy as np
+
+from backend.rag_pipeline.data_loader import PDF_BACKENDS, PDF_LOADERS, iter_pdf_pages
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+WHITESPACE_RE = re.compile(r"\s+")
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def collect_pdfs(paths: List[str]) -> List[Path]:
+    files: List[Path] = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.rglob("*.pdf")) if path.is_dir() else [path])
+    return files
+
+
+def run_loader(files: List[Path], loader: str, workers: int) -> Dict[str, Any]:
+    """Trích text toàn bộ file, đo thời gian tổng và thời gian tới trang đầu của từng file."""
+    pages: Dict[str, List[str]] = {}
+    first_page_ms: List[float] = []
+    start = time.perf_counter()
+    for file in files:
+        file_start = time.perf_counter()
+        texts = []
+        for doc in iter_pdf_pages(str(file), loader=loader, workers=workers):
+            if not texts:
+                first_page_ms.append((time.perf_counter() - file_start) * 1000)
+            texts.append(doc.page_content)
+        pages[str(file)] = texts
+    elapsed = time.perf_counter() - start
+
+    total_pages = sum(len(t) for t in pages.values())
+    return {
+        "pages": pages,
+        "summary": {
+            "loader": loader,
+            "workers": workers,
+            "files": len(files),
+            "pages": total_pages,
+            "seconds": round(elapsed, 3),
+            "pages_per_sec": round(total_pages / elapsed, 2) if elapsed else None,
+            "first_page_p50_ms": round(float(np.percentile(first_page_ms, 50)), 2) if first_page_ms else None,
+            "chars": sum(len(text) for texts in pages.values() for text in texts),
+        },
+    }
+
+
+def _normalize(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def parity(reference: Dict[str, List[str]], candidate: Dict[str, List[str]]) -> Dict[str, Any]:
+    """So text từng trang giữa loader tham chiếu và loader cần so."""
+    char_ratios, jaccards = [], []
+    page_count_mismatch = []
+    for file, ref_pages in reference.items():
+        cand_pages = candidate.get(file, [])
+        if len(cand_pages) != len(ref_pages):
+            page_count_mismatch.append(file)
+            continue
+        for ref, cand in zip(ref_pages, cand_pages):
+            ref, cand = _normalize(ref), _normalize(cand)
+            if not ref and not cand:
+                char_ratios.append(1.0)
+                jaccards.append(1.0)
+                continue
+            char_ratios.append(difflib.SequenceMatcher(None, ref, cand, autojunk=False).ratio())
+            ref_words, cand_words = set(WORD_RE.findall(ref.lower())), set(WORD_RE.findall(cand.lower()))
+            union = ref_words | cand_words
+            jaccards.append(len(ref_words & cand_words) / len(union) if union else 1.0)
+
+    return {
+        "pages_compared": len(char_ratios),
+        "char_ratio_mean": round(float(np.mean(char_ratios)), 4) if char_ratios else None,
+        "char_ratio_p5": round(float(np.percentile(char_ratios, 5)), 4) if char_ratios else None,
+        "word_jaccard_mean": round(float(np.mean(jaccards)), 4) if jaccards else None,
+        "page_count_mismatch": page_count_mismatch,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark tốc độ và độ khớp text của các PDF loader")
+    parser.add_argument("paths", nargs="+", help="File PDF hoặc thư mục (tìm đệ quy *.pdf)")
+    parser.add_argument("--loaders", default=",".join(PDF_LOADERS))
+    parser.add_argument("--workers", default="1", help="Danh sách số worker, ví dụ 1,2,4")
+    parser.add_argument("--reference", default="pypdf", help="Loader tham chiếu cho parity")
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định benchmarks/results/pdf_loaders_<timestamp>.json)")
+    args = parser.parse_args()
+
+    files = collect_pdfs(args.paths)
+    if not files:
+        print("❌ Không tìm thấy file PDF nào")
+        return 1
+
+    loaders = [name for name in args.loaders.split(",") if name]
+    unknown = set(loaders + [args.reference]) - set(PDF_LOADERS)
+    if unknown:
+        parser.error(f"Unknown loaders: {', '.join(sorted(unknown))}")
+    for name in list(loaders):
+        if name in PDF_BACKENDS and PDF_BACKENDS[name][0] is None:
+            print(f"⏭️  {name} chưa được cài, bỏ qua")
+            loaders.remove(name)
+    worker_counts = [int(w) for w in args.workers.split(",") if w]
+
+    print(f"📄 {len(files)} PDF files")
+    reference = run_loader(files, args.reference, 1)
+    results = []
+    for loader in loaders:
+        for workers in worker_counts:
+            if loader == "pypdf" and workers > 1:
+                continue  # PyPDFLoader không hỗ trợ trích song song
+            if workers > 1:
+                # Khởi động process pool dùng chung (spawn) ngoài phần đo, như app đang chạy
+                run_loader(files[:1], loader, workers)
+            run = reference if (loader, workers) == (args.reference, 1) else run_loader(files, loader, workers)
+            summary = dict(run["summary"])
+            summary["parity"] = parity(reference["pages"], run["pages"])
+            results.append(summary)
+            print(
+                f"   {loader:<10} workers={workers:<2} {summary['pages_per_sec']:>9} pages/s "
+                f"first page p50 {summary['first_page_p50_ms']} ms, "
+                f"char ratio {summary['parity']['char_ratio_mean']}, "
+                f"word jaccard {summary['parity']['word_jaccard_mean']}"
+            )
+
+    timestamp = datetime.now(timezone.utc)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"pdf_loaders_{timestamp:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "benchmark": "pdf_loaders",
+        "timestamp": timestamp.isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "params": vars(args) | {"files": [str(f) for f in files]},
+        "results": results,
+    }
+    output.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\n💾 Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+"""
+Query-count regression harness
+------------------------------
+Chạy các endpoint đọc chính trên SQLite in-memory với dữ liệu mẫu và đếm số câu SQL
+mỗi endpoint phát ra (gồm cả lazy load khi serialize response). Thoát với mã lỗi 1 nếu
+endpoint nào vượt QUERY_BUDGETS -> dùng được trong CI để bắt lại N+1 query.
+
+Chạy từ thư mục gốc project:
+    python -m backend.benchmarks.query_counts
+"""
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+# Cho phép chạy trực tiếp file (python backend/benchmarks/query_counts.py)
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.append(str(project_root))
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import models, schemas
+from backend.db import Base, count_queries
+from backend.deps import create_access_token, get_current_user
+from backend.api import conversations, documents, subjects, auth
+
+# Số query tối đa cho phép mỗi endpoint (đã gồm 1 query lấy current user)
+QUERY_BUDGETS: Dict[str, int] = {
+    "GET /auth/me": 1,
+    "GET /subjects": 2,
+    "GET /subjects/{id}/documents": 3,
+    "GET /subjects/{id}/conversations": 3,
+    "GET /conversations/{id}": 3,
+    "GET /conversations/{id}/messages": 3,
+    "GET /conversations/{id}/vector-status": 3,
+}
+
+NUM_DOCUMENTS = 20
+NUM_MESSAGES = 60
+
+
+def _create_engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _seed(SessionFactory) -> Dict[str, int]:
+    """Tạo user, subject (kèm vector meta), documents, conversation và messages mẫu."""
+    db = SessionFactory()
+    try:
+        user = models.User(email="bench@example.com", hashed_password="x", full_name="Bench")
+        db.add(user)
+        db.flush()
+
+        subject = models.Subject(user_id=user.id, name="Bench subject")
+        db.add(subject)
+        db.flush()
+
+        db.add(models.VectorStoreMeta(
+            subject_id=subject.id,
+            index_path="bench.index",
+            meta_path="bench.json",
+            status="empty",
+        ))
+
+        docs = [
+            models.Document(subject_id=subject.id, filename=f"doc_{i}.pdf", filepath=f"doc_{i}.pdf")
+            for i in range(NUM_DOCUMENTS)
+        ]
+        db.add_all(docs)
+        db.flush()
+
+        conversation = models.Conversation(user_id=user.id, subject_id=subject.id, title="Bench")
+        db.add(conversation)
+        db.flush()
+
+        db.add_all(
+            models.ConversationDocument(conversation_id=conversation.id, document_id=doc.id)
+            for doc in docs
+        )
+
+        start = datetime.utcnow()
+        db.add_all(
+            models.Message(
+                conversation_id=conversation.id,
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"message {i}",
+                created_at=start + timedelta(seconds=i),
+            )
+            for i in range(NUM_MESSAGES)
+        )
+        db.commit()
+
+        return {"user_id": user.id, "subject_id": subject.id, "conversation_id": conversation.id}
+    finally:
+        db.close()
+
+
+def _endpoints(ids: Dict[str, int]) -> Dict[str, tuple]:
+    """Map tên endpoint -> (hàm gọi route(current_user, db), response_model)."""
+    subject_id = ids["subject_id"]
+    conversation_id = ids["conversation_id"]
+
+    return {
+        "GET /auth/me": (
+            lambda user, db: auth.get_current_user_profile(current_user=user),
+            schemas.UserRead,
+        ),
+        "GET /subjects": (
+            lambda user, db: subjects.list_subjects(current_user=user, db=db),
+            List[schemas.SubjectRead],
+        ),
+        "GET /subjects/{id}/documents": (
+            lambda user, db: documents.list_documents(subject_id, current_user=user, db=db),
+            List[schemas.DocumentRead],
+        ),
+        "GET /subjects/{id}/conversations": (
+            lambda user, db: conversations.list_conversations(subject_id, current_user=user, db=db),
+            List[schemas.ConversationRead],
+        ),
+        "GET /conversations/{id}": (
+            lambda user, db: conversations.get_conversation(conversation_id, current_user=user, db=db),
+            schemas.ConversationDetail,
+        ),
+        "GET /conversations/{id}/messages": (
+            lambda user, db: conversations.get_conversation_messages(
+                conversation_id, limit=None, cursor=None, order="asc", current_user=user, db=db
+            ),
+            schemas.MessagePage,
+        ),
+        "GET /conversations/{id}/vector-status": (
+            lambda user, db: conversations.get_vector_store_status(conversation_id, current_user=user, db=db),
+            schemas.VectorStoreStatus,
+        ),
+    }
+
+
+def measure(
+    SessionFactory,
+    engine,
+    token: str,
+    call: Callable[[Any, Any], Any],
+    response_model: Any,
+) -> Dict[str, Any]:
+    """Đếm query của một request: dependency get_current_user + route + serialize response."""
+    db = SessionFactory()
+    try:
+        with count_queries(engine) as counter:
+            user = get_current_user(token=token, db=db)
+            result = call(user, db)
+            TypeAdapter(response_model).validate_python(result, from_attributes=True)
+        return counter
+    finally:
+        db.close()
+
+
+def main() -> int:
+    engine = _create_engine()
+    SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    ids = _seed(SessionFactory)
+    token = create_access_token({"sub": ids["user_id"]})
+
+    print(f"{'Endpoint':<42} {'Queries':>8} {'Budget':>8}")
+    print("-" * 60)
+
+    failures = []
+    for name, (call, response_model) in _endpoints(ids).items():
+        counter = measure(SessionFactory, engine, token, call, response_model)
+        budget = QUERY_BUDGETS[name]
+        flag = "" if counter["count"] <= budget else "  ❌"
+        print(f"{name:<42} {counter['count']:>8} {budget:>8}{flag}")
+        if counter["count"] > budget:
+            failures.append((name, counter["statements"]))
+
+    for name, statements in failures:
+        print(f"\n❌ {name} vượt budget. Các query:")
+        for statement in statements:
+            print(f"   - {' '.join(statement.split())[:160]}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
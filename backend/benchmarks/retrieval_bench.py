@@ -0,0 +1,426 @@
+"""
+Retrieval micro-benchmark
+-------------------------
+Đo khả năng scale của từng thành phần retrieval trên corpus tổng hợp:
+
+- FAISS (VectorStore.search / các loại index): vector ngẫu nhiên đã chuẩn hóa,
+  query = chunk ngẫu nhiên + nhiễu. recall@k so với kết quả chính xác (IndexFlatIP).
+- BM25: BM25Index (token id + posting list, như Retriever) so với rank_bm25.BM25Okapi
+  làm baseline. Văn bản sinh theo phân phối Zipf, query = vài từ lấy từ một chunk.
+  recall@k = chunk gốc nằm trong top-k.
+- Fusion (Retriever.fuse_results) trên kết quả semantic + BM25 thực tế của corpus.
+
+Mỗi tổ hợp (thành phần, loại index, số chunk) ghi p50/p95/p99 latency, thời gian build,
+bộ nhớ và recall@k. Kết quả được ghi ra JSON (kèm commit, version thư viện) để so sánh
+giữa các lần chạy.
+
+Chạy từ thư mục gốc project:
+    python -m backend.benchmarks.retrieval_bench
+    python -m backend.benchmarks.retrieval_bench --sizes 1000,10000,100000,1000000 --bm25-max-size 100000
+"""
+import argparse
+import gc
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Cho phép chạy trực tiếp file (python backend/benchmarks/retrieval_bench.py)
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.append(str(project_root))
+
+import faiss
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from backend.rag_pipeline.bm25_index import BM25Index
+from backend.rag_pipeline.text_analyzer import get_analyzer
+from backend.rag_pipeline.vector_store import VectorStore
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Cài đặt BM25: bm25index (production) và rank_bm25 làm baseline
+BM25_BUILDERS: Dict[str, Callable[[List[List[str]]], Any]] = {
+    "bm25index": BM25Index,
+    "bm25okapi": BM25Okapi,
+}
+
+# Từ vựng tổng hợp cho BM25 (mỗi token là "w<rank>", rank nhỏ = từ phổ biến)
+VOCAB_SIZE = 50_000
+ZIPF_EXPONENT = 1.1
+CHUNK_TOKENS = 120  # ~800 ký tự như chunk_size mặc định
+QUERY_TOKENS = 6
+QUERY_NOISE = 0.05  # độ lệch của query vector so với chunk gốc
+
+
+# ---------------------------------------------------------------------------
+# Corpus tổng hợp
+# ---------------------------------------------------------------------------
+
+def make_vectors(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Vector ngẫu nhiên đã chuẩn hóa L2 (giống output của Embedder với normalize)."""
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_query_vectors(
+    corpus: np.ndarray, num_queries: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Query = chunk ngẫu nhiên + nhiễu Gauss, chuẩn hóa lại."""
+    targets = rng.integers(0, len(corpus), size=num_queries)
+    queries = corpus[targets] + QUERY_NOISE * rng.standard_normal(
+        (num_queries, corpus.shape[1]), dtype=np.float32
+    )
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries.astype(np.float32)
+
+
+def make_texts(n: int, rng: np.random.Generator) -> List[str]:
+    """Văn bản theo phân phối Zipf trên VOCAB_SIZE từ."""
+    ranks = np.arange(1, VOCAB_SIZE + 1, dtype=np.float64)
+    probs = ranks ** -ZIPF_EXPONENT
+    probs /= probs.sum()
+    vocab = np.array([f"w{i}" for i in range(VOCAB_SIZE)], dtype=object)
+
+    texts: List[str] = []
+    batch = 10_000
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+        token_ids = rng.choice(VOCAB_SIZE, size=(size, CHUNK_TOKENS), p=probs)
+        texts.extend(" ".join(row) for row in vocab[token_ids])
+    return texts
+
+
+def make_text_queries(
+    texts: List[str], num_queries: int, rng: np.random.Generator
+) -> List[Tuple[int, str]]:
+    """Query = QUERY_TOKENS từ lấy ngẫu nhiên từ một chunk (trả kèm index chunk gốc)."""
+    queries = []
+    for target in rng.integers(0, len(texts), size=num_queries):
+        tokens = texts[target].split(" ")
+        picked = rng.choice(len(tokens), size=min(QUERY_TOKENS, len(tokens)), replace=False)
+        queries.append((int(target), " ".join(tokens[i] for i in picked)))
+    return queries
+
+
+def make_documents(n: int, texts: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Documents cùng schema với chunks.json."""
+    return [
+        {
+            "text": texts[i] if texts is not None else "",
+            "metadata": {"chunk_id": i, "chunk_unique_id": f"bench-{i}"},
+        }
+        for i in range(n)
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Index FAISS
+# ---------------------------------------------------------------------------
+
+def _build_flat(vectors: np.ndarray) -> faiss.Index:
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def _build_hnsw(vectors: np.ndarray) -> faiss.Index:
+    index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 80
+    index.add(vectors)
+    index.hnsw.efSearch = 64
+    return index
+
+
+def _build_ivf(vectors: np.ndarray) -> faiss.Index:
+    n, dim = vectors.shape
+    nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))  # FAISS cần ~39 điểm train / centroid
+    quantizer = faiss.IndexFlatIP(dim)
+    index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors[: min(n, nlist * 256)])
+    index.add(vectors)
+    index.nprobe = min(16, nlist)
+    return index
+
+
+INDEX_BUILDERS: Dict[str, Callable[[np.ndarray], faiss.Index]] = {
+    "flat": _build_flat,
+    "hnsw": _build_hnsw,
+    "ivf": _build_ivf,
+}
+
+
+# ---------------------------------------------------------------------------
+# Đo đạc
+# ---------------------------------------------------------------------------
+
+def rss_bytes() -> int:
+    """RSS hiện tại của process (Linux /proc), fallback về peak RSS."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def latency_summary(samples_s: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "mean_ms": round(float(ms.mean()), 4),
+        "qps": round(float(len(ms) / (ms.sum() / 1000)), 2) if ms.sum() else None,
+    }
+
+
+def time_each(func: Callable[[Any], Any], inputs, warmup: int = 5) -> Tuple[List[float], List[Any]]:
+    """Gọi func cho từng input (một query / lần như production), trả về latency và output."""
+    for item in inputs[:warmup]:
+        func(item)
+    samples, outputs = [], []
+    for item in inputs:
+        start = time.perf_counter()
+        outputs.append(func(item))
+        samples.append(time.perf_counter() - start)
+    return samples, outputs
+
+
+def ann_recall(found: np.ndarray, exact: np.ndarray) -> float:
+    """|top-k ANN ∩ top-k chính xác| / k, trung bình trên các query."""
+    k = exact.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(e)) for f, e in zip(found, exact))
+    return hits / (len(exact) * k)
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def bench_faiss(
+    n: int, dim: int, num_queries: int, k: int, index_types: List[str], rng: np.random.Generator
+) -> Tuple[List[Dict[str, Any]], List[List[Tuple[float, Dict[str, Any]]]]]:
+    """FAISS từng loại index + VectorStore.search (flat). Trả thêm kết quả semantic cho fusion."""
+    vectors = make_vectors(n, dim, rng)
+    queries = make_query_vectors(vectors, num_queries, rng)
+    results = []
+
+    exact_index = _build_flat(vectors)
+    _, exact = exact_index.search(queries, k)
+
+    for index_type in index_types:
+        gc.collect()
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        index = INDEX_BUILDERS[index_type](vectors)
+        build_s = time.perf_counter() - start
+        rss_delta = rss_bytes() - rss_before
+
+        samples, outputs = time_each(lambda q: index.search(q.reshape(1, -1), k)[1][0], queries)
+        results.append(
+            {
+                "component": "faiss",
+                "index_type": index_type,
+                "n_chunks": n,
+                "dim": dim,
+                "k": k,
+                "queries": num_queries,
+                "build_s": round(build_s, 4),
+                "index_bytes": int(faiss.serialize_index(index).nbytes),
+                "rss_delta_bytes": int(rss_delta),
+                "recall_at_k": round(ann_recall(np.array(outputs), exact), 4),
+                **latency_summary(samples),
+            }
+        )
+        del index
+
+    # VectorStore.search: flat index + tra cứu documents như production
+    store = VectorStore(dim, path="", meta_path="")
+    store.index = exact_index
+    store.documents = make_documents(n)
+    samples, semantic_results = time_each(lambda q: store.search(q.reshape(1, -1), k=k), queries)
+    results.append(
+        {
+            "component": "vector_store.search",
+            "index_type": "flat",
+            "n_chunks": n,
+            "dim": dim,
+            "k": k,
+            "queries": num_queries,
+            "recall_at_k": 1.0,
+            **latency_summary(samples),
+        }
+    )
+    return results, semantic_results
+
+
+def bench_bm25(
+    n: int, num_queries: int, k: int, rng: np.random.Generator, impls: List[str]
+) -> Tuple[List[Dict[str, Any]], List[List[Tuple[float, Dict[str, Any]]]]]:
+    """get_scores + top-k cho từng cài đặt BM25 (bm25index là đường đi trong Retriever.retrieve)."""
+    texts = make_texts(n, rng)
+    queries = make_text_queries(texts, num_queries, rng)
+    documents = make_documents(n, texts)
+    analyzer = get_analyzer("standard")
+
+    results: List[Dict[str, Any]] = []
+    keyword_results: List[List[Tuple[float, Dict[str, Any]]]] = []
+    for impl in impls:
+        gc.collect()
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        bm25 = BM25_BUILDERS[impl]([analyzer.analyze(text) for text in texts])
+        build_s = time.perf_counter() - start
+        rss_delta = rss_bytes() - rss_before
+
+        def search(query: Tuple[int, str]):
+            scores = bm25.get_scores(analyzer.analyze(query[1]))
+            top = np.argpartition(scores, -k)[-k:]
+            top = top[np.argsort(scores[top])[::-1]]
+            return [(scores[i], documents[i]) for i in top]
+
+        samples, found_all = time_each(search, queries)
+        hits = sum(
+            any(doc["metadata"]["chunk_id"] == target for _, doc in found)
+            for (target, _), found in zip(queries, found_all)
+        )
+        results.append({
+            "component": "bm25",
+            "index_type": impl,
+            "n_chunks": n,
+            "k": k,
+            "queries": num_queries,
+            "build_s": round(build_s, 4),
+            "rss_delta_bytes": int(rss_delta),
+            "index_bytes": bm25.nbytes() if isinstance(bm25, BM25Index) else None,
+            "recall_at_k": round(hits / num_queries, 4),
+            **latency_summary(samples),
+        })
+        keyword_results = found_all
+        del bm25
+    return results, keyword_results
+
+
+def bench_fusion(
+    n: int,
+    k: int,
+    semantic_results: List[List[Tuple[float, Dict[str, Any]]]],
+    keyword_results: List[List[Tuple[float, Dict[str, Any]]]],
+) -> Dict[str, Any]:
+    """Retriever.fuse_results trên cặp kết quả semantic / BM25 của từng query."""
+    # Import muộn: retriever kéo theo sentence_transformers (chỉ cần khi đo fusion)
+    from backend.rag_pipeline.retriever import Retriever
+
+    pairs = list(zip(semantic_results, keyword_results))
+    samples, _ = time_each(lambda pair: Retriever.fuse_results(*pair), pairs)
+    return {
+        "component": "fusion",
+        "index_type": "dedup",
+        "n_chunks": n,
+        "k": k,
+        "queries": len(pairs),
+        **latency_summary(samples),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'component':<20} {'index':<10} {'chunks':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'recall':>7} {'memory MB':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        memory = r.get("index_bytes") or r.get("rss_delta_bytes")
+        print(
+            f"{r['component']:<20} {r['index_type']:<10} {r['n_chunks']:>9} "
+            f"{r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} "
+            f"{r.get('recall_at_k', float('nan')):>7.3f} "
+            f"{(memory or 0) / 2**20:>10.1f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Retrieval micro-benchmark trên corpus tổng hợp")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Số chunk, phân tách bằng dấu phẩy (tối đa 1000000)")
+    parser.add_argument("--dim", type=int, default=768, help="Số chiều vector (multilingual-e5-base = 768)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--index-types", default=",".join(INDEX_BUILDERS), help="flat,hnsw,ivf")
+    parser.add_argument("--bm25-max-size", type=int, default=100_000, help="Bỏ qua BM25 với corpus lớn hơn")
+    parser.add_argument("--bm25-impls", default="bm25okapi,bm25index", help="bm25okapi,bm25index (cài đặt cuối dùng cho fusion)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định benchmarks/results/retrieval_<timestamp>.json)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    index_types = [t for t in args.index_types.split(",") if t]
+    unknown = set(index_types) - set(INDEX_BUILDERS)
+    if unknown:
+        parser.error(f"Unknown index types: {', '.join(sorted(unknown))}")
+    bm25_impls = [t for t in args.bm25_impls.split(",") if t]
+    unknown = set(bm25_impls) - set(BM25_BUILDERS)
+    if unknown:
+        parser.error(f"Unknown BM25 implementations: {', '.join(sorted(unknown))}")
+
+    faiss.omp_set_num_threads(1)  # production: mỗi request một query, không song song trong FAISS
+    rng = np.random.default_rng(args.seed)
+    results: List[Dict[str, Any]] = []
+
+    for n in sizes:
+        print(f"\n📦 {n} chunks")
+        faiss_results, semantic_results = bench_faiss(n, args.dim, args.queries, args.k, index_types, rng)
+        results.extend(faiss_results)
+
+        if n <= args.bm25_max_size:
+            bm25_results, keyword_results = bench_bm25(n, args.queries, args.k, rng, bm25_impls)
+            results.extend(bm25_results)
+            results.append(bench_fusion(n, args.k, semantic_results, keyword_results))
+        else:
+            print(f"   ⏭️  BM25 skipped (> --bm25-max-size {args.bm25_max_size})")
+        gc.collect()
+
+    print()
+    _print_table(results)
+
+    timestamp = datetime.now(timezone.utc)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"retrieval_{timestamp:%Y%m%dT%H%M%SZ}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "benchmark": "retrieval",
+        "timestamp": timestamp.isoformat(),
+        "git_commit": _git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "faiss": getattr(faiss, "__version__", None),
+        },
+        "params": vars(args) | {"vocab_size": VOCAB_SIZE, "zipf_exponent": ZIPF_EXPONENT, "chunk_tokens": CHUNK_TOKENS},
+        "results": results,
+    }
+    output.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    print(f"\n💾 Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,64 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
+
+def _is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _engine_kwargs(url: str) -> Dict[str, Any]:
+    """
+    Tham số engine theo loại database:
+    - SQLite: cho phép dùng chung connection giữa các thread, chờ khi DB đang bị lock
+    - PostgreSQL/khác: connection pool có giới hạn, pre-ping để bỏ connection chết
+    """
+    if _is_sqlite(url):
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+            },
+        }
+
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Tuning SQLite cho nhiều request đồng thời:
+    WAL cho phép đọc song song với ghi, synchronous=NORMAL đủ an toàn với WAL,
+    busy_timeout để chờ lock thay vì lỗi "database is locked" ngay lập tức.
+    """
+    cursor = dbapi_connection.cursor()
+    if settings.SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
 # Tạo engine
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
-    echo=False  # Set True để debug SQL queries
+    echo=settings.DB_ECHO,  # True để debug SQL queries
+    **_engine_kwargs(settings.DATABASE_URL)
 )
 
+if _is_sqlite(settings.DATABASE_URL):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -29,9 +78,85 @@ def get_db():
         db.close()
 
 
+def get_async_database_url() -> str:
+    """
+    URL cho async engine: DATABASE_ASYNC_URL nếu có, nếu không suy ra từ DATABASE_URL
+    (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg).
+    """
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+
+    url = make_url(settings.DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    elif backend == "postgresql":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
+@lru_cache(maxsize=1)
+def get_async_sessionmaker():
+    """
+    Async session factory (tạo khi cần, chỉ khi DB_ASYNC_ENABLED).
+    Cần driver async: aiosqlite (SQLite) hoặc asyncpg (PostgreSQL).
+    """
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    url = get_async_database_url()
+    kwargs = _engine_kwargs(url)
+    if _is_sqlite(url):
+        kwargs["connect_args"].pop("check_same_thread", None)
+
+    async_engine = create_async_engine(url, echo=settings.DB_ECHO, **kwargs)
+    if _is_sqlite(url):
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+    return async_sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+
+async def get_async_db():
+    """
+    Dependency để lấy async database session
+    Sử dụng với FastAPI Depends khi DB_ASYNC_ENABLED
+    """
+    async with get_async_sessionmaker()() as session:
+        yield session
+
+
 def init_db():
     """
-    Khởi tạo database - tạo tất cả các bảng
+    Khởi tạo database - tạo tất cả các bảng và chạy migrations
     Gọi trong main.py khi app startup
     """
+    from .migrations import run_migrations
+
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+
+@contextmanager
+def count_queries(bind=None):
+    """
+    Đếm số câu SQL được gửi xuống database trong block `with`.
+    Dùng để kiểm tra N+1 query (xem benchmarks/query_counts.py).
+
+    Usage:
+        with count_queries() as counter:
+            ...
+        print(counter["count"], counter["statements"])
+    """
+    target = bind if bind is not None else engine
+    counter = {"count": 0, "statements": []}
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["count"] += 1
+        counter["statements"].append(statement)
+
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(target, "before_cursor_execute", _before_cursor_execute)
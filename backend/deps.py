@@ -11,6 +11,7 @@ from typing import Optional
 from .db import get_db
 from .config import settings
 from . import models
+from .services.user_cache import user_cache
 
 # OAuth2 scheme để lấy token từ header
 oauth2_scheme = OAuth2PasswordBearer(
@@ -66,11 +67,16 @@ def get_current_user(
     except (JWTError, ValueError):
         raise credentials_exception
     
+    # Cache hit: gắn bản sao vào session của request mà không query DB
+    if (cached_user := user_cache.get(user_id)) is not None:
+        return db.merge(cached_user, load=False)
+
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if user is None:
         # token ok nhưng user không còn trong DB
         raise credentials_exception
 
+    user_cache.set(user)
     return user
 
 
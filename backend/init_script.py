@@ -3,7 +3,7 @@ Database Initialization Script
 Chạy file này để tạo database và test data
 """
 from sqlalchemy.orm import Session
-from .db import engine, Base, SessionLocal
+from .db import engine, Base, SessionLocal, init_db
 from .services.user_service import get_password_hash
 from . import models
 
@@ -13,7 +13,7 @@ def init_database():
     Tạo tất cả các bảng trong database
     """
     print("Creating database tables...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     print("✅ Database tables created successfully!")
 
 
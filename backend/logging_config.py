@@ -0,0 +1,145 @@
+"""
+Logging Config
+--------------
+Cấu hình logging dùng chung cho backend.
+
+- Mỗi module dùng logger riêng: logger = logging.getLogger(__name__)
+- Record được đẩy vào queue (QueueHandler) và ghi ra stdout bởi một thread
+  riêng (QueueListener) -> request không bị chặn bởi việc ghi log.
+- Mỗi record mang request_id của request hiện tại (middleware RequestIdMiddleware).
+- Chi tiết từng request (câu hỏi, điểm retrieval...) ở mức DEBUG; production
+  mặc định LOG_LEVEL=INFO nên các dòng này bị bỏ qua ngay tại logger.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from queue import SimpleQueue
+from typing import Optional
+import atexit
+import json
+import logging
+import logging.handlers
+import sys
+import uuid
+
+from .config import settings
+
+# request_id của request đang xử lý ("-" khi ngoài request, ví dụ startup/background)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Các thuộc tính chuẩn của LogRecord - phần còn lại (truyền qua extra=) được đưa vào JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Gắn request_id hiện tại vào record (chạy trong thread gọi log, trước khi vào queue)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format record thành một dòng JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    """
+    Cấu hình root logger: QueueHandler -> QueueListener -> StreamHandler(stdout).
+    Gọi nhiều lần an toàn (lần sau thay thế cấu hình cũ).
+    """
+    global _listener
+
+    level = (level or settings.LOG_LEVEL).upper()
+    fmt = fmt or settings.LOG_FORMAT
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+        )
+
+    queue: SimpleQueue = SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    # Log của thư viện bên thứ ba: chỉ từ WARNING trở lên
+    for noisy in ("httpx", "urllib3", "sentence_transformers", "faiss", "multipart"):
+        logging.getLogger(noisy).setLevel(max(logging.WARNING, root.level))
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware gán request_id cho mỗi request (lấy từ header X-Request-ID nếu có)
+    và trả lại trong response. Dùng ASGI thuần để context còn hiệu lực cả khi
+    StreamingResponse đang stream body.
+    """
+
+    header = b"x-request-id"
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == self.header:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append(
+                    (self.header, request_id.encode("latin-1"))
+                )
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
@@ -5,13 +5,24 @@ Entry point của backend
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import logging
+import threading
 
 from .config import settings
+from .logging_config import RequestIdMiddleware, setup_logging
 from .db import init_db
 from .ai_deps import warmup_ai_models
+from .rag_pipeline.data_loader import shutdown_pdf_pools
+from .rag_pipeline.generator import warmup_generator
+from .services.user_cache import user_cache
+from .services.password_hasher import password_hasher
 
 # Import routers
-from .api import auth, subjects, documents, conversations, chat
+from .api import auth, subjects, documents, conversations, chat, metrics
+
+# Logging: cấu hình một lần khi import app (trước khi các module ghi log)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -20,19 +31,24 @@ async def lifespan(app: FastAPI):
     Lifespan events - chạy khi app startup và shutdown
     """
     # Startup: Tạo database tables
-    print("🚀 Starting application...")
+    logger.info("Starting application...")
     init_db()
-    print("✅ Database initialized")
+    logger.info("Database initialized")
     
     # Khởi tạo sẵn các model AI (singleton)
-    print("🤖 Initializing shared AI models...")
+    logger.info("Initializing shared AI models...")
     warmup_ai_models()
-    print("✅ AI models ready")
+    logger.info("AI models ready")
+    
+    # Nạp LLM + prefill system prompt ở background để không chặn startup
+    if settings.OLLAMA_WARMUP:
+        threading.Thread(target=warmup_generator, daemon=True).start()
     
     yield
     
     # Shutdown
-    print("👋 Shutting down application...")
+    logger.info("Shutting down application...")
+    shutdown_pdf_pools()
 
 
 # Khởi tạo FastAPI app
@@ -51,15 +67,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Server-Timing"],
 )
 
 
+# Gắn request_id cho mọi log trong request (header X-Request-ID)
+app.add_middleware(RequestIdMiddleware)
+
+
 # Include routers
 app.include_router(auth.router, prefix=settings.API_V1_PREFIX)
 app.include_router(subjects.router, prefix=settings.API_V1_PREFIX)
 app.include_router(documents.router, prefix=settings.API_V1_PREFIX)
 app.include_router(conversations.router, prefix=settings.API_V1_PREFIX)
 app.include_router(chat.router, prefix=settings.API_V1_PREFIX)
+app.include_router(metrics.router)
 
 
 @app.get("/")
@@ -79,7 +101,11 @@ def health_check():
     """
     Health check cho monitoring
     """
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "user_cache": user_cache.stats(),
+        "password_hasher": password_hasher.stats()
+    }
 
 
 if __name__ == "__main__":
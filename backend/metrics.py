@@ -0,0 +1,113 @@
+"""
+Metrics
+-------
+Histogram latency theo từng stage của RAG pipeline và của password hashing (Prometheus).
+
+Pipeline ghi thời gian của từng stage vào dict `stats` của request (khóa *_ms);
+observe_rag_request() đẩy các giá trị đó vào histogram khi request kết thúc.
+Gauge cho cache / hàng đợi được đọc lúc scrape (xem api/metrics.py).
+"""
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Stage -> khóa trong dict stats (đơn vị ms)
+RAG_STAGES = {
+    "embed": "embed_ms",
+    "faiss": "faiss_ms",
+    "bm25": "bm25_ms",
+    "fusion": "fusion_ms",
+    "rerank": "rerank_ms",
+    "detect": "detect_ms",
+    "prompt_build": "prompt_build_ms",
+    "prompt_eval": "prompt_eval_ms",
+    "ttft": "ttft_ms",
+    "total": "total_ms",
+}
+
+# Các mục Server-Timing ngoài stage: thời gian prefill tiết kiệm nhờ prefix cache (ước lượng)
+SERVER_TIMING_EXTRA = {
+    "prompt_eval_saved": "prompt_eval_saved_ms",
+}
+
+RAG_STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of each RAG pipeline stage",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+RAG_TOKENS_PER_SECOND = Histogram(
+    "rag_generation_tokens_per_second",
+    "LLM decode throughput reported by Ollama",
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200),
+)
+
+RAG_PROMPT_EVAL_TOKENS = Histogram(
+    "rag_prompt_eval_tokens",
+    "Prompt tokens actually evaluated by Ollama (prefix served from KV cache excluded)",
+    buckets=(16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+)
+
+RAG_PROMPT_EVAL_SAVED_SECONDS = Histogram(
+    "rag_prompt_eval_saved_seconds",
+    "Estimated prefill time saved by the cached system prefix (warmup baseline)",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "bcrypt hash/verify time on the password executor",
+    ["phase"],  # wait = chờ worker, run = thời gian bcrypt
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2, 5, 10),
+)
+
+RAG_REQUESTS = Counter(
+    "rag_requests_total",
+    "RAG pipeline requests by outcome",
+    ["outcome"],
+)
+
+RETRIEVAL_PATH = Counter(
+    "rag_retrieval_path_total",
+    "Retrieval cascade path taken (full = semantic + BM25, capped, skipped = semantic only)",
+    ["path"],
+)
+
+RAG_IN_FLIGHT = Gauge(
+    "rag_requests_in_flight",
+    "RAG pipeline requests currently being processed (including open streams)",
+)
+
+
+def observe_rag_request(stats: Dict[str, Any], outcome: str = "answered") -> None:
+    """Ghi các stage đã đo trong `stats` vào histogram."""
+    for stage, key in RAG_STAGES.items():
+        value = stats.get(key)
+        if value is not None:
+            RAG_STAGE_SECONDS.labels(stage=stage).observe(value / 1000)
+
+    tokens_per_second = stats.get("tokens_per_second")
+    if tokens_per_second:
+        RAG_TOKENS_PER_SECOND.observe(tokens_per_second)
+
+    prompt_eval_count = stats.get("prompt_eval_count")
+    if prompt_eval_count is not None:
+        RAG_PROMPT_EVAL_TOKENS.observe(prompt_eval_count)
+
+    saved_ms = stats.get("prompt_eval_saved_ms")
+    if saved_ms is not None:
+        RAG_PROMPT_EVAL_SAVED_SECONDS.observe(saved_ms / 1000)
+
+    RAG_REQUESTS.labels(outcome=outcome).inc()
+
+
+def server_timing_header(stats: Optional[Dict[str, Any]]) -> str:
+    """Format các stage đã đo thành giá trị header Server-Timing."""
+    if not stats:
+        return ""
+    return ", ".join(
+        f"{stage};dur={stats[key]:.1f}"
+        for stage, key in {**RAG_STAGES, **SERVER_TIMING_EXTRA}.items()
+        if stats.get(key) is not None
+    )
@@ -0,0 +1,106 @@
+"""
+Database Migrations
+Các bước migrate nhẹ, idempotent, chạy sau create_all khi app startup.
+create_all chỉ tạo bảng còn thiếu, không thêm cột/index vào bảng đã tồn tại,
+nên mỗi thay đổi schema trên bảng cũ cần một bước ở đây.
+"""
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column_if_missing(engine: Engine, table: str, column: str, ddl_type: str) -> None:
+    columns = {col["name"] for col in inspect(engine).get_columns(table)}
+    if column in columns:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+    logger.info("Added column %s.%s", table, column)
+
+
+def _create_index_if_missing(engine: Engine, name: str, table: str, columns: List[str]) -> None:
+    indexes = {idx["name"] for idx in inspect(engine).get_indexes(table)}
+    if name in indexes:
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+    logger.info("Created index %s on %s", name, table)
+
+
+def _conversation_summary(engine: Engine) -> None:
+    """Thêm cột summary cho conversation memory."""
+    _add_column_if_missing(engine, "conversations", "summary", "TEXT")
+    _add_column_if_missing(engine, "conversations", "summary_message_id", "INTEGER")
+
+
+def _messages_keyset_index(engine: Engine) -> None:
+    """Index composite cho keyset pagination của message history."""
+    _create_index_if_missing(
+        engine,
+        "ix_messages_conversation_created_id",
+        "messages",
+        ["conversation_id", "created_at", "id"],
+    )
+
+
+def _foreign_key_indexes(engine: Engine) -> None:
+    """Index cho các cột foreign key hay được filter/join (trùng tên với index=True trong models)."""
+    for table, column in [
+        ("subjects", "user_id"),
+        ("documents", "subject_id"),
+        ("conversations", "user_id"),
+        ("conversations", "subject_id"),
+        ("conversation_documents", "conversation_id"),
+        ("conversation_documents", "document_id"),
+    ]:
+        _create_index_if_missing(engine, f"ix_{table}_{column}", table, [column])
+
+
+def _document_content_hash(engine: Engine) -> None:
+    """Cột SHA-256 cho dedup file upload theo nội dung."""
+    _add_column_if_missing(engine, "documents", "content_hash", "VARCHAR(64)")
+    _create_index_if_missing(engine, "ix_documents_content_hash", "documents", ["content_hash"])
+
+
+def _document_page_count(engine: Engine) -> None:
+    """Số trang PDF đếm được lúc upload."""
+    _add_column_if_missing(engine, "documents", "page_count", "INTEGER")
+
+
+def _subject_chunk_params(engine: Engine) -> None:
+    """Tham số chunk theo môn học."""
+    _add_column_if_missing(engine, "subjects", "chunk_size", "INTEGER")
+    _add_column_if_missing(engine, "subjects", "chunk_overlap", "INTEGER")
+
+
+def _subject_index_type(engine: Engine) -> None:
+    """Loại vector index (fp32 / nén) theo môn học."""
+    _add_column_if_missing(engine, "subjects", "index_type", "VARCHAR(20)")
+
+
+# Thứ tự chạy = thứ tự trong danh sách. Chỉ thêm bước mới ở cuối.
+MIGRATIONS: List[Tuple[str, Callable[[Engine], None]]] = [
+    ("0001_conversation_summary", _conversation_summary),
+    ("0002_messages_keyset_index", _messages_keyset_index),
+    ("0003_foreign_key_indexes", _foreign_key_indexes),
+    ("0004_document_content_hash", _document_content_hash),
+    ("0005_document_page_count", _document_page_count),
+    ("0006_subject_chunk_params", _subject_chunk_params),
+    ("0007_subject_index_type", _subject_index_type),
+]
+
+
+def run_migrations(engine: Engine) -> None:
+    """Chạy toàn bộ các bước migrate (an toàn khi chạy lại nhiều lần)."""
+    for name, step in MIGRATIONS:
+        try:
+            step(engine)
+        except Exception as e:
+            logger.error("Migration %s failed: %s", name, e)
+            raise
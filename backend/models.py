@@ -1,7 +1,7 @@
 """
 SQLAlchemy Models - Định nghĩa cấu trúc bảng
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Table, Float, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db import Base
@@ -26,9 +26,13 @@ class Subject(Base):
     __tablename__ = "subjects"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
     description = Column(Text)
+    # Tham số chunk riêng của môn học (NULL = settings.CHUNK_SIZE / CHUNK_OVERLAP)
+    chunk_size = Column(Integer)
+    chunk_overlap = Column(Integer)
+    index_type = Column(String(20))  # flat | fp16 | sq8 | pq (NULL = settings.VECTOR_INDEX_TYPE)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -51,10 +55,12 @@ class Document(Base):
     __tablename__ = "documents"
     
     id = Column(Integer, primary_key=True, index=True)
-    subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=False)
+    subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=False, index=True)
     filename = Column(String(255), nullable=False)
     filepath = Column(String(500), nullable=False)
     file_size = Column(Integer)  # bytes
+    content_hash = Column(String(64), index=True)  # SHA-256 nội dung file (dedup blob + chunks/embeddings)
+    page_count = Column(Integer)  # Đếm lúc upload (None nếu không xác định được)
     status = Column(String(50), default="uploaded")  # uploaded, processing, ready, error
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -67,9 +73,12 @@ class Conversation(Base):
     __tablename__ = "conversations"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    subject_id = Column(Integer, ForeignKey("subjects.id"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
+    # Tóm tắt cuốn chiếu các lượt hội thoại cũ (ngoài cửa sổ N lượt gần nhất)
+    summary = Column(Text)
+    summary_message_id = Column(Integer)  # ID message cuối cùng đã được gộp vào summary
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -82,6 +91,10 @@ class Conversation(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Keyset pagination: WHERE conversation_id = ? ORDER BY created_at, id
+        Index("ix_messages_conversation_created_id", "conversation_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
@@ -98,8 +111,8 @@ class ConversationDocument(Base):
     __tablename__ = "conversation_documents"
     
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
     added_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
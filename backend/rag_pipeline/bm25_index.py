@@ -0,0 +1,144 @@
+"""
+BM25 Index
+----------
+BM25 Okapi với corpus lưu dạng token id (int32) trong mảng numpy liền khối thay vì
+list[list[str]] + dict tần suất cho từng document như rank_bm25.
+
+- Từ điển token -> id được build một lần lúc index.
+- Posting list dạng CSR: postings_ptr[t]:postings_ptr[t+1] là các (doc, tf) chứa token t.
+- Chuẩn hóa độ dài document (k1 * (1 - b + b * dl / avgdl)) được tính trước.
+
+Công thức (kể cả idf âm được thay bằng epsilon * idf trung bình) giống BM25Okapi
+để ngưỡng BM25 hiện có (bm25_min_top1, BM25_THRESHOLD) vẫn giữ nguyên ý nghĩa.
+
+Index được build một lần lúc build vector store và lưu cạnh FAISS index (save / load):
+mỗi mảng là một file .npy (load bằng mmap), từ điển + tham số trong params.json.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+# Các mảng được lưu ra đĩa (tên thuộc tính = tên file .npy)
+ARRAYS = (
+    "token_ids", "doc_offsets", "postings_docs", "postings_tf",
+    "postings_ptr", "idf", "length_norm",
+)
+
+
+class BM25Index:
+    def __init__(
+        self,
+        corpus: Iterable[Sequence[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25
+    ):
+        """
+        Args:
+            corpus: Danh sách document đã tách token (qua TextAnalyzer)
+            k1, b, epsilon: Tham số BM25 Okapi (mặc định như rank_bm25)
+        """
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+        # 1. Token -> id, corpus thành một mảng id liền khối + offset từng document
+        self.vocab: Dict[str, int] = {}
+        token_ids: List[int] = []
+        offsets = [0]
+        for doc in corpus:
+            for token in doc:
+                token_ids.append(self.vocab.setdefault(token, len(self.vocab)))
+            offsets.append(len(token_ids))
+
+        self.token_ids = np.asarray(token_ids, dtype=np.int32)
+        self.doc_offsets = np.asarray(offsets, dtype=np.int64)
+        self.corpus_size = len(offsets) - 1
+        vocab_size = len(self.vocab)
+
+        doc_len = np.diff(self.doc_offsets).astype(np.float32)
+        self.avgdl = float(doc_len.mean()) if self.corpus_size else 0.0
+
+        # 2. Posting list (CSR): sắp theo token rồi theo document
+        doc_of_token = np.repeat(np.arange(self.corpus_size, dtype=np.int64), np.diff(self.doc_offsets))
+        keys = self.token_ids.astype(np.int64) * max(self.corpus_size, 1) + doc_of_token
+        unique_keys, tf = np.unique(keys, return_counts=True)
+
+        posting_tokens = unique_keys // max(self.corpus_size, 1)
+        self.postings_docs = (unique_keys % max(self.corpus_size, 1)).astype(np.int32)
+        self.postings_tf = tf.astype(np.float32)
+        self.postings_ptr = np.searchsorted(posting_tokens, np.arange(vocab_size + 1)).astype(np.int64)
+
+        # 3. IDF (giống BM25Okapi: idf âm -> epsilon * idf trung bình)
+        df = np.diff(self.postings_ptr).astype(np.float64)
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        if vocab_size:
+            idf[idf < 0] = self.epsilon * idf.mean()
+        self.idf = idf.astype(np.float32)
+
+        # 4. Phần chuẩn hóa độ dài của mẫu số, tính trước cho mọi document
+        avgdl = self.avgdl or 1.0
+        self.length_norm = (self.k1 * (1 - self.b + self.b * doc_len / avgdl)).astype(np.float32)
+
+    def save(self, directory: str) -> None:
+        """Lưu index vào thư mục (tạo mới)."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        params = {
+            "k1": self.k1,
+            "b": self.b,
+            "epsilon": self.epsilon,
+            "avgdl": self.avgdl,
+            "corpus_size": self.corpus_size,
+            # Token theo thứ tự id
+            "vocab": sorted(self.vocab, key=self.vocab.get),
+        }
+        with open(os.path.join(directory, "params.json"), "w", encoding="utf-8") as f:
+            json.dump(params, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "BM25Index":
+        """Đọc index đã lưu; mmap=True thì các mảng được map thay vì đọc vào RAM."""
+        with open(os.path.join(directory, "params.json"), "r", encoding="utf-8") as f:
+            params = json.load(f)
+
+        index = cls.__new__(cls)
+        index.k1 = params["k1"]
+        index.b = params["b"]
+        index.epsilon = params["epsilon"]
+        index.avgdl = params["avgdl"]
+        index.corpus_size = params["corpus_size"]
+        index.vocab = {token: i for i, token in enumerate(params["vocab"])}
+        for name in ARRAYS:
+            setattr(index, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None))
+        return index
+
+    def token_id(self, token: str) -> int:
+        """Id của token, -1 nếu không có trong từ điển."""
+        return self.vocab.get(token, -1)
+
+    def get_scores(self, query_tokens: Sequence[str]) -> np.ndarray:
+        """Điểm BM25 của mọi document cho câu truy vấn đã tách token."""
+        scores = np.zeros(self.corpus_size, dtype=np.float32)
+        for token in query_tokens:
+            tid = self.vocab.get(token)
+            if tid is None:
+                continue
+            start, end = self.postings_ptr[tid], self.postings_ptr[tid + 1]
+            docs = self.postings_docs[start:end]
+            tf = self.postings_tf[start:end]
+            scores[docs] += self.idf[tid] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+        return scores
+
+    def nbytes(self) -> int:
+        """Dung lượng các mảng numpy (không tính từ điển token)."""
+        return sum(
+            arr.nbytes
+            for arr in (
+                self.token_ids, self.doc_offsets, self.postings_docs,
+                self.postings_tf, self.postings_ptr, self.idf, self.length_norm,
+            )
+        )
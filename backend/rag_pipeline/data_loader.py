@@ -1,32 +1,270 @@
+import logging
+import multiprocessing
 import os
-from typing import List
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from ..config import settings
+from .text_splitter import RecursiveTextSplitter
 
-def load_document(file_path: str) -> List[Document]:
-    """Tải một tài liệu duy nhất dựa trên đường dẫn."""
+try:
+    import pypdfium2
+except ImportError:  # pragma: no cover - optional dependency
+    pypdfium2 = None
+
+try:
+    import pymupdf
+except ImportError:  # pragma: no cover - optional dependency
+    try:
+        import fitz as pymupdf  # PyMuPDF < 1.24
+    except ImportError:
+        pymupdf = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+
+# ---------------------------------------------------------------------------
+# PDF backends: mở file một lần (object có len() và close()), trích text từng trang
+# (hàm top-level để chạy được trong ProcessPoolExecutor)
+# ---------------------------------------------------------------------------
+
+def _pdfium_open(file_path: str):
+    return pypdfium2.PdfDocument(file_path)
+
+
+def _pdfium_page_text(pdf, index: int) -> str:
+    page = pdf[index]
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_range().replace("\r\n", "\n")
+    finally:
+        textpage.close()
+        page.close()
+
+
+def _pymupdf_open(file_path: str):
+    return pymupdf.open(file_path)
+
+
+def _pymupdf_page_text(pdf, index: int) -> str:
+    return pdf[index].get_text("text")
+
+
+# name -> (module đã import được hay chưa, mở file, trích text một trang)
+PDF_BACKENDS: Dict[str, Tuple[object, Callable[[str], Any], Callable[[Any, int], str]]] = {
+    "pypdfium2": (pypdfium2, _pdfium_open, _pdfium_page_text),
+    "pymupdf": (pymupdf, _pymupdf_open, _pymupdf_page_text),
+}
+
+
+def _extract_range(loader: str, file_path: str, start: int, end: int) -> List[str]:
+    """Trích text các trang [start, end) (chạy trong process worker, mở file một lần)."""
+    _, open_pdf, page_text = PDF_BACKENDS[loader]
+    pdf = open_pdf(file_path)
+    try:
+        return [page_text(pdf, i) for i in range(start, end)]
+    finally:
+        pdf.close()
+
+
+# Process pool dùng chung (theo số worker), tạo lần đầu cần dùng và sống tới khi tắt app.
+# "spawn" thay vì fork: process API đã có thread của torch / uvicorn, fork lúc đó dễ deadlock.
+_pdf_pools: Dict[int, ProcessPoolExecutor] = {}
+_pdf_pools_lock = threading.Lock()
+
+
+def get_pdf_pool(workers: int) -> ProcessPoolExecutor:
+    with _pdf_pools_lock:
+        pool = _pdf_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pdf_pools[workers] = pool
+        return pool
+
+
+def shutdown_pdf_pools() -> None:
+    with _pdf_pools_lock:
+        for pool in _pdf_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pdf_pools.clear()
+
+# Các loader có thể chọn qua settings.PDF_LOADER ("pypdf" = LangChain PyPDFLoader)
+PDF_LOADERS = ["pypdf", *PDF_BACKENDS]
+
+
+def _page_ranges(total: int, parts: int) -> List[Tuple[int, int]]:
+    size = -(-total // parts)  # ceil
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def iter_pdf_pages(
+    file_path: str,
+    loader: Optional[str] = None,
+    workers: Optional[int] = None
+) -> Iterator[Document]:
+    """
+    Trả về từng trang PDF dưới dạng Document (lazy) với metadata giống PyPDFLoader
+    (source, page bắt đầu từ 0, total_pages).
+
+    Args:
+        loader: Tên loader trong PDF_LOADERS (mặc định settings.PDF_LOADER)
+        workers: Số process trích text song song theo khoảng trang
+                 (mặc định settings.PDF_LOADER_WORKERS; 1 = tuần tự, trang nào xong trả trang đó)
+    """
+    loader = loader or settings.PDF_LOADER
+    workers = workers or settings.PDF_LOADER_WORKERS
+
+    if loader == "pypdf":
+        yield from PyPDFLoader(file_path).lazy_load()
+        return
+
+    if loader not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF loader: {loader} (available: {', '.join(PDF_LOADERS)})")
+
+    module, open_pdf, page_text = PDF_BACKENDS[loader]
+    if module is None:
+        logger.warning("PDF loader %s chưa được cài, dùng pypdf", loader)
+        yield from PyPDFLoader(file_path).lazy_load()
+        return
+
+    def _page(index: int, text: str, total: int) -> Document:
+        return Document(
+            page_content=text,
+            metadata={"source": file_path, "page": index, "total_pages": total},
+        )
+
+    # Mở file một lần: tuần tự thì đọc luôn từng trang trên handle này
+    pdf = open_pdf(file_path)
+    try:
+        total = len(pdf)
+        if workers <= 1 or total < 2 * workers:
+            for i in range(total):
+                yield _page(i, page_text(pdf, i), total)
+            return
+    finally:
+        pdf.close()
+
+    # Các backend PDF không thread-safe -> song song bằng process, mỗi worker mở file một lần
+    # cho cả khoảng trang. executor.map trả kết quả theo thứ tự nên vẫn lặp lazy theo khoảng.
+    ranges = _page_ranges(total, workers * 4)
+    results = get_pdf_pool(workers).map(
+        _extract_range,
+        [loader] * len(ranges),
+        [file_path] * len(ranges),
+        [start for start, _ in ranges],
+        [end for _, end in ranges],
+    )
+    for (start, _), texts in zip(ranges, results):
+        for offset, text in enumerate(texts):
+            yield _page(start + offset, text, total)
+
+
+def iter_document(file_path: str, loader: Optional[str] = None) -> Iterator[Document]:
+    """Lặp lazy qua các trang / đoạn của một tài liệu dựa trên đường dẫn."""
     if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
+        yield from iter_pdf_pages(file_path, loader=loader)
     elif file_path.endswith(".txt"):
-        loader = TextLoader(file_path, encoding="utf-8")
+        yield from TextLoader(file_path, encoding="utf-8").lazy_load()
     else:
-        print(f"Định dạng file không được hỗ trợ: {file_path}")
-        return []
-    
-    return loader.load()
+        logger.warning("Định dạng file không được hỗ trợ: %s", file_path)
+
+
+def load_document(file_path: str, loader: Optional[str] = None) -> List[Document]:
+    """Tải một tài liệu duy nhất dựa trên đường dẫn."""
+    return list(iter_document(file_path, loader=loader))
+
+
+@lru_cache(maxsize=1)
+def e5_token_length():
+    """Hàm đếm token theo tokenizer của embedding model (giống from_huggingface_tokenizer)."""
+    from ..ai_deps import get_embedder  # import muộn: chỉ cần khi chunk theo token
+
+    tokenizer = get_embedder().model.tokenizer
+    return lambda text: len(tokenizer.tokenize(text))
+
+
+def chunk_documents(
+    docs: Iterable[Document],
+    chunk_size: int = 1000,
+    overlap: int = 120,
+    chunker: Optional[str] = None,
+    length_unit: Optional[str] = None
+) -> List[Document]:
+    """
+    Chia tài liệu thành các đoạn nhỏ kèm metadata hỗ trợ trích dẫn.
+
+    Args:
+        chunker: "native" (RecursiveTextSplitter, offset có sẵn) hoặc "langchain"
+                 (RecursiveCharacterTextSplitter); mặc định settings.CHUNKER. Hai cách cho cùng chunk.
+        length_unit: "chars" hoặc "tokens" (tokenizer e5) cho chunk_size / overlap;
+                     mặc định settings.CHUNK_LENGTH_UNIT
+    """
+    chunker = chunker or settings.CHUNKER
+    length_unit = length_unit or settings.CHUNK_LENGTH_UNIT
+    length_function = e5_token_length() if length_unit == "tokens" else None
+
+    if chunker == "langchain":
+        return _chunk_documents_langchain(docs, chunk_size, overlap, length_function)
+
+    splitter = RecursiveTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        separators=CHUNK_SEPARATORS,
+        length_function=length_function,
+    )
+
+    enriched_chunks: List[Document] = []
+    for doc in docs:
+        text = doc.page_content
+        base_metadata = doc.metadata or {}
+        source = base_metadata.get("source", "unknown")
+        # Đảm bảo metadata lưu lại tên file rõ ràng để hiển thị citation
+        extra = {"filename": os.path.basename(str(source))} if source else {}
+
+        for start, end in splitter.split_spans(text):
+            enriched_chunks.append(
+                Document(
+                    page_content=text[start:end],
+                    metadata={
+                        **base_metadata,
+                        "chunk_id": len(enriched_chunks) + 1,
+                        "page": base_metadata.get("page"),
+                        "source": source,
+                        "content_length": end - start,
+                        "start_index": start,
+                        **extra,
+                    },
+                )
+            )
+
+    return enriched_chunks
 
 
-def chunk_documents(docs: List[Document], chunk_size: int = 1000, overlap: int = 120) -> List[Document]:
+def _chunk_documents_langchain(
+    docs: Iterable[Document],
+    chunk_size: int,
+    overlap: int,
+    length_function: Optional[Callable[[str], int]] = None
+) -> List[Document]:
     # sourcery skip: use-named-expression
-    """Chia tài liệu thành các đoạn nhỏ kèm metadata hỗ trợ trích dẫn."""
+    """Chunk bằng RecursiveCharacterTextSplitter của LangChain (cách cũ, giữ để đối chiếu)."""
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=overlap,
         add_start_index=True,
-        separators=["\n\n", "\n", ". ", " ", ""],
+        separators=CHUNK_SEPARATORS,
+        length_function=length_function or len,
     )
     
     chunks = splitter.split_documents(docs)
@@ -1,13 +1,17 @@
+import logging
+
 from sentence_transformers import SentenceTransformer
 import torch
 
+logger = logging.getLogger(__name__)
+
 class Embedder:
     def __init__(self, model_name:str="intfloat/multilingual-e5-base", device:str=None):
         # Nếu không truyền device, tự động chọn cuda nếu có, ngược lại cpu
         if not device:
             device = "cuda" if torch.cuda.is_available() else "cpu"
             
-        print(f"📡 Embedder loading on: {device}")
+        logger.info("Embedder loading on: %s", device)
         self.model = SentenceTransformer(model_name, device=device)
     
     def encode(self, texts, prefix="passage"):
@@ -1,51 +1,202 @@
+from typing import Any, Dict, List, Optional, Union
+
 from ..ai_deps import get_ollama_client
-import sys
+from ..config import settings
+from .prompt_builder import build_messages, build_summary_messages
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+Messages = Union[str, List[Dict[str, str]]]
+
+# Prefill của phần prefix chung (system prompt + chat template), đo lúc warmup bằng
+# số liệu của Ollama: lần gọi đầu (KV cache trống) trừ lần gọi lặp lại (prefix đã cache)
+_prefix_baseline: Dict[str, float] = {}
+
+# load_duration vượt ngưỡng này = Ollama vừa nạp lại model, KV cache (prefix) mất theo
+MODEL_RELOAD_MS = 500
+
+
+class GenerationError(RuntimeError):
+    """Ollama không sinh được câu trả lời (lỗi kết nối, model, timeout...)."""
+
+
+def _to_messages(messages: Messages) -> List[Dict[str, str]]:
+    """Cho phép truyền prompt dạng chuỗi (một user message) hoặc danh sách messages."""
+    if isinstance(messages, str):
+        return [{'role': 'user', 'content': messages}]
+    return messages
+
+
+def _build_options(temperature: Optional[float], num_ctx: Optional[int]) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if num_ctx:
+        options["num_ctx"] = num_ctx
+    return options
+
+
+def _record_eval_stats(resp, stats: Optional[Dict[str, Any]]) -> None:
+    """
+    Ghi lại thống kê prompt-eval từ response cuối của Ollama.
+
+    prompt_eval_count (tokenizer của model, gồm cả token của chat template) chỉ
+    tính các token thực sự được đánh giá; phần prefix (system prompt) lấy từ KV
+    cache không nằm trong đó. Chỉ dùng số liệu Ollama trả về: prompt_tokens
+    (ước lượng bằng tiktoken) không so sánh trực tiếp được với prompt_eval_count.
+    Thời gian tiết kiệm nhờ prefix cache lấy từ baseline đo lúc warmup, cho các
+    request mà model không bị nạp lại.
+    """
+    if stats is None:
+        return
+
+    eval_count = resp.get("prompt_eval_count") or 0
+    eval_duration_ms = (resp.get("prompt_eval_duration") or 0) / 1e6
+    stats["prompt_eval_count"] = eval_count
+    stats["prompt_eval_ms"] = round(eval_duration_ms, 2)
+    stats["eval_count"] = resp.get("eval_count") or 0
+    stats["eval_ms"] = round((resp.get("eval_duration") or 0) / 1e6, 2)
+    stats["load_ms"] = round((resp.get("load_duration") or 0) / 1e6, 2)
+    if stats["eval_count"] and stats["eval_ms"]:
+        stats["tokens_per_second"] = round(stats["eval_count"] / (stats["eval_ms"] / 1000), 2)
+    # Không streaming: TTFT ~ thời gian nạp model + prompt eval (theo Ollama)
+    stats.setdefault("ttft_ms", stats["load_ms"] + stats["prompt_eval_ms"])
+
+    if _prefix_baseline and stats["load_ms"] < MODEL_RELOAD_MS:
+        stats["prompt_cached_tokens"] = _prefix_baseline["tokens"]
+        stats["prompt_eval_saved_ms"] = _prefix_baseline["ms"]
+
+    logger.debug(
+        "Prompt eval: %d tokens in %.0f ms, load %.0f ms, saved ~%.0f ms",
+        eval_count, eval_duration_ms, stats["load_ms"], stats.get("prompt_eval_saved_ms", 0)
+    )
+
 
 def generate_answer_stream(
-    prompt: str, 
-    model: str, 
-    temperature: float = 0.2
+    messages: Messages,
+    model: str,
+    temperature: float = 0.2,
+    num_ctx: int = None,
+    stats: Optional[Dict[str, Any]] = None
 ):
     """
     Sinh câu trả lời từ Ollama và yield từng token (streaming).
-    Hỗ trợ truyền temperature cho model.
+    Hỗ trợ truyền temperature và num_ctx (context window) cho model.
+    Lỗi được raise dưới dạng GenerationError (kể cả khi đã yield một phần).
     """
     try:
         # Lấy client đã được cấu hình URL chính xác (http://ollama:11434)
         client = get_ollama_client()
-        
+
+        started = time.perf_counter()
         stream_resp = client.chat(
             model=model,
-            messages=[{'role': 'user', 'content': prompt}],
+            messages=_to_messages(messages),
             stream=True,
-            options={
-                "temperature": temperature
-            }
+            options=_build_options(temperature, num_ctx),
+            keep_alive=settings.OLLAMA_KEEP_ALIVE
         )
         for chunk in stream_resp:
+            if stats is not None and "ttft_ms" not in stats and chunk['message']['content']:
+                stats["ttft_ms"] = (time.perf_counter() - started) * 1000
+            if chunk.get('done'):
+                _record_eval_stats(chunk, stats)
             yield chunk['message']['content']
-    
+
     except Exception as e:
         # Log ra console để dễ debug trong docker logs
-        print(f"Error in generate_answer_stream: {e}", file=sys.stderr)
-        yield f"Lỗi khi sinh phản hồi: {e}"
+        logger.exception("Error in generate_answer_stream: %s", e)
+        raise GenerationError(f"Lỗi khi sinh phản hồi: {e}") from e
 
 def generate_answer(
-    prompt: str, 
-    model: str, 
+    messages: Messages,
+    model: str,
+    temperature: float = None,
+    num_ctx: int = None,
+    stats: Optional[Dict[str, Any]] = None
     ):
     """
-    Sinh câu trả lời từ Ollama.
-    Hỗ trợ truyền temperature cho model.
-    Trả về câu trả lời đầy đủ.
+    Sinh câu trả lời từ Ollama (dùng chung chat API với bản streaming).
+    Hỗ trợ truyền temperature và num_ctx (context window) cho model.
+    Trả về câu trả lời đầy đủ, raise GenerationError nếu Ollama lỗi.
     """
     try:
         # Lấy client đã được cấu hình URL chính xác
         client = get_ollama_client()
-        
-        resp = client.generate(model=model, prompt=prompt, stream=False)
-        return resp.get("response", "")
-    
+
+        resp = client.chat(
+            model=model,
+            messages=_to_messages(messages),
+            stream=False,
+            options=_build_options(temperature, num_ctx),
+            keep_alive=settings.OLLAMA_KEEP_ALIVE
+        )
+        _record_eval_stats(resp, stats)
+        return resp['message']['content']
+
+    except Exception as e:
+        logger.exception("Error in generate_answer: %s", e)
+        raise GenerationError(f"Lỗi khi sinh phản hồi: {e}") from e
+
+
+def generate_summary(
+    previous_summary: Optional[str],
+    turns: List[Dict[str, str]],
+    model: str,
+    max_words: int = 150
+) -> str:
+    """
+    Gộp các lượt hội thoại mới vào summary cũ (không streaming).
+    Khác generate_answer: lỗi được raise để caller giữ nguyên summary cũ.
+    """
+    resp = get_ollama_client().chat(
+        model=model,
+        messages=build_summary_messages(previous_summary, turns, max_words=max_words),
+        stream=False,
+        options=_build_options(0.0, settings.LLM_NUM_CTX),
+        keep_alive=settings.OLLAMA_KEEP_ALIVE
+    )
+    return resp['message']['content'].strip()
+
+
+def _set_prefix_baseline(cold, warm) -> None:
+    """Baseline prefix cache từ hai lần gọi cùng một prompt (cold rồi warm)."""
+    tokens = (cold.get("prompt_eval_count") or 0) - (warm.get("prompt_eval_count") or 0)
+    saved_ms = ((cold.get("prompt_eval_duration") or 0) - (warm.get("prompt_eval_duration") or 0)) / 1e6
+    if tokens > 0 and saved_ms > 0:
+        _prefix_baseline.update({"tokens": tokens, "ms": round(saved_ms, 2)})
+    else:
+        # Prefix đã nằm sẵn trong KV cache từ trước (vd. chỉ restart backend) hoặc Ollama không cache
+        _prefix_baseline.clear()
+
+
+def warmup_generator(model: str = None) -> None:
+    """
+    Nạp model vào Ollama và prefill sẵn SYSTEM_PROMPT để request đầu tiên
+    đã có prefix trong KV cache. Gọi lặp lại cùng prompt để đo baseline thời gian
+    prefill tiết kiệm nhờ prefix cache (xem _record_eval_stats).
+    Lỗi chỉ được log lại (Ollama có thể chưa sẵn sàng).
+    """
+    target_model = model or settings.LLM_MODEL
+    try:
+        client = get_ollama_client()
+        responses = [
+            client.chat(
+                model=target_model,
+                messages=build_messages("ping"),
+                stream=False,
+                options={"num_predict": 1, "num_ctx": settings.LLM_NUM_CTX},
+                keep_alive=settings.OLLAMA_KEEP_ALIVE
+            )
+            for _ in range(2)
+        ]
+        _set_prefix_baseline(*responses)
+        logger.info(
+            "LLM %s warmed up (keep_alive=%s, cached prefix %s tokens, prefill saved %s ms)",
+            target_model, settings.OLLAMA_KEEP_ALIVE,
+            _prefix_baseline.get("tokens", "n/a"), _prefix_baseline.get("ms", "n/a")
+        )
     except Exception as e:
-        print(f"Error in generate_answer: {e}", file=sys.stderr)
-        return f"Lỗi khi sinh phản hồi: {e}"
\ No newline at end of file
+        logger.warning("LLM warmup failed: %s", e)
\ No newline at end of file
@@ -1,207 +1,373 @@
-from langdetect import detect
+"""
+Language Detector
+-----------------
+Phát hiện ngôn ngữ câu hỏi với fast path theo Unicode script / dấu tiếng Việt,
+LRU cache trên văn bản đã chuẩn hóa và langdetect (seed cố định) làm fallback.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Hashable, Optional
+
+from langdetect import DetectorFactory, detect
+
+logger = logging.getLogger(__name__)
+
+# langdetect mặc định không tất định -> cố định seed để cùng input luôn cùng output
+DetectorFactory.seed = 0
+
+LANG_DICT = {
+    "aa": "Afar",
+    "ab": "Abkhazian",
+    "ae": "Avestan",
+    "af": "Afrikaans",
+    "ak": "Akan",
+    "am": "Amharic",
+    "an": "Aragonese",
+    "ar": "Arabic",
+    "as": "Assamese",
+    "av": "Avaric",
+    "ay": "Aymara",
+    "az": "Azerbaijani",
+    "ba": "Bashkir",
+    "be": "Belarusian",
+    "bg": "Bulgarian",
+    "bi": "Bislama",
+    "bm": "Bambara",
+    "bn": "Bengali",
+    "bo": "Tibetan",
+    "br": "Breton",
+    "bs": "Bosnian",
+    "ca": "Catalan",
+    "ce": "Chechen",
+    "ch": "Chamorro",
+    "co": "Corsican",
+    "cr": "Cree",
+    "cs": "Czech",
+    "cu": "Church Slavic",
+    "cv": "Chuvash",
+    "cy": "Welsh",
+    "da": "Danish",
+    "de": "German",
+    "dv": "Divehi",
+    "dz": "Dzongkha",
+    "ee": "Ewe",
+    "el": "Greek",
+    "en": "English",
+    "eo": "Esperanto",
+    "es": "Spanish",
+    "et": "Estonian",
+    "eu": "Basque",
+    "fa": "Persian",
+    "ff": "Fulah",
+    "fi": "Finnish",
+    "fj": "Fijian",
+    "fo": "Faroese",
+    "fr": "French",
+    "fy": "Western Frisian",
+    "ga": "Irish",
+    "gd": "Gaelic",
+    "gl": "Galician",
+    "gn": "Guarani",
+    "gu": "Gujarati",
+    "gv": "Manx",
+    "ha": "Hausa",
+    "he": "Hebrew",
+    "hi": "Hindi",
+    "ho": "Hiri Motu",
+    "hr": "Croatian",
+    "ht": "Haitian",
+    "hu": "Hungarian",
+    "hy": "Armenian",
+    "hz": "Herero",
+    "ia": "Interlingua",
+    "id": "Indonesian",
+    "ie": "Interlingue",
+    "ig": "Igbo",
+    "ii": "Sichuan Yi",
+    "ik": "Inupiaq",
+    "io": "Ido",
+    "is": "Icelandic",
+    "it": "Italian",
+    "iu": "Inuktitut",
+    "ja": "Japanese",
+    "jv": "Javanese",
+    "ka": "Georgian",
+    "kg": "Kongo",
+    "ki": "Kikuyu",
+    "kj": "Kuanyama",
+    "kk": "Kazakh",
+    "kl": "Kalaallisut",
+    "km": "Central Khmer",
+    "kn": "Kannada",
+    "ko": "Korean",
+    "kr": "Kanuri",
+    "ks": "Kashmiri",
+    "ku": "Kurdish",
+    "kv": "Komi",
+    "kw": "Cornish",
+    "ky": "Kirghiz",
+    "la": "Latin",
+    "lb": "Luxembourgish",
+    "lg": "Ganda",
+    "li": "Limburgan",
+    "ln": "Lingala",
+    "lo": "Lao",
+    "lt": "Lithuanian",
+    "lu": "Luba-Katanga",
+    "lv": "Latvian",
+    "mg": "Malagasy",
+    "mh": "Marshallese",
+    "mi": "Maori",
+    "mk": "Macedonian",
+    "ml": "Malayalam",
+    "mn": "Mongolian",
+    "mr": "Marathi",
+    "ms": "Malay",
+    "mt": "Maltese",
+    "my": "Burmese",
+    "na": "Nauru",
+    "nb": "Bokmål, Norwegian",
+    "nd": "Ndebele, North",
+    "ne": "Nepali",
+    "ng": "Ndonga",
+    "nl": "Dutch",
+    "nn": "Norwegian Nynorsk",
+    "no": "Norwegian",
+    "nr": "Ndebele, South",
+    "nv": "Navajo",
+    "ny": "Chichewa",
+    "oc": "Occitan",
+    "oj": "Ojibwa",
+    "om": "Oromo",
+    "or": "Oriya",
+    "os": "Ossetian",
+    "pa": "Panjabi",
+    "pi": "Pali",
+    "pl": "Polish",
+    "ps": "Pushto",
+    "pt": "Portuguese",
+    "qu": "Quechua",
+    "rm": "Romansh",
+    "rn": "Rundi",
+    "ro": "Romanian",
+    "ru": "Russian",
+    "rw": "Kinyarwanda",
+    "sa": "Sanskrit",
+    "sc": "Sardinian",
+    "sd": "Sindhi",
+    "se": "Northern Sami",
+    "sg": "Sango",
+    "si": "Sinhala",
+    "sk": "Slovak",
+    "sl": "Slovenian",
+    "sm": "Samoan",
+    "sn": "Shona",
+    "so": "Somali",
+    "sq": "Albanian",
+    "sr": "Serbian",
+    "ss": "Swati",
+    "st": "Sotho, Southern",
+    "su": "Sundanese",
+    "sv": "Swedish",
+    "sw": "Swahili",
+    "ta": "Tamil",
+    "te": "Telugu",
+    "tg": "Tajik",
+    "th": "Thai",
+    "ti": "Tigrinya",
+    "tk": "Turkmen",
+    "tl": "Tagalog",
+    "tn": "Tswana",
+    "to": "Tonga",
+    "tr": "Turkish",
+    "ts": "Tsonga",
+    "tt": "Tatar",
+    "tw": "Twi",
+    "ty": "Tahitian",
+    "ug": "Uighur",
+    "uk": "Ukrainian",
+    "ur": "Urdu",
+    "uz": "Uzbek",
+    "ve": "Venda",
+    "vi": "Vietnamese",
+    "vo": "Volapük",
+    "wa": "Walloon",
+    "wo": "Wolof",
+    "xh": "Xhosa",
+    "yi": "Yiddish",
+    "yo": "Yoruba",
+    "za": "Zhuang",
+    "zh": "Chinese",
+    "zu": "Zulu"
+}
+
+# Các ký tự chỉ xuất hiện trong tiếng Việt (khối Latin Extended Additional + ơ, ư)
+_VI_ONLY_CHARS = frozenset(
+    [chr(c) for c in range(0x1EA0, 0x1EFA)] + ["ơ", "ư", "Ơ", "Ư"]
+)
+# Các ký tự có dấu phổ biến trong tiếng Việt nhưng cũng có ở ngôn ngữ khác
+_VI_COMMON_CHARS = frozenset("ăâđêôàáãèéìíòóõùúýĂÂĐÊÔÀÁÃÈÉÌÍÒÓÕÙÚÝ")
+# Trong số đó, ă / đ hiếm gặp ở ngôn ngữ Tây Âu (é, á, ó, ù... thì rất phổ biến)
+_VI_MARKED_CHARS = frozenset("ăđĂĐ")
+
+_EN_STOPWORDS = frozenset(
+    {
+        "the", "is", "are", "was", "were", "what", "how", "why", "when", "where",
+        "which", "who", "of", "and", "or", "in", "on", "to", "for", "with",
+        "does", "do", "can", "a", "an", "this", "that", "explain", "between",
+        "difference", "please", "give", "me", "example",
+    }
+)
+# Đã bỏ dấu; không gồm các từ trùng với tiếng Tây Ban Nha / Pháp / Ý / Bồ Đào Nha
+# sau khi bỏ dấu (la, co, va, nhu, mot, voi, nao, sao...)
+_VI_STOPWORDS = frozenset(
+    {
+        "gi", "cua", "cac", "nhung", "trong", "cho", "khong", "duoc", "nay",
+        "nhieu", "giua", "thi", "lam", "tai",
+    }
+)
+
+# (start, end, language_code) cho các hệ chữ không phải Latin
+_SCRIPT_RANGES = (
+    (0x3040, 0x30FF, "ja"),   # Hiragana + Katakana
+    (0xAC00, 0xD7AF, "ko"),   # Hangul
+    (0x4E00, 0x9FFF, "zh"),   # CJK Unified Ideographs
+    (0x0E00, 0x0E7F, "th"),   # Thai
+    (0x0400, 0x04FF, "ru"),   # Cyrillic
+    (0x0600, 0x06FF, "ar"),   # Arabic
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def normalize_text(text: str, max_chars: int = 300) -> str:
+    """Chuẩn hóa văn bản làm khóa cache: NFC, lowercase, gộp khoảng trắng, cắt độ dài."""
+    text = unicodedata.normalize("NFC", text or "")
+    text = _WHITESPACE_RE.sub(" ", text).strip().lower()
+    return text[:max_chars]
+
+
+def _fold_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text.replace("đ", "d"))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def detect_by_script(text: str) -> Optional[str]:
+    """
+    Fast path: đoán ngôn ngữ bằng hệ chữ và dấu, không cần langdetect.
+
+    Trả về mã ngôn ngữ khi đủ chắc chắn, None nếu không kết luận được.
+    """
+    letters = [ch for ch in text if ch.isalpha()]
+    if not letters:
+        return None
+
+    # 1. Hệ chữ không phải Latin (đếm theo ký tự chiếm đa số)
+    script_counts = {}
+    for ch in letters:
+        code = ord(ch)
+        if code < 0x0400:
+            continue
+        for start, end, lang in _SCRIPT_RANGES:
+            if start <= code <= end:
+                script_counts[lang] = script_counts.get(lang, 0) + 1
+                break
+    if script_counts:
+        # Có kana -> tiếng Nhật kể cả khi trộn Kanji
+        if script_counts.get("ja"):
+            return "ja"
+        lang, count = max(script_counts.items(), key=lambda item: item[1])
+        if count * 2 >= len(letters):
+            return lang
+
+    # 2. Tiếng Việt: ký tự đặc trưng hoặc mật độ dấu đủ cao
+    vi_only = sum(1 for ch in letters if ch in _VI_ONLY_CHARS)
+    if vi_only:
+        return "vi"
+    vi_common = sum(1 for ch in letters if ch in _VI_COMMON_CHARS)
+
+    words = _WORD_RE.findall(_fold_accents(text.lower()))
+    if not words:
+        return None
+    vi_hits = sum(1 for w in words if w in _VI_STOPWORDS)
+    # é/á/ó + vài từ chung chung cũng khớp câu tiếng Tây Ban Nha / Pháp: chỉ kết luận
+    # khi có dấu hiệu riêng của tiếng Việt, còn lại để langdetect quyết định
+    vi_marked = any(ch in _VI_MARKED_CHARS for ch in letters)
+    if vi_common >= 2 and (vi_hits >= 2 or (vi_marked and vi_hits)):
+        return "vi"
+
+    # 3. Văn bản toàn ASCII: phân xử bằng stopword (tiếng Anh / tiếng Việt không dấu)
+    if vi_common == 0 and all(ch.isascii() for ch in letters):
+        en_hits = sum(1 for w in words if w in _EN_STOPWORDS)
+        if en_hits and en_hits >= vi_hits:
+            return "en"
+        if vi_hits >= 2 and en_hits == 0:
+            return "vi"
+
+    return None
+
 
 class LanguageDetector:
-    def __init__(self):
-        """
-        Khởi tạo bộ phát hiện ngôn ngữ sử dụng langdetect.
-        """
-        self.lang_dict = {
-            "aa": "Afar",
-            "ab": "Abkhazian",
-            "ae": "Avestan",
-            "af": "Afrikaans",
-            "ak": "Akan",
-            "am": "Amharic",
-            "an": "Aragonese",
-            "ar": "Arabic",
-            "as": "Assamese",
-            "av": "Avaric",
-            "ay": "Aymara",
-            "az": "Azerbaijani",
-            "ba": "Bashkir",
-            "be": "Belarusian",
-            "bg": "Bulgarian",
-            "bi": "Bislama",
-            "bm": "Bambara",
-            "bn": "Bengali",
-            "bo": "Tibetan",
-            "br": "Breton",
-            "bs": "Bosnian",
-            "ca": "Catalan",
-            "ce": "Chechen",
-            "ch": "Chamorro",
-            "co": "Corsican",
-            "cr": "Cree",
-            "cs": "Czech",
-            "cu": "Church Slavic",
-            "cv": "Chuvash",
-            "cy": "Welsh",
-            "da": "Danish",
-            "de": "German",
-            "dv": "Divehi",
-            "dz": "Dzongkha",
-            "ee": "Ewe",
-            "el": "Greek",
-            "en": "English",
-            "eo": "Esperanto",
-            "es": "Spanish",
-            "et": "Estonian",
-            "eu": "Basque",
-            "fa": "Persian",
-            "ff": "Fulah",
-            "fi": "Finnish",
-            "fj": "Fijian",
-            "fo": "Faroese",
-            "fr": "French",
-            "fy": "Western Frisian",
-            "ga": "Irish",
-            "gd": "Gaelic",
-            "gl": "Galician",
-            "gn": "Guarani",
-            "gu": "Gujarati",
-            "gv": "Manx",
-            "ha": "Hausa",
-            "he": "Hebrew",
-            "hi": "Hindi",
-            "ho": "Hiri Motu",
-            "hr": "Croatian",
-            "ht": "Haitian",
-            "hu": "Hungarian",
-            "hy": "Armenian",
-            "hz": "Herero",
-            "ia": "Interlingua",
-            "id": "Indonesian",
-            "ie": "Interlingue",
-            "ig": "Igbo",
-            "ii": "Sichuan Yi",
-            "ik": "Inupiaq",
-            "io": "Ido",
-            "is": "Icelandic",
-            "it": "Italian",
-            "iu": "Inuktitut",
-            "ja": "Japanese",
-            "jv": "Javanese",
-            "ka": "Georgian",
-            "kg": "Kongo",
-            "ki": "Kikuyu",
-            "kj": "Kuanyama",
-            "kk": "Kazakh",
-            "kl": "Kalaallisut",
-            "km": "Central Khmer",
-            "kn": "Kannada",
-            "ko": "Korean",
-            "kr": "Kanuri",
-            "ks": "Kashmiri",
-            "ku": "Kurdish",
-            "kv": "Komi",
-            "kw": "Cornish",
-            "ky": "Kirghiz",
-            "la": "Latin",
-            "lb": "Luxembourgish",
-            "lg": "Ganda",
-            "li": "Limburgan",
-            "ln": "Lingala",
-            "lo": "Lao",
-            "lt": "Lithuanian",
-            "lu": "Luba-Katanga",
-            "lv": "Latvian",
-            "mg": "Malagasy",
-            "mh": "Marshallese",
-            "mi": "Maori",
-            "mk": "Macedonian",
-            "ml": "Malayalam",
-            "mn": "Mongolian",
-            "mr": "Marathi",
-            "ms": "Malay",
-            "mt": "Maltese",
-            "my": "Burmese",
-            "na": "Nauru",
-            "nb": "Bokmål, Norwegian",
-            "nd": "Ndebele, North",
-            "ne": "Nepali",
-            "ng": "Ndonga",
-            "nl": "Dutch",
-            "nn": "Norwegian Nynorsk",
-            "no": "Norwegian",
-            "nr": "Ndebele, South",
-            "nv": "Navajo",
-            "ny": "Chichewa",
-            "oc": "Occitan",
-            "oj": "Ojibwa",
-            "om": "Oromo",
-            "or": "Oriya",
-            "os": "Ossetian",
-            "pa": "Panjabi",
-            "pi": "Pali",
-            "pl": "Polish",
-            "ps": "Pushto",
-            "pt": "Portuguese",
-            "qu": "Quechua",
-            "rm": "Romansh",
-            "rn": "Rundi",
-            "ro": "Romanian",
-            "ru": "Russian",
-            "rw": "Kinyarwanda",
-            "sa": "Sanskrit",
-            "sc": "Sardinian",
-            "sd": "Sindhi",
-            "se": "Northern Sami",
-            "sg": "Sango",
-            "si": "Sinhala",
-            "sk": "Slovak",
-            "sl": "Slovenian",
-            "sm": "Samoan",
-            "sn": "Shona",
-            "so": "Somali",
-            "sq": "Albanian",
-            "sr": "Serbian",
-            "ss": "Swati",
-            "st": "Sotho, Southern",
-            "su": "Sundanese",
-            "sv": "Swedish",
-            "sw": "Swahili",
-            "ta": "Tamil",
-            "te": "Telugu",
-            "tg": "Tajik",
-            "th": "Thai",
-            "ti": "Tigrinya",
-            "tk": "Turkmen",
-            "tl": "Tagalog",
-            "tn": "Tswana",
-            "to": "Tonga",
-            "tr": "Turkish",
-            "ts": "Tsonga",
-            "tt": "Tatar",
-            "tw": "Twi",
-            "ty": "Tahitian",
-            "ug": "Uighur",
-            "uk": "Ukrainian",
-            "ur": "Urdu",
-            "uz": "Uzbek",
-            "ve": "Venda",
-            "vi": "Vietnamese",
-            "vo": "Volapük",
-            "wa": "Walloon",
-            "wo": "Wolof",
-            "xh": "Xhosa",
-            "yi": "Yiddish",
-            "yo": "Yoruba",
-            "za": "Zhuang",
-            "zh": "Chinese",
-            "zu": "Zulu"
-            }
-    
-    def detect(self, text):
+    """
+    Bộ phát hiện ngôn ngữ dùng chung toàn process (xem ai_deps.get_language_detector).
+
+    Thứ tự: fast path theo script -> ngôn ngữ đã biết của conversation -> LRU(langdetect).
+    """
+
+    def __init__(self, cache_size: int = 2048, max_conversations: int = 10000):
+        self.lang_dict = LANG_DICT
+        self._cached_detect = lru_cache(maxsize=cache_size)(self._detect_code)
+        self._conversation_langs: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._max_conversations = max_conversations
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _detect_code(normalized: str) -> str:
+        return detect(normalized)
+
+    def _remember(self, conversation_id: Hashable, code: str) -> None:
+        with self._lock:
+            self._conversation_langs[conversation_id] = code
+            self._conversation_langs.move_to_end(conversation_id)
+            while len(self._conversation_langs) > self._max_conversations:
+                self._conversation_langs.popitem(last=False)
+
+    def _recall(self, conversation_id: Hashable) -> Optional[str]:
+        with self._lock:
+            return self._conversation_langs.get(conversation_id)
+
+    def detect(self, text, conversation_id: Optional[Hashable] = None):
         """
         Phát hiện ngôn ngữ của văn bản đầu vào.
         
         Args:
             text: Văn bản cần phát hiện ngôn ngữ
+            conversation_id: Nếu truyền, ngôn ngữ được ghi nhớ theo conversation và
+                dùng lại khi fast path không kết luận được (bỏ qua langdetect)
         
         Returns:
-            Mã ngôn ngữ phát hiện được (ví dụ: 'en', 'vi', ...)
+            Tên ngôn ngữ phát hiện được (ví dụ: 'English', 'Vietnamese', ...)
         """
-        language = detect(text)
+        normalized = normalize_text(text)
+
+        language = detect_by_script(normalized)
+        if language is None and conversation_id is not None:
+            language = self._recall(conversation_id)
+        if language is None:
+            language = self._cached_detect(normalized)
+
+        if conversation_id is not None:
+            self._remember(conversation_id, language)
+
         language_name = self.lang_dict.get(language, "Unknown")
-        print(f"Detected language response: {language_name}")
-        return language_name
\ No newline at end of file
+        logger.debug("Detected language response: %s", language_name)
+        return language_name
+
+    def cache_info(self):
+        """Thống kê LRU cache (hits, misses, maxsize, currsize)."""
+        return self._cached_detect.cache_info()
\ No newline at end of file
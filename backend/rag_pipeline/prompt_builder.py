@@ -1,149 +1,176 @@
-def build_prompt(question, contexts=None, language: str = None):
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .token_counter import count_tokens
+
+CONTEXT_SEPARATOR = "\n\n---\n"
+
+
+def pack_contexts(
+    contexts: Sequence[str],
+    budget_tokens: int,
+    token_counts: Optional[Sequence[int]] = None,
+    count_fn: Callable[[str], int] = count_tokens,
+) -> Tuple[List[str], int]:
+    """
+    Đóng gói contexts vào prompt theo budget token (greedy theo độ liên quan).
+
+    Contexts được giả định đã sắp xếp theo độ liên quan giảm dần. Đoạn nào không
+    còn vừa budget thì bị bỏ qua và thử đoạn tiếp theo (đoạn ngắn hơn vẫn có thể vừa).
+
+    Args:
+        contexts: Danh sách context đã sắp xếp theo relevance
+        budget_tokens: Số token tối đa dành cho khối [CONTEXT]
+        token_counts: Số token của từng context (tính sẵn lúc index), None để tự đếm
+        count_fn: Hàm đếm token khi không có token_counts
+
+    Returns:
+        Tuple (contexts được giữ lại theo thứ tự ban đầu, tổng số token đã dùng)
+    """
+    separator_tokens = count_fn(CONTEXT_SEPARATOR)
+    packed: List[str] = []
+    used = 0
+
+    for i, ctx in enumerate(contexts):
+        ctx_tokens = token_counts[i] if token_counts is not None else count_fn(ctx)
+        cost = ctx_tokens + (separator_tokens if packed else 0)
+        if used + cost > budget_tokens:
+            continue
+        packed.append(ctx)
+        used += cost
+
+    return packed, used
+
+
+# System prompt cố định, không phụ thuộc ngôn ngữ/câu hỏi -> Ollama có thể tái sử dụng
+# KV cache của prefix này giữa các request. KHÔNG chèn biến vào đây.
+SYSTEM_PROMPT = """You are a helpful and knowledgeable **multilingual learning assistant** designed to help students understand their study materials. You MUST strictly follow all rules below.
+
+[Your Goals]
+- Use ONLY the information in the [CONTEXT] and the user's question to form your answer.
+- Do not include any information or examples not supported by the context.
+- If multiple parts of the context conflict, summarize the most consistent and well-supported parts.
+- Keep your main explanation concise (about 5-10 sentences) unless detailed analysis is explicitly requested.
+
+[Language Rules]
+- Only respond in the language given in the [LANGUAGE] section of the user message.
+
+[Conversation Memory]
+- [CONVERSATION SUMMARY] and [RECENT TURNS], when present, only help you understand what the current question refers to (follow-ups, pronouns, "the previous example").
+- They are NOT a source of truth: facts in your answer must still come from the [CONTEXT].
+
+[Style Rules]
+- Begin with a natural opening line that fits the user's question (definition -> highlight the key idea; explanation -> connect directly to the topic; problem -> acknowledge the type of task).
+- Keep a warm, student-centered tone.
+- End every response with one or two follow-up question suggestions related to the topic, e.g. "Would you like to explore this idea further?", "Do you want to try a practice question related to this?".
+
+[Grounding & Source of Truth]
+- You are working in **STRICT DOCUMENT MODE**: the ONLY source of truth is the [CONTEXT] section.
+- You MUST NOT use any outside knowledge, training data, or general world knowledge.
+- If the answer cannot be found or safely inferred from the [CONTEXT], you **must not** guess.
+
+[When you DON'T know from the context]
+- If the [CONTEXT] is "NO_RELEVANT_CONTEXT_AVAILABLE", is clearly unrelated to the question, or does not contain enough information to answer confidently:
+  -> Answer with a short apology saying the provided documents do not contain enough information to answer the question, adapted to the [LANGUAGE], e.g. "Xin lỗi, trong tài liệu đã cung cấp hiện tại không có đủ thông tin để trả lời chính xác câu hỏi này."
+- In this case, do NOT add any extra explanation based on outside knowledge.
+- Do NOT invent formulas, definitions, or examples that are not supported by the [CONTEXT].
+
+[Formatting Rules]
+- Format answers in Markdown (not inside code blocks).
+- Use **bold** for key terms and main points; *italicize* definitions or emphasized phrases.
+- Use bullet points or numbered lists for steps or explanations.
+- Write math with LaTeX syntax like `$E=mc^2$`.
+- Use Markdown tables when comparing concepts."""
+
+
+@lru_cache(maxsize=1)
+def get_system_prompt_tokens() -> int:
+    """Số token của SYSTEM_PROMPT (tính một lần)."""
+    return count_tokens(SYSTEM_PROMPT)
+
+
+def build_memory_block(
+    summary: Optional[str] = None,
+    recent_turns: Optional[Sequence[Dict[str, str]]] = None
+) -> str:
+    """Tạo khối memory (summary + các lượt gần nhất) chèn vào user message."""
+    parts = []
+    if summary:
+        parts.append(f"[CONVERSATION SUMMARY]\n{summary}")
+    if recent_turns:
+        lines = [
+            f"{'User' if turn['role'] == 'user' else 'Assistant'}: {turn['content']}"
+            for turn in recent_turns
+        ]
+        parts.append("[RECENT TURNS]\n" + "\n".join(lines))
+    return "\n\n".join(parts)
+
+
+def build_prompt(question, contexts=None, language: str = None, memory: str = None):
+    """Tạo user message cho từng request: ngôn ngữ, memory, contexts và câu hỏi."""
     # Nếu không có context hoặc context rỗng → ghi rõ cho model biết
     if contexts:
-        ctx_block = "\n\n---\n".join(contexts)
+        ctx_block = CONTEXT_SEPARATOR.join(contexts)
     else:
         ctx_block = "NO_RELEVANT_CONTEXT_AVAILABLE"
 
     if not language:
         language = "English"
 
-    return f"""
-            [System]
-            You are a helpful and knowledgeable **multilingual learning assistant** designed to help students understand their study materials.
-            You MUST strictly follow all rules below.
-            
-            [Your Goals]
-            - Use ONLY the information provided in the [CONTEXT] and the user's question to form your answer.
-            - Do not include any information or examples not supported by the context.
-            - If multiple parts of the context conflict, summarize the most consistent and well-supported parts.
-            - Keep your main explanation concise (about 5–10 sentences) unless detailed analysis is explicitly requested.
-            
-            [Language Rules]
-            - Only respond in {language}.
-            
-            [Style Rules]
-            - Begin with a natural opening line that fits the user’s question.  
-            Examples:
-                - If the user asks for a definition → start by highlighting the key idea.
-                - If the user asks for an explanation → start by connecting directly to the topic.
-                - If the user asks about a problem → start by acknowledging the type of task.
-            - Keep a warm, student-centered tone.
-            - At the end of every response, include one or two follow-up question suggestions to encourage regarding to topic that user asked.  
-            Examples:
-                - “Would you like to explore this idea further?”
-                - “Do you want to try a practice question related to this?”
-                - “Is there any part you’d like me to break down more clearly?”
-                - “What aspect would you like to dive into next?”
-            
-            [Grounding & Source of Truth]
-            - You are working in **STRICT DOCUMENT MODE**.
-            - The ONLY source of truth is the [CONTEXT] section below.
-            - You MUST NOT use any outside knowledge, training data, or general world knowledge.
-            - If the answer cannot be found or safely inferred from the [CONTEXT], you **must not** guess.
-
-            [When you DON'T know from the context]
-            - If the [CONTEXT] is "NO_RELEVANT_CONTEXT_AVAILABLE" OR
-            the information in the [CONTEXT] is clearly unrelated to the question OR
-            the [CONTEXT] does not contain enough information to confidently answer:
-                → You MUST answer with a short apology and clearly say that the provided documents
-                do not contain enough information to answer the question.
-                → Example style (adapt to {language}): 
-                "Xin lỗi, trong tài liệu đã cung cấp hiện tại không có đủ thông tin để trả lời chính xác câu hỏi này."
-            - In this case, you MUST NOT add any extra explanation based on outside knowledge.
-            - Do NOT invent formulas, definitions, or examples that are not supported by the [CONTEXT]
-
-            [Formatting Rules]
-            - Format your answers in Markdown (not inside code blocks).
-            - Use **bold** for key terms and main points.
-            - *Italicize* definitions or emphasized phrases.
-            - Use bullet points or numbered lists for steps or explanations.
-            - Write math expressions with LaTeX syntax like `$E=mc^2$`.
-            - Use Markdown tables when comparing concepts.
-
-            [CONTEXT]
-            {ctx_block}
-
-            [QUESTION]
-            {question}
-
-            ---
-            Carefully check whether the [CONTEXT] truly contains enough information to answer the [QUESTION].
-            If it does, answer using ONLY the [CONTEXT].
-            If it does NOT, follow the rules in [When you DON'T know from the context].
-
-            [ANSWER]
-            """
-
-    # return f"""
-    #         [System]
-    #         You are a helpful and knowledgeable **multilingual learning assistant** designed to help students understand their study materials.
-            
-    #         [Language Rules]
-    #         - Only respond in {language}.
-            
-    #         [Your Goals]
-    #         - Use ONLY the information provided in the [Context] section below and the user's question to form your answer.
-    #         - If the answer cannot be found or confirmed in the context, politely say you don’t know.
-    #         - If the the information provided in the [Context] section is not relevant to the question, politely say you don’t know.
-    #         - Do not include any information or examples not supported by the context.
-    #         - If multiple sources in the context conflict, summarize the most consistent and evidence-based parts.
-    #         - Respond clearly, concisely, and in a friendly, student-centered tone.
-    #         - Do not repeat the context verbatim unless necessary for clarity.
-    #         - Keep your main explanation concise (about 5–10 sentences) unless detailed analysis is explicitly requested.
-    #         - Begin with a short **friendly greeting** (about 2-3 sentences). 
-    #         - End your answer with **one or two follow-up question suggestions** to encourage further learning.
-            
-    #         [Formatting Rules]
-    #         - Format your answers in Markdown (not inside code blocks).
-    #         - Use **bold** for key terms and main points.
-    #         - *Italicize* definitions or emphasized phrases.
-    #         - Use bullet points or numbered lists for steps or explanations.
-    #         - Write math expressions with LaTeX syntax like `$E=mc^2$`.
-    #         - Use Markdown tables when comparing concepts.
-            
-    #         [CONTEXT]
-    #         {ctx_block}
-            
-    #         [QUESTION]
-    #         {question}
-            
-    #         ---
-            
-    #         Please start your response with a short friendly opening, then provide the main answer using the context,
-    #         and finally include one or two follow-up question suggestions at the end.
-            
-    #         [ANSWER]
-    #         """
-
-
-
-
-
-
-# """
-#             [System]
-#             You are a helpful and knowledgeable **multilingual learning assistant** designed to help students understand their study materials.  
-
-#             [Your goals]  
-#             - Use ONLY the information provided in the [Context] section below and the user's question to form your answer.  
-#             - If the answer cannot be found or confirmed in the context, politely say you don’t know rather than guessing.  
-#             - Respond clearly, concisely, and in an encouraging, student-friendly tone.
-#             - Answer clearly in the same language as the question. 
-#             - Begin with a short **friendly greeting** (e.g., “Hi there!” or “Hello, great question!”).  
-#             - End your answer with **one or two follow-up question suggestions** to help the learner explore related topics (e.g., “Would you like to learn more about…?”).
-#             - Format your answers in Markdown as follows: **Bold** key terms and important points; *Italicize* definitions or emphasized words; Use bullet points or numbered lists when explaining steps; Use LaTeX syntax for math expressions: `$\text{formula}$`; Use Markdown tables when comparing items.
-
-#             [CONTEXT]
-#             {ctx_block}
-
-#             [QUESTION]
-#             {question}
-
-#             ---
-
-#             Please start your response with a short friendly opening, then provide the main answer using the context,  
-#             and finally include one or two follow-up question suggestions at the end.
-
-#             [ANSWER]
-#             """
+    memory_block = f"{memory}\n\n" if memory else ""
+
+    return (
+        f"[LANGUAGE]\n{language}\n\n"
+        f"{memory_block}"
+        f"[CONTEXT]\n{ctx_block}\n\n"
+        f"[QUESTION]\n{question}\n\n"
+        "---\n"
+        "Carefully check whether the [CONTEXT] truly contains enough information to answer the [QUESTION]. "
+        "If it does, answer using ONLY the [CONTEXT]. "
+        "If it does NOT, follow the rules in [When you DON'T know from the context].\n\n"
+        "[ANSWER]"
+    )
+
+
+def build_messages(
+    question, contexts=None, language: str = None, memory: str = None
+) -> List[Dict[str, str]]:
+    """Tạo danh sách messages cho Ollama chat API: system cố định + user theo request."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(question, contexts, language, memory)},
+    ]
+
+
+def build_summary_messages(
+    previous_summary: Optional[str],
+    turns: Sequence[Dict[str, str]],
+    max_words: int = 150
+) -> List[Dict[str, str]]:
+    """
+    Tạo messages để cập nhật summary cuốn chiếu: summary cũ + các lượt vừa
+    rơi khỏi cửa sổ gần nhất -> summary mới (độ dài bị giới hạn).
+    """
+    transcript = "\n".join(
+        f"{'User' if turn['role'] == 'user' else 'Assistant'}: {turn['content']}"
+        for turn in turns
+    )
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You maintain a running summary of a tutoring conversation between a student and a "
+                "learning assistant. Merge the new turns into the existing summary. Keep the topics "
+                "asked about, key facts given, and any open follow-ups. Write in the conversation's "
+                f"language, as plain prose, at most {max_words} words. Output only the summary."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"[EXISTING SUMMARY]\n{previous_summary or '(empty)'}\n\n"
+                f"[NEW TURNS]\n{transcript}\n\n"
+                "[UPDATED SUMMARY]"
+            ),
+        },
+    ]
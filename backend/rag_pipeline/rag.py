@@ -1,19 +1,36 @@
 """
 RAG Pipeline - Kết nối các components thành pipeline hoàn chỉnh
 """
-from typing import Generator, List, Dict, Any, Optional
+from typing import Generator, Iterator, List, Dict, Any, Optional
+import logging
+import re
+import time
+
 from ..config import settings
-from ..ai_deps import get_embedder, get_reranker
+from ..ai_deps import get_embedder, get_reranker, get_language_detector
+from ..metrics import RAG_IN_FLIGHT, observe_rag_request
 
 # Import các components
 from .embedder import Embedder
-from .vector_store import VectorStore
+from .vector_store import VectorStore, store_exists
 from .retriever import Retriever
+from .text_analyzer import get_analyzer
 from .generator import generate_answer, generate_answer_stream
-from .language_detector import LanguageDetector
-from .prompt_builder import build_prompt
+from .prompt_builder import (
+    build_prompt,
+    build_messages,
+    build_memory_block,
+    pack_contexts,
+    get_system_prompt_tokens,
+)
+from .token_counter import count_tokens
 from .reranker import Reranker
 
+logger = logging.getLogger(__name__)
+
+# Chunk id ở cuối dòng header do RAGRetriever._format_context tạo ra
+CONTEXT_CHUNK_ID_RE = re.compile(r"(?:^\[|\| )Chunk: ([^|\]]+)\]$")
+
 
 class RAGRetriever:
     """
@@ -41,10 +58,18 @@ class RAGRetriever:
         self.retriever = Retriever(
             store_path=index_path,
             meta_path=meta_path,
-            embedder=self.embedder
+            embedder=self.embedder,
+            analyzer=get_analyzer(settings.BM25_ANALYZER),
+            mmap=settings.VECTOR_INDEX_MMAP
         )
+        # Index nén (fp16 / sq8 / pq): số ứng viên được re-score bằng vector fp32
+        self.retriever.store.rescore_factor = settings.VECTOR_RESCORE_FACTOR
+        
+        # Số token của context đã format theo chunk id (dùng cho prompt packing);
+        # bị chặn bởi số chunk của store
+        self._token_counts: Dict[str, int] = {}
         
-        print(f"✅ Retriever initialized with {len(self.retriever.store.documents)} chunks")
+        logger.info("Retriever initialized with %d chunks", len(self.retriever.store.documents))
     
     @staticmethod
     def _format_context(doc: Dict[str, Any]) -> str:
@@ -68,13 +93,49 @@ class RAGRetriever:
         meta_line = " | ".join(source_parts) if source_parts else "Source: unknown"
         return f"[{meta_line}]\n{doc.get('text', '')}"
     
+    @staticmethod
+    def _context_chunk_id(context: str) -> Optional[str]:
+        match = CONTEXT_CHUNK_ID_RE.search(context.split("\n", 1)[0])
+        return match.group(1) if match else None
+    
+    def _format_and_count(self, doc: Dict[str, Any]) -> str:
+        """Format context và ghi nhớ số token theo chunk id (ưu tiên token_count tính sẵn lúc index)."""
+        context = self._format_context(doc)
+        chunk_id = self._context_chunk_id(context)
+        if chunk_id is not None and chunk_id not in self._token_counts:
+            text = doc.get("text", "")
+            chunk_tokens = doc.get("metadata", {}).get("token_count")
+            if chunk_tokens is None:
+                chunk_tokens = count_tokens(text)
+            header = context[: len(context) - len(text)]
+            self._token_counts[chunk_id] = chunk_tokens + count_tokens(header)
+        return context
+    
+    def count_context_tokens(self, context: str) -> int:
+        """Số token của một context do retriever trả về."""
+        chunk_id = self._context_chunk_id(context)
+        tokens = self._token_counts.get(chunk_id) if chunk_id is not None else None
+        return tokens if tokens is not None else count_tokens(context)
+    
+    @staticmethod
+    def _cascade_kwargs() -> Dict[str, Any]:
+        """Ngưỡng retrieval cascade từ settings (rỗng nếu cascade tắt)."""
+        if not settings.RETRIEVAL_CASCADE:
+            return {}
+        return {
+            "cascade_min_top1": settings.CASCADE_MIN_TOP1,
+            "cascade_min_margin": settings.CASCADE_MIN_MARGIN,
+            "cascade_capped_k": settings.CASCADE_CAPPED_K,
+        }
+
     def retrieve(
         self, 
         question: str, 
         k_semantic: int = None,
         k_keyword: int = None,
         use_validation: bool = True,
-        allowed_document_ids: Optional[set[int]] = None
+        allowed_document_ids: Optional[set[int]] = None,
+        stats: Optional[Dict[str, Any]] = None
     ) -> Optional[List[str]]:
         """
         Retrieve relevant contexts cho câu hỏi
@@ -84,6 +145,7 @@ class RAGRetriever:
             k_semantic: Số lượng contexts từ semantic search
             k_keyword: Số lượng contexts từ keyword search
             use_validation: Có validate relevance không
+            stats: Dict (optional) để ghi thời gian embed / FAISS / BM25 / fusion
             
         Returns:
             List[str]: Danh sách text contexts, hoặc None nếu không tìm thấy
@@ -104,7 +166,9 @@ class RAGRetriever:
                     semantic_threshold=settings.SIMILARITY_THRESHOLD,
                     bm25_threshold=settings.BM25_THRESHOLD,
                     min_results=1,
-                    bm25_min_top1=1.0
+                    bm25_min_top1=1.0,
+                    stats=stats,
+                    **self._cascade_kwargs()
                 )
             else:
                 # Retrieve bình thường
@@ -115,7 +179,9 @@ class RAGRetriever:
                     semantic_threshold=settings.SIMILARITY_THRESHOLD,
                     bm25_threshold=settings.BM25_THRESHOLD,
                     min_results=1,
-                    bm25_min_top1=1.0
+                    bm25_min_top1=1.0,
+                    stats=stats,
+                    **self._cascade_kwargs()
                 )
                 if not is_relevant:
                     contexts = None
@@ -129,12 +195,12 @@ class RAGRetriever:
                     ]
             
             if contexts:
-                contexts = [self._format_context(doc) for doc in contexts]
+                contexts = [self._format_and_count(doc) for doc in contexts]
             
             return contexts
             
         except Exception as e:
-            print(f"❌ Error in retrieval: {e}")
+            logger.exception("Error in retrieval: %s", e)
             return None
 
 
@@ -153,6 +219,23 @@ def create_retriever(index_path: str, meta_path: str, embedder: Embedder = None)
     return RAGRetriever(index_path, meta_path, embedder)
 
 
+def get_context_token_budget(question: str, language: str = None, memory: str = None) -> int:
+    """
+    Tính budget token cho khối [CONTEXT] từ context window của model.
+    
+    budget = LLM_NUM_CTX - LLM_MAX_ANSWER_TOKENS - token của phần prompt cố định
+    (system prompt + user message không có context, gồm cả memory). Nếu
+    CONTEXT_TOKEN_BUDGET > 0 thì dùng làm giới hạn trên.
+    """
+    overhead = get_system_prompt_tokens() + count_tokens(
+        build_prompt(question=question, contexts=None, language=language, memory=memory)
+    )
+    budget = settings.LLM_NUM_CTX - settings.LLM_MAX_ANSWER_TOKENS - overhead
+    if settings.CONTEXT_TOKEN_BUDGET > 0:
+        budget = min(budget, settings.CONTEXT_TOKEN_BUDGET)
+    return max(budget, 0)
+
+
 def answer_question_with_store(
     question: str,
     retriever: RAGRetriever,
@@ -162,8 +245,12 @@ def answer_question_with_store(
     detect_language: bool = True,
     model: str = None,
     temperature: float = None,
-    allowed_document_ids: Optional[set[int]] = None
-) -> str | Generator[str, None, None]:
+    allowed_document_ids: Optional[set[int]] = None,
+    conversation_id: Optional[int] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    conversation_summary: Optional[str] = None,
+    recent_turns: Optional[List[Dict[str, str]]] = None
+) -> str | Iterator[str]:
     """
     RAG Pipeline hoàn chỉnh: Retrieve + Generate
     
@@ -176,28 +263,134 @@ def answer_question_with_store(
         detect_language: Có tự động detect ngôn ngữ không
         model: LLM model name (override config)
         temperature: Temperature cho generation (override config)
+        allowed_document_ids: Chỉ giữ contexts thuộc các document này
+        conversation_id: Dùng lại ngôn ngữ đã phát hiện của conversation khi câu hỏi mơ hồ
+        stats: Dict (optional) để ghi lại thống kê của request (token của prompt, contexts...)
+        conversation_summary: Summary cuốn chiếu của các lượt cũ (conversation memory)
+        recent_turns: Các lượt gần nhất [{"role", "content"}] đưa nguyên văn vào prompt
         
     Returns:
         str nếu streaming=False
-        Generator[str] nếu streaming=True
+        Iterator[str] nếu streaming=True
+        
+    Raises:
+        GenerationError: Ollama lỗi (khi streaming: raise trong lúc đọc iterator).
+                         stats["outcome"] = "error" trong cả hai trường hợp.
     """
-    print(f"\n{'='*60}")
-    print(f"📝 Question: {question}")
-    print(f"{'='*60}\n")
+    if stats is None:
+        stats = {}
+    started = time.perf_counter()
+    RAG_IN_FLIGHT.inc()
+    try:
+        answer = _answer_question(
+            question=question,
+            retriever=retriever,
+            streaming=streaming,
+            use_reranker=use_reranker,
+            reranker_top_k=reranker_top_k,
+            detect_language=detect_language,
+            model=model,
+            temperature=temperature,
+            allowed_document_ids=allowed_document_ids,
+            conversation_id=conversation_id,
+            stats=stats,
+            conversation_summary=conversation_summary,
+            recent_turns=recent_turns
+        )
+    except Exception:
+        stats["outcome"] = "error"
+        _finish_request(stats, started)
+        raise
+    
+    if streaming:
+        return _ObservedStream(answer, stats, started)
+    
+    _finish_request(stats, started)
+    return answer
+
+
+def _finish_request(stats: Dict[str, Any], started: float) -> None:
+    """Ghi tổng thời gian và đẩy thống kê của request vào metrics."""
+    stats["total_ms"] = (time.perf_counter() - started) * 1000
+    RAG_IN_FLIGHT.dec()
+    observe_rag_request(stats, outcome=stats.get("outcome", "answered"))
+
+
+class _ObservedStream:
+    """
+    Bọc iterator streaming: metrics được ghi đúng một lần khi stream hết, lỗi
+    (outcome="error"), bị close() hoặc bị thu hồi mà chưa đọc lần nào
+    (finally của một generator chưa chạy thì không bao giờ được gọi).
+    """
+    
+    def __init__(self, chunks: Iterator[str], stats: Dict[str, Any], started: float):
+        self._chunks = chunks
+        self._stats = stats
+        self._started = started
+        self._finished = False
+    
+    def __iter__(self) -> "_ObservedStream":
+        return self
+    
+    def __next__(self) -> str:
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception:
+            self._stats["outcome"] = "error"
+            self._finish()
+            raise
+    
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+        self._finish()
+    
+    def __del__(self):
+        self._finish()
+    
+    def _finish(self) -> None:
+        if not self._finished:
+            self._finished = True
+            _finish_request(self._stats, self._started)
+
+
+def _answer_question(
+    question: str,
+    retriever: RAGRetriever,
+    streaming: bool,
+    use_reranker: bool,
+    reranker_top_k: int,
+    detect_language: bool,
+    model: Optional[str],
+    temperature: Optional[float],
+    allowed_document_ids: Optional[set[int]],
+    conversation_id: Optional[int],
+    stats: Dict[str, Any],
+    conversation_summary: Optional[str],
+    recent_turns: Optional[List[Dict[str, str]]]
+) -> str | Generator[str, None, None]:
+    """Các bước của answer_question_with_store (retrieve -> rerank -> detect -> prompt -> generate)."""
+    logger.debug("Question: %s", question)
     
     # Step 1: Retrieve contexts
-    print("🔍 Step 1: Retrieving contexts...")
+    logger.debug("Step 1: Retrieving contexts...")
     contexts = retriever.retrieve(
         question=question,
         k_semantic=settings.TOP_K_RETRIEVE,
         k_keyword=settings.TOP_K_RETRIEVE,
         use_validation=True,
-        allowed_document_ids=allowed_document_ids
+        allowed_document_ids=allowed_document_ids,
+        stats=stats
     )
     
     # Kiểm tra contexts
     if not contexts or len(contexts) == 0:
-        print("⚠️  No relevant contexts found")
+        logger.info("No relevant contexts found")
+        stats["outcome"] = "no_context"
         no_context_answer = (
             "Xin lỗi, tôi không tìm thấy thông tin liên quan trong tài liệu "
             "để trả lời câu hỏi này. Vui lòng thử hỏi theo cách khác hoặc "
@@ -212,11 +405,12 @@ def answer_question_with_store(
         else:
             return no_context_answer
     
-    print(f"✅ Found {len(contexts)} contexts")
+    logger.debug("Found %d contexts", len(contexts))
     
     # Step 2: Rerank contexts (optional)
     if use_reranker and len(contexts) > reranker_top_k:
-        print(f"\n🎯 Step 2: Reranking contexts (top {reranker_top_k})...")
+        logger.debug("Step 2: Reranking contexts (top %d)...", reranker_top_k)
+        t0 = time.perf_counter()
         try:
             reranker = get_reranker()
             contexts = reranker.rerank(
@@ -226,72 +420,92 @@ def answer_question_with_store(
                 score_threshold=0.3,
                 return_scores=False
             )
-            print(f"✅ Reranked to {len(contexts)} contexts")
+            logger.debug("Reranked to %d contexts", len(contexts))
         except Exception as e:
-            print(f"⚠️  Reranking failed: {e}. Using original contexts.")
+            logger.warning("Reranking failed: %s. Using original contexts.", e)
+        stats["rerank_ms"] = (time.perf_counter() - t0) * 1000
     else:
-        print(f"\n⏭️  Step 2: Skipping reranker")
+        logger.debug("Step 2: Skipping reranker")
     
     # Step 3: Detect language
     language = "Vietnamese"  # Default
     if detect_language:
-        print(f"\n🌍 Step 3: Detecting language...")
+        logger.debug("Step 3: Detecting language...")
+        t0 = time.perf_counter()
         try:
-            detector = LanguageDetector()
-            language = detector.detect(question)
-            print(f"✅ Detected language: {language}")
+            detector = get_language_detector()
+            language = detector.detect(question, conversation_id=conversation_id)
+            logger.debug("Detected language: %s", language)
         except Exception as e:
-            print(f"⚠️  Language detection failed: {e}. Using default: Vietnamese")
+            logger.warning("Language detection failed: %s. Using default: Vietnamese", e)
+        stats["detect_ms"] = (time.perf_counter() - t0) * 1000
     else:
-        print(f"\n⏭️  Step 3: Using default language: Vietnamese")
+        logger.debug("Step 3: Using default language: Vietnamese")
     
-    # Step 4: Build prompt
-    print(f"\n📋 Step 4: Building prompt...")
-    prompt = build_prompt(
+    # Step 4: Build prompt (đóng gói contexts theo budget token)
+    logger.debug("Step 4: Building prompt...")
+    t0 = time.perf_counter()
+    memory = build_memory_block(conversation_summary, recent_turns)
+    context_budget = get_context_token_budget(question, language, memory)
+    packed_contexts, context_tokens = pack_contexts(
+        contexts,
+        budget_tokens=context_budget,
+        token_counts=[retriever.count_context_tokens(ctx) for ctx in contexts]
+    )
+    messages = build_messages(
         question=question,
-        contexts=contexts,
-        language=language
+        contexts=packed_contexts,
+        language=language,
+        memory=memory
+    )
+    user_prompt = messages[-1]["content"]
+    prompt_tokens = get_system_prompt_tokens() + count_tokens(user_prompt)
+    logger.debug(
+        "Prompt built (%d chars, ~%d tokens, %d/%d contexts, context %d/%d tokens)",
+        len(user_prompt), prompt_tokens, len(packed_contexts), len(contexts),
+        context_tokens, context_budget
+    )
+    
+    stats.update(
+        {
+            "prompt_build_ms": (time.perf_counter() - t0) * 1000,
+            "prompt_tokens": prompt_tokens,
+            "context_tokens": context_tokens,
+            "context_budget": context_budget,
+            "contexts_packed": len(packed_contexts),
+            "packed_contexts": packed_contexts,
+            "contexts_dropped": len(contexts) - len(packed_contexts),
+        }
     )
-    print(f"✅ Prompt built ({len(prompt)} chars)")
     
     # Step 5: Generate answer
     target_model = model or settings.LLM_MODEL
     
-    print(f"\n🤖 Step 5: Generating answer...")
-    print(f"   Model: {target_model}")
-    print(f"   Streaming: {streaming}")
+    logger.debug("Step 5: Generating answer (model=%s, streaming=%s)", target_model, streaming)
     
-    try:
-        if streaming:
-            print("✅ Streaming response started\n")
-            # Luôn truyền target_model vào hàm
-            return generate_answer_stream(
-                prompt, 
-                model=target_model, 
-                temperature=temperature or settings.GENERATOR_TEMPERATURE
-            )
-        else:
-            # Luôn truyền target_model vào hàm
-            answer = generate_answer(
-                prompt, 
-                model=target_model
-            )
-            print(f"✅ Answer generated ({len(answer)} chars)\n")
-            return answer
-            
-    except Exception as e:
-        print(f"❌ Generation failed: {e}")
-        error_message = (
-            "Xin lỗi, đã có lỗi xảy ra khi tạo câu trả lời. "
-            "Vui lòng thử lại sau."
+    # Lỗi sinh câu trả lời (GenerationError) được raise cho caller: caller quyết định
+    # trả 5xx / SSE error event, metrics ghi outcome="error"
+    if streaming:
+        logger.debug("Streaming response started")
+        # Luôn truyền target_model vào hàm
+        return generate_answer_stream(
+            messages, 
+            model=target_model, 
+            temperature=temperature or settings.GENERATOR_TEMPERATURE,
+            num_ctx=settings.LLM_NUM_CTX,
+            stats=stats
         )
-        
-        if streaming:
-            def error_generator():
-                yield error_message
-            return error_generator()
-        else:
-            return error_message
+    
+    # Luôn truyền target_model vào hàm
+    answer = generate_answer(
+        messages, 
+        model=target_model,
+        temperature=temperature or settings.GENERATOR_TEMPERATURE,
+        num_ctx=settings.LLM_NUM_CTX,
+        stats=stats
+    )
+    logger.debug("Answer generated (%d chars)", len(answer))
+    return answer
 
 
 def answer_question_simple(
@@ -402,19 +616,19 @@ def validate_retriever_setup(index_path: str, meta_path: str) -> bool:
     """
     import os
     
-    if not os.path.exists(index_path):
-        print(f"❌ Index file not found: {index_path}")
+    if not os.path.exists(meta_path):
+        logger.error("Meta file not found: %s", meta_path)
         return False
     
-    if not os.path.exists(meta_path):
-        print(f"❌ Meta file not found: {meta_path}")
+    if not store_exists(index_path, meta_path):
+        logger.error("Index file not found: %s", index_path)
         return False
     
     try:
         # Thử load để kiểm tra
         retriever = create_retriever(index_path, meta_path)
-        print("✅ Retriever validation successful")
+        logger.info("Retriever validation successful")
         return True
     except Exception as e:
-        print(f"❌ Retriever validation failed: {e}")
+        logger.error("Retriever validation failed: %s", e)
         return False
\ No newline at end of file
@@ -1,12 +1,30 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
 import numpy as np
-from rank_bm25 import BM25Okapi
 
+from ..metrics import RETRIEVAL_PATH
+from .bm25_index import BM25Index
 from .embedder import Embedder
+from .text_analyzer import TextAnalyzer
 from .vector_store import VectorStore
 
+logger = logging.getLogger(__name__)
+
 
 class Retriever:
-    def __init__(self, store_path: str, meta_path: str, embedder=None, store=None):
+    def __init__(
+        self,
+        store_path: str,
+        meta_path: str,
+        embedder=None,
+        store=None,
+        analyzer=None,
+        mmap: bool = False
+    ):
         # 1. Load Semantic (FAISS) components (có thể dùng cache)
         self.embedder = embedder if embedder is not None else Embedder()
         self.store = (
@@ -20,10 +38,12 @@ class Retriever:
         )
         if store is None:
             try:
-                self.store.load()
-                print(f"Đã tải {len(self.store.documents)} chunks cho FAISS.")
+                self.store.load(mmap=mmap)
+                logger.info(
+                    "Đã tải %d chunks cho FAISS (mmap=%s).", len(self.store.documents), self.store.mmapped
+                )
             except Exception as e:
-                print(f"Lỗi khi tải VectorStore: {e}")
+                logger.error("Lỗi khi tải VectorStore: %s", e)
                 raise
 
         # 2. Load Keyword (BM25) components
@@ -32,7 +52,7 @@ class Retriever:
 
         # --- FIX: Tự động chuẩn hóa dữ liệu nếu chunks.json chứa list[str] thay vì list[dict] ---
         if self.store.documents and isinstance(self.store.documents[0], str):
-            print("⚠️  Cảnh báo: Dữ liệu chunks.json dạng chuỗi cũ. Đang tự động chuẩn hóa...")
+            logger.warning("Dữ liệu chunks.json dạng chuỗi cũ. Đang tự động chuẩn hóa...")
             normalized_docs = []
             for i, text in enumerate(self.store.documents):
                 normalized_docs.append({
@@ -47,10 +67,86 @@ class Retriever:
             self.store.documents = normalized_docs
         # ----------------------------------------------------------------------------------------
 
-        tokenized_corpus = [doc["text"].split(" ") for doc in self.store.documents]
-        self.bm25 = BM25Okapi(tokenized_corpus)
+        # Corpus và câu hỏi đi qua cùng một analyzer (chuẩn hóa Unicode, lowercase, bỏ dấu câu...)
+        self.analyzer = analyzer if analyzer is not None else TextAnalyzer()
         self.bm25_documents = self.store.documents
-        print("Đã khởi tạo BM25 index xong.")
+        # BM25 được nạp lười ở lần tìm keyword đầu tiên (cascade "skipped" không cần tới):
+        # dùng index đã lưu lúc build nếu cùng analyzer, ngược lại build lại từ documents
+        self.mmap = mmap
+        self._bm25 = None
+        self._bm25_lock = threading.Lock()
+
+        # Số lần mỗi nhánh của cascade được dùng (full / capped / skipped)
+        self.path_counts = Counter()
+
+    @property
+    def bm25(self) -> BM25Index:
+        if self._bm25 is None:
+            with self._bm25_lock:
+                if self._bm25 is None:
+                    self._bm25 = self._load_bm25()
+        return self._bm25
+
+    def _load_bm25(self) -> BM25Index:
+        t0 = time.perf_counter()
+        bm25_path = getattr(self.store, "bm25_path", None)
+        if (
+            bm25_path
+            and self.store.bm25_analyzer == repr(self.analyzer)
+            and os.path.isdir(bm25_path)
+        ):
+            bm25, source = BM25Index.load(bm25_path, mmap=self.mmap), "nạp từ đĩa"
+        else:
+            bm25 = BM25Index(self.analyzer.analyze(doc["text"]) for doc in self.store.documents)
+            source = "build lại"
+        logger.info(
+            "Đã khởi tạo BM25 index (%s) trong %.0f ms (%d tokens, vocab %d, %.1f MB).",
+            source, (time.perf_counter() - t0) * 1000,
+            len(bm25.token_ids), len(bm25.vocab), bm25.nbytes() / 1e6,
+        )
+        return bm25
+
+    @staticmethod
+    def fuse_results(semantic_docs, keyword_docs):
+        """
+        Hợp nhất kết quả semantic và BM25 (bỏ trùng theo chunk id).
+        Ưu tiên kết quả semantic (thường chính xác hơn), sau đó tới BM25.
+
+        Args:
+            semantic_docs, keyword_docs: list (score, doc)
+        """
+        fused_docs = []
+        seen_docs = set()
+
+        for results in (semantic_docs, keyword_docs):
+            for score, doc in results:
+                doc_id = doc["metadata"].get("chunk_unique_id") or doc["metadata"].get("chunk_id")
+                if doc_id not in seen_docs:
+                    fused_docs.append(doc)
+                    seen_docs.add(doc_id)
+
+        return fused_docs
+
+    @staticmethod
+    def cascade_path(semantic_results, min_top1=None, min_margin=None, capped_k=0):
+        """
+        Quyết định có cần BM25 hay không dựa trên độ chắc chắn của semantic search.
+
+        - "skipped": top-1 >= min_top1 và top-1 - top-2 >= min_margin -> bỏ hẳn BM25
+        - "capped" : top-1 >= min_top1 nhưng margin nhỏ -> chỉ lấy capped_k kết quả BM25
+        - "full"   : còn lại (hoặc cascade tắt khi min_top1 là None)
+        """
+        if min_top1 is None or not semantic_results:
+            return "full"
+
+        top1 = float(semantic_results[0][0])
+        if top1 < min_top1:
+            return "full"
+
+        top2 = float(semantic_results[1][0]) if len(semantic_results) > 1 else 0.0
+        if min_margin is None or top1 - top2 >= min_margin:
+            return "skipped"
+        return "capped" if capped_k > 0 else "full"
 
     def retrieve(
         self,
@@ -60,7 +156,11 @@ class Retriever:
         semantic_threshold=0.3,
         bm25_threshold=0.3,
         min_results=1,
-        bm25_min_top1=1.0   # <<< NGƯỠNG TOP1 TỐI THIỂU CHO BM25
+        bm25_min_top1=1.0,   # <<< NGƯỠNG TOP1 TỐI THIỂU CHO BM25
+        stats=None,
+        cascade_min_top1=None,
+        cascade_min_margin=None,
+        cascade_capped_k=0
     ):
         """
         Thực hiện tìm kiếm lai với ngưỡng lọc.
@@ -74,6 +174,10 @@ class Retriever:
             bm25_min_top1: Ngưỡng tuyệt đối tối thiểu cho điểm BM25 top1.
                            Nếu top1 < bm25_min_top1 => coi như BM25 không tìm được gì.
             min_results: Số kết quả tối thiểu để coi là "tìm thấy tài liệu"
+            stats: Dict (optional) để ghi thời gian từng bước (embed_ms, faiss_ms, bm25_ms, fusion_ms)
+                   và nhánh cascade đã dùng (retrieval_path)
+            cascade_min_top1, cascade_min_margin, cascade_capped_k: Ngưỡng của retrieval
+                   cascade (xem cascade_path). cascade_min_top1=None -> luôn chạy BM25 đầy đủ.
 
         Returns:
             tuple: (fused_docs, is_relevant)
@@ -81,20 +185,72 @@ class Retriever:
                 - is_relevant: True nếu tìm thấy tài liệu liên quan, False nếu không
         """
         # --- 1. Semantic Search (FAISS) với ngưỡng ---
+        t0 = time.perf_counter()
         q_emb = self.embedder.encode([query], prefix="query")
+        t1 = time.perf_counter()
         semantic_results = self.store.search(np.array(q_emb).reshape(1, -1), k=k_semantic)
+        t2 = time.perf_counter()
         
         semantic_docs = [
             (score, doc) for score, doc in semantic_results if score >= semantic_threshold
         ]
         
-        print(f"Semantic: {len(semantic_docs)}/{len(semantic_results)} kết quả vượt ngưỡng {semantic_threshold}")
+        logger.debug("Semantic: %d/%d kết quả vượt ngưỡng %s", len(semantic_docs), len(semantic_results), semantic_threshold)
+
+        # Cascade: semantic đủ chắc chắn thì bỏ qua / giới hạn BM25
+        path = self.cascade_path(
+            semantic_results, cascade_min_top1, cascade_min_margin, cascade_capped_k
+        )
+        if path == "capped":
+            k_keyword = min(k_keyword, cascade_capped_k)
+        self.path_counts[path] += 1
+        RETRIEVAL_PATH.labels(path=path).inc()
+        if stats is not None:
+            stats["retrieval_path"] = path
+
         # --- 2. Keyword Search (BM25) với ngưỡng động + ngưỡng tuyệt đối ---
-        tokenized_query = query.lower().split(" ")
-        keyword_scores = self.bm25.get_scores(tokenized_query)
+        keyword_docs = []
+        if path == "skipped":
+            logger.debug("BM25: bỏ qua (semantic top1=%.4f đủ chắc chắn)", semantic_results[0][0])
+        else:
+            keyword_docs = self._keyword_search(query, k_keyword, bm25_threshold, bm25_min_top1)
 
-        # Sắp xếp index theo score giảm dần
-        top_k_indices = np.argsort(keyword_scores)[::-1]
+        t3 = time.perf_counter()
+
+        # --- 3. Fuse Results (Hợp nhất) ---
+        fused_docs = self.fuse_results(semantic_docs, keyword_docs)
+
+        if stats is not None:
+            stats["embed_ms"] = (t1 - t0) * 1000
+            stats["faiss_ms"] = (t2 - t1) * 1000
+            stats["bm25_ms"] = (t3 - t2) * 1000
+            stats["fusion_ms"] = (time.perf_counter() - t3) * 1000
+
+        # --- 4. Kiểm tra độ liên quan ---
+        is_relevant = len(fused_docs) >= min_results
+
+        if not is_relevant:
+            logger.debug("Không tìm thấy tài liệu liên quan (chỉ có %d kết quả)", len(fused_docs))
+        else:
+            logger.debug("Tìm thấy %d tài liệu liên quan", len(fused_docs))
+
+        return fused_docs, is_relevant
+
+    def keyword_scores(self, query):
+        """Điểm BM25 của mọi chunk cho câu truy vấn (qua cùng analyzer với corpus)."""
+        return self.bm25.get_scores(self.analyzer.analyze(query))
+
+    def _keyword_search(self, query, k_keyword, bm25_threshold, bm25_min_top1):
+        """BM25 với ngưỡng động (bm25_threshold * top1) + ngưỡng tuyệt đối cho top1."""
+        if k_keyword <= 0:
+            return []
+
+        keyword_scores = self.keyword_scores(query)
+
+        # Chỉ cần k_keyword index điểm cao nhất -> argpartition thay vì sort toàn bộ corpus
+        k = min(k_keyword, len(keyword_scores))
+        top_k_indices = np.argpartition(keyword_scores, -k)[-k:]
+        top_k_indices = top_k_indices[np.argsort(keyword_scores[top_k_indices])[::-1]]
 
         # Điểm cao nhất (top1)
         top1 = keyword_scores[top_k_indices[0]]
@@ -103,11 +259,11 @@ class Retriever:
 
         # Nếu top1 quá thấp -> coi như không có tài liệu liên quan
         if top1 <= 0 or top1 < bm25_min_top1:
-            print(f"BM25: top1={top1:.4f} < bm25_min_top1={bm25_min_top1:.4f} -> KHÔNG lấy kết quả BM25.")
+            logger.debug("BM25: top1=%.4f < bm25_min_top1=%.4f -> KHÔNG lấy kết quả BM25.", top1, bm25_min_top1)
         else:
             # Ngưỡng động dựa trên top1
             dynamic_threshold = bm25_threshold * top1  # ví dụ: 0.3 * top1
-            print(f"BM25: top1={top1:.4f}, ngưỡng động={dynamic_threshold:.4f}")
+            logger.debug("BM25: top1=%.4f, ngưỡng động=%.4f", top1, dynamic_threshold)
 
             for i in top_k_indices:
                 score = keyword_scores[i]
@@ -116,34 +272,9 @@ class Retriever:
                     break
                 keyword_docs.append((score, self.bm25_documents[i]))
 
-            print(f"BM25: {len(keyword_docs)} kết quả vượt ngưỡng động ({dynamic_threshold:.4f})")
-
-        # --- 3. Fuse Results (Hợp nhất) ---
-        fused_docs = []
-        seen_docs = set()
-
-        # Ưu tiên kết quả semantic (thường chính xác hơn)
-        for score, doc in semantic_docs:
-            doc_id = doc["metadata"].get("chunk_unique_id") or doc["metadata"].get("chunk_id")
-            if doc_id not in seen_docs:
-                fused_docs.append(doc)
-                seen_docs.add(doc_id)
-
-        for score, doc in keyword_docs:
-            doc_id = doc["metadata"].get("chunk_unique_id") or doc["metadata"].get("chunk_id")
-            if doc_id not in seen_docs:
-                fused_docs.append(doc)
-                seen_docs.add(doc_id)
+            logger.debug("BM25: %d kết quả vượt ngưỡng động (%.4f)", len(keyword_docs), dynamic_threshold)
 
-        # --- 4. Kiểm tra độ liên quan ---
-        is_relevant = len(fused_docs) >= min_results
-
-        if not is_relevant:
-            print(f"⚠️ CẢNH BÁO: Không tìm thấy tài liệu liên quan (chỉ có {len(fused_docs)} kết quả)")
-        else:
-            print(f"✓ Tìm thấy {len(fused_docs)} tài liệu liên quan")
-
-        return fused_docs, is_relevant
+        return keyword_docs
 
     def retrieve_with_validation(self, query, **kwargs):
         """
@@ -0,0 +1,96 @@
+"""
+Text Analyzer
+-------------
+Chuẩn hóa văn bản thành token cho BM25 - dùng CHUNG cho corpus (lúc build index)
+và câu hỏi (lúc truy vấn) để hai phía luôn khớp nhau.
+
+Các bước: Unicode NFC -> lowercase (casefold) -> tách từ theo \\w+ (bỏ dấu câu)
+-> (tùy chọn) bỏ dấu tiếng Việt -> (tùy chọn) ghép từ ghép 2 âm tiết.
+
+Tiếng Việt viết mỗi âm tiết cách nhau nên "học sinh" bị tách thành "học", "sinh";
+vi_compounds thêm bigram "học_sinh" để BM25 thưởng cho cụm từ khớp liền nhau.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# đ/Đ không phải ký tự tổ hợp nên NFD không tách được dấu
+_VI_SPECIAL = str.maketrans({"đ": "d", "Đ": "D"})
+
+
+def fold_accents(text: str) -> str:
+    """Bỏ dấu: "Điều phối" -> "Dieu phoi"."""
+    decomposed = unicodedata.normalize("NFD", text.translate(_VI_SPECIAL))
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+class TextAnalyzer:
+    def __init__(
+        self,
+        lowercase: bool = True,
+        fold_accents: bool = False,
+        vi_compounds: bool = False,
+        min_token_len: int = 1
+    ):
+        """
+        Args:
+            lowercase: Chuyển về chữ thường (casefold)
+            fold_accents: Bỏ dấu tiếng Việt, để câu hỏi gõ không dấu vẫn khớp
+            vi_compounds: Thêm bigram âm tiết liền kề ("học_sinh")
+            min_token_len: Bỏ token ngắn hơn ngưỡng này
+        """
+        self.lowercase = lowercase
+        self.fold_accents = fold_accents
+        self.vi_compounds = vi_compounds
+        self.min_token_len = min_token_len
+
+    def analyze(self, text: str) -> List[str]:
+        """Trả về danh sách token của một đoạn văn bản."""
+        if not text:
+            return []
+
+        text = unicodedata.normalize("NFC", text)
+        if self.lowercase:
+            text = text.casefold()
+        if self.fold_accents:
+            text = fold_accents(text)
+
+        matches = [m for m in TOKEN_RE.finditer(text) if len(m.group()) >= self.min_token_len]
+        tokens = [m.group() for m in matches]
+
+        if self.vi_compounds:
+            # Chỉ ghép hai âm tiết cách nhau bởi khoảng trắng (không ghép qua dấu câu)
+            tokens += [
+                f"{a.group()}_{b.group()}"
+                for a, b in zip(matches, matches[1:])
+                if text[a.end():b.start()].isspace()
+            ]
+        return tokens
+
+    def __call__(self, text: str) -> List[str]:
+        return self.analyze(text)
+
+    def __repr__(self) -> str:
+        return (
+            f"TextAnalyzer(lowercase={self.lowercase}, fold_accents={self.fold_accents}, "
+            f"vi_compounds={self.vi_compounds}, min_token_len={self.min_token_len})"
+        )
+
+
+# Các cấu hình có sẵn, chọn qua settings.BM25_ANALYZER
+ANALYZERS: Dict[str, Dict] = {
+    "standard": {},
+    "vi": {"vi_compounds": True},
+    "vi_folded": {"vi_compounds": True, "fold_accents": True},
+}
+
+
+@lru_cache(maxsize=None)
+def get_analyzer(name: str = "standard") -> TextAnalyzer:
+    """Lấy analyzer theo tên (xem ANALYZERS)."""
+    if name not in ANALYZERS:
+        raise ValueError(f"Unknown BM25 analyzer: {name} (available: {', '.join(ANALYZERS)})")
+    return TextAnalyzer(**ANALYZERS[name])
@@ -0,0 +1,145 @@
+"""
+Text Splitter
+-------------
+Recursive splitter cùng ngữ nghĩa với LangChain RecursiveCharacterTextSplitter
+(keep_separator=True - separator dính vào đầu đoạn sau, strip_whitespace=True,
+cùng thuật toán merge + overlap) nhưng làm việc trên khoảng (start, end) của text gốc:
+
+- start_index của mỗi chunk có sẵn, không phải text.find() lại như add_start_index
+  của LangChain (tìm tuyến tính từ offset dự đoán, chậm với trang dài và có thể trả
+  sai vị trí khi đoạn text lặp lại).
+- Không tạo chuỗi con trung gian khi tách / merge, chỉ cắt chuỗi khi trả chunk.
+
+length_function mặc định là số ký tự; truyền hàm đếm token (ví dụ tokenizer của e5)
+để chunk_size / chunk_overlap tính theo token.
+"""
+from collections import deque
+from typing import Callable, List, Optional, Sequence, Tuple
+
+DEFAULT_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+Span = Tuple[int, int]
+
+
+class RecursiveTextSplitter:
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 120,
+        separators: Optional[Sequence[str]] = None,
+        length_function: Optional[Callable[[str], int]] = None
+    ):
+        if chunk_overlap > chunk_size:
+            raise ValueError(
+                f"chunk_overlap ({chunk_overlap}) must not be larger than chunk_size ({chunk_size})"
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators or DEFAULT_SEPARATORS)
+        self.length_function = length_function
+
+    # --- API ---------------------------------------------------------------
+
+    def split_spans(self, text: str) -> List[Span]:
+        """Danh sách (start, end) của các chunk trong text gốc (đã bỏ khoảng trắng hai đầu)."""
+        self._text = text
+        try:
+            return self._split(0, len(text), self.separators)
+        finally:
+            self._text = None
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    # --- Nội bộ ------------------------------------------------------------
+
+    def _length(self, start: int, end: int) -> int:
+        if self.length_function is None:
+            return end - start
+        return self.length_function(self._text[start:end])
+
+    def _strip(self, start: int, end: int) -> Optional[Span]:
+        text = self._text
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return (start, end) if start < end else None
+
+    def _split_by(self, start: int, end: int, separator: str) -> List[Span]:
+        """Tách [start, end) tại mỗi separator, separator thuộc về đoạn phía sau."""
+        if not separator:
+            return [(i, i + 1) for i in range(start, end)]
+
+        text = self._text
+        pieces = []
+        piece_start = start
+        pos = text.find(separator, start, end)
+        while pos != -1:
+            if pos > piece_start:
+                pieces.append((piece_start, pos))
+            piece_start = pos
+            pos = text.find(separator, pos + len(separator), end)
+        if end > piece_start:
+            pieces.append((piece_start, end))
+        return pieces
+
+    def _split(self, start: int, end: int, separators: List[str]) -> List[Span]:
+        text = self._text
+
+        # Separator đầu tiên xuất hiện trong đoạn; các separator sau dùng cho đoạn quá dài
+        separator = separators[-1]
+        remaining: List[str] = []
+        for i, candidate in enumerate(separators):
+            if candidate == "":
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator = candidate
+                remaining = separators[i + 1:]
+                break
+
+        chunks: List[Span] = []
+        good: List[Tuple[Span, int]] = []
+        for piece in self._split_by(start, end, separator):
+            length = self._length(*piece)
+            if length < self.chunk_size:
+                good.append((piece, length))
+                continue
+
+            if good:
+                chunks.extend(self._merge(good))
+                good = []
+            if not remaining:
+                chunks.append(piece)
+            else:
+                chunks.extend(self._split(piece[0], piece[1], remaining))
+
+        if good:
+            chunks.extend(self._merge(good))
+        return chunks
+
+    def _merge(self, pieces: List[Tuple[Span, int]]) -> List[Span]:
+        """
+        Gộp các đoạn liền nhau thành chunk <= chunk_size, giữ lại tối đa chunk_overlap
+        ở đầu chunk sau (giống _merge_splits của LangChain với separator rỗng).
+        """
+        chunks: List[Span] = []
+        current: deque = deque()
+        total = 0
+
+        for piece, length in pieces:
+            if total + length > self.chunk_size and current:
+                stripped = self._strip(current[0][0][0], current[-1][0][1])
+                if stripped is not None:
+                    chunks.append(stripped)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= current.popleft()[1]
+            current.append((piece, length))
+            total += length
+
+        if current:
+            stripped = self._strip(current[0][0][0], current[-1][0][1])
+            if stripped is not None:
+                chunks.append(stripped)
+        return chunks
@@ -0,0 +1,42 @@
+"""
+Token Counter
+-------------
+Đếm số token (xấp xỉ) cho việc đóng gói context vào prompt.
+
+Dùng tiktoken (cl100k_base) nếu có sẵn; nếu không tải được encoding
+(ví dụ container không có mạng) thì fallback về ước lượng theo số ký tự.
+Tokenizer của model Ollama (qwen2, llama...) khác cl100k nên đây chỉ là
+ước lượng - budget trong config đã chừa khoảng an toàn.
+"""
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+# Ước lượng thô khi không có tiktoken: ~3 ký tự / token (tiếng Việt có dấu tốn token hơn tiếng Anh)
+CHARS_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Đếm số token của một đoạn văn bản."""
+    if not text:
+        return 0
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+
+    return max(1, len(text) // CHARS_PER_TOKEN)
@@ -1,34 +1,375 @@
 import json
-from typing import List, Dict, Any, Tuple
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Tuple
 
 import faiss
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+# Loại index lưu vector (bytes / vector với dim=768):
+# flat = fp32 (3072), fp16 = scalar quantizer 16-bit (1536), sq8 = 8-bit (768), pq = product quantizer (96)
+INDEX_TYPES = ("flat", "fp16", "sq8", "pq")
+
+# PQ cần đủ vector để train codebook (256 centroid / sub-quantizer)
+PQ_MIN_VECTORS = 2048
+PQ_DIMS_PER_SUBQUANTIZER = 8
+
+# Layout trên đĩa (format 2): meta_path là manifest - một file JSON duy nhất chứa version,
+# tên các artifact của version đó và documents - được thay bằng os.replace. Artifact mang
+# version trong tên (<index>.<version>, <index>.<version>.f32.npy) nên không bao giờ bị ghi
+# đè: reader luôn đọc index và metadata của cùng một version, kể cả khi đang rebuild.
+# Format 1 (cũ): meta_path là list documents, index ở đúng path.
+MANIFEST_FORMAT = 2
+VERSION_RE = re.compile(r"^[0-9a-f]{16}-[0-9a-f]{8}$")
+
+
+def create_index(index_type: str, dim: int) -> faiss.Index:
+    """Tạo index inner-product rỗng theo loại (xem INDEX_TYPES)."""
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim)
+    if index_type == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "pq":
+        return faiss.IndexPQ(dim, dim // PQ_DIMS_PER_SUBQUANTIZER, 8, faiss.METRIC_INNER_PRODUCT)
+    raise ValueError(f"Unknown index type: {index_type} (available: {', '.join(INDEX_TYPES)})")
+
+
+def new_version() -> str:
+    """Version duy nhất, sắp theo thời gian khi so sánh chuỗi."""
+    return f"{time.time_ns():016x}-{uuid.uuid4().hex[:8]}"
+
+
+def read_manifest(meta_path: str) -> Dict[str, Any]:
+    """Đọc meta_path; file format 1 (list documents) được trả về dưới dạng manifest format 1."""
+    with open(meta_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {"format": 1, "documents": data}
+    return data
+
+
+def _artifact_version(name: str, entry: str) -> Optional[str]:
+    """Version trong tên artifact <name>.<version>[...] (None nếu không phải artifact có version)."""
+    if not entry.startswith(f"{name}."):
+        return None
+    version = entry[len(name) + 1:].split(".", 1)[0]
+    return version if VERSION_RE.match(version) else None
+
+
+def store_files(path: str, meta_path: str) -> List[str]:
+    """Mọi file / thư mục của vector store: manifest, artifact của mọi version và file format 1."""
+    directory, name = os.path.dirname(path) or ".", os.path.basename(path)
+    files = [p for p in (meta_path, path, f"{path}.f32.npy") if os.path.exists(p)]
+    if os.path.isdir(directory):
+        files += [
+            os.path.join(directory, entry)
+            for entry in sorted(os.listdir(directory))
+            if _artifact_version(name, entry)
+        ]
+    return files
+
+
+def store_exists(path: str, meta_path: str) -> bool:
+    """Có manifest và ít nhất một file index (format 1 hoặc một version)."""
+    if not os.path.exists(meta_path):
+        return False
+    if os.path.exists(path):
+        return True
+    directory, name = os.path.dirname(path) or ".", os.path.basename(path)
+    return os.path.isdir(directory) and any(
+        _artifact_version(name, entry) for entry in os.listdir(directory)
+    )
+
+
+def delete_store_files(path: str, meta_path: str) -> None:
+    for file in store_files(path, meta_path):
+        if os.path.isdir(file):
+            shutil.rmtree(file, ignore_errors=True)
+        else:
+            os.remove(file)
+
+
+def mmap_io_flag() -> Optional[int]:
+    """
+    Cờ mmap của FAISS: IO_FLAG_MMAP_IFC (FAISS >= 1.10, zero-copy cho flat / SQ / PQ)
+    hoặc IO_FLAG_MMAP (bản cũ: chỉ IVF / on-disk lists dùng mmap, loại khác vẫn đọc bình thường).
+    """
+    for name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        flag = getattr(faiss, name, None)
+        if flag is not None:
+            return flag
+    return None
+
+
+def is_mmapped(index: faiss.Index) -> bool:
+    """
+    Index có thật sự đọc dữ liệu từ file đã map hay không: codes của IndexFlatCodes
+    (flat / SQ / PQ) không sở hữu bộ nhớ (MaybeOwnedVector, FAISS >= 1.10), hoặc
+    inverted lists của IVF là OnDiskInvertedLists. Bản FAISS không cho biết -> False.
+    """
+    if isinstance(index, faiss.IndexIVF):
+        invlists = faiss.downcast_InvertedLists(index.invlists)
+        return isinstance(invlists, faiss.OnDiskInvertedLists)
+    is_owned = getattr(getattr(index, "codes", None), "is_owned", None)
+    return is_owned is not None and not is_owned
+
+
+def read_index(path: str, mmap: bool = False) -> Tuple[faiss.Index, bool]:
+    """
+    Đọc FAISS index; mmap=True thì map file vào bộ nhớ (trang được nạp khi truy cập,
+    page cache dùng chung giữa các process). Fallback về đọc toàn bộ nếu loại index
+    hoặc bản FAISS không hỗ trợ.
+
+    Returns:
+        (index, mmapped) - mmapped kiểm tra trên chính index vừa đọc (is_mmapped)
+    """
+    flag = mmap_io_flag() if mmap else None
+    if flag is not None:
+        try:
+            index = faiss.read_index(path, flag)
+            return index, is_mmapped(index)
+        except RuntimeError as e:
+            logger.debug("mmap not supported for %s, reading fully: %s", path, e)
+    return faiss.read_index(path), False
+
 
 class VectorStore:
-    def __init__(self, dim: int, path: str, meta_path: str):
+    def __init__(
+        self,
+        dim: int,
+        path: str,
+        meta_path: str,
+        index_type: str = "flat",
+        rescore_factor: int = 4
+    ):
+        """
+        Args:
+            index_type: Loại index (INDEX_TYPES). Index nén (fp16 / sq8 / pq) lấy
+                        k * rescore_factor ứng viên rồi chấm lại bằng dot product chính xác
+                        trên vector fp32 (lưu riêng ở vectors_path, đọc qua mmap).
+        """
+        self.dim = dim
         self.path = path
         self.meta_path = meta_path
-        self.index = faiss.IndexFlatIP(dim)
+        self.index_type = index_type
+        self.rescore_factor = rescore_factor
+        self.index = create_index(index_type, dim)
         self.documents: List[Dict[str, Any]] = []
+        # Vector fp32 để re-score (None với index flat)
+        self.vectors: Optional[np.ndarray] = None
+        self.mmapped = False
+        # Version đang dùng và file thực tế của nó (sau load / save)
+        self.version: Optional[str] = None
+        self.index_file: Optional[str] = None
+        self.vectors_path: Optional[str] = None
+        # BM25 index đã build lúc index (BM25Index.save) và analyzer đã dùng (repr)
+        self.bm25_path: Optional[str] = None
+        self.bm25_analyzer: Optional[str] = None
+
+    def _artifact(self, entry: Optional[str]) -> Optional[str]:
+        return os.path.join(os.path.dirname(self.path), entry) if entry else None
+
+    @property
+    def quantized(self) -> bool:
+        return not isinstance(self.index, faiss.IndexFlat)
 
     def add(self, embeddings, documents: List[Dict[str, Any]]):
-        self.index.add(np.array(embeddings))
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        if not self.index.is_trained:
+            if self.index_type == "pq" and self.index.ntotal == 0 and len(embeddings) < PQ_MIN_VECTORS:
+                logger.warning(
+                    "Only %d vectors, not enough to train PQ (>= %d); using sq8 instead",
+                    len(embeddings), PQ_MIN_VECTORS,
+                )
+                self.index_type = "sq8"
+                self.index = create_index("sq8", self.dim)
+            self.index.train(embeddings)
+
+        self.index.add(embeddings)
         self.documents.extend(documents)
 
-    def save(self):
-        faiss.write_index(self.index, self.path)
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=2)
+        if self.quantized:
+            self.vectors = embeddings if self.vectors is None else np.vstack([self.vectors, embeddings])
+
+    def save(self, bm25=None, bm25_analyzer: Optional[str] = None):
+        """
+        Ghi một version mới: artifact mang tên version (không ghi đè file mà retriever khác
+        đang mmap, hai lần build song song không đụng nhau), rồi thay manifest bằng os.replace.
+
+        Args:
+            bm25: BM25Index của cùng documents (lưu cùng version, retriever khỏi build lại)
+            bm25_analyzer: repr của TextAnalyzer đã tách token cho bm25
+        """
+        previous = self._current_version()
+        version = new_version()
+        name = os.path.basename(self.path)
+
+        artifacts: Dict[str, Optional[str]] = {"index": f"{name}.{version}", "vectors": None}
+        faiss.write_index(self.index, self._artifact(artifacts["index"]))
+        if self.quantized:
+            artifacts["vectors"] = f"{name}.{version}.f32.npy"
+            np.save(self._artifact(artifacts["vectors"]), np.asarray(self.vectors, dtype=np.float32))
+        artifacts["bm25"] = None
+        if bm25 is not None:
+            artifacts["bm25"] = f"{name}.{version}.bm25"
+            bm25.save(self._artifact(artifacts["bm25"]))
+
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "version": version,
+            "index_type": self.index_type,
+            **artifacts,
+            "bm25_analyzer": bm25_analyzer if bm25 is not None else None,
+            "documents": self.documents,
+        }
+        tmp_path = f"{self.meta_path}.{version}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.meta_path)
+
+        self.version = version
+        self.index_file = self._artifact(artifacts["index"])
+        self.vectors_path = self._artifact(artifacts["vectors"])
+        self.bm25_path = self._artifact(artifacts["bm25"])
+        self.bm25_analyzer = manifest["bm25_analyzer"]
+        self._remove_old_versions(version, previous)
+
+    def _current_version(self) -> Optional[str]:
+        """Version trong manifest hiện tại ("" nếu là format 1, None nếu chưa có)."""
+        if not os.path.exists(self.meta_path):
+            return None
+        try:
+            return read_manifest(self.meta_path).get("version", "")
+        except (OSError, ValueError):
+            return None
+
+    def _remove_old_versions(self, version: str, previous: Optional[str]) -> None:
+        """
+        Xóa artifact cũ hơn cả version vừa ghi lẫn version trước đó: reader vừa đọc manifest
+        trước vẫn mở được file, version mới hơn (build song song) không bị đụng tới.
+        File format 1 chỉ bị xóa khi version trước đó đã là format 2.
+        """
+        oldest_kept = min(v for v in (version, previous) if v)
+        directory, name = os.path.dirname(self.path) or ".", os.path.basename(self.path)
+        stale = [
+            os.path.join(directory, entry)
+            for entry in os.listdir(directory)
+            if (_artifact_version(name, entry) or oldest_kept) < oldest_kept
+        ]
+        if previous:
+            stale += [p for p in (self.path, f"{self.path}.f32.npy") if os.path.exists(p)]
 
-    def load(self):
-        self.index = faiss.read_index(self.path)
-        with open(self.meta_path, "r", encoding="utf-8") as f:
-            self.documents = json.load(f)
+        for path in stale:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                logger.warning("Failed to remove old vector store file %s: %s", path, e)
+
+    def load(self, mmap: bool = False):
+        # Manifest là một file duy nhất -> index, vectors và documents luôn cùng một version
+        manifest = read_manifest(self.meta_path)
+        if manifest.get("format", 1) >= MANIFEST_FORMAT:
+            self.version = manifest["version"]
+            self.index_type = manifest.get("index_type", self.index_type)
+            self.index_file = self._artifact(manifest["index"])
+            self.vectors_path = self._artifact(manifest.get("vectors"))
+            self.bm25_path = self._artifact(manifest.get("bm25"))
+            self.bm25_analyzer = manifest.get("bm25_analyzer")
+        else:
+            self.version = None
+            self.index_file = self.path
+            self.vectors_path = f"{self.path}.f32.npy"
+            self.bm25_path = self.bm25_analyzer = None
+
+        self.index, self.mmapped = read_index(self.index_file, mmap=mmap)
+        self.vectors = None
+        if self.quantized:
+            if self.vectors_path and os.path.exists(self.vectors_path):
+                # mmap: chỉ các hàng ứng viên được đọc từ đĩa khi re-score
+                self.vectors = np.load(self.vectors_path, mmap_mode="r")
+            else:
+                logger.warning("Missing %s, searching quantized index without re-scoring", self.vectors_path)
+        self.documents = manifest["documents"]
+
+    def _search_ids(self, query_emb, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, ids) cho một query; index nén được re-score trên vector fp32."""
+        if self.vectors is None:
+            scores, idxs = self.index.search(query_emb, k)
+            return scores[0], idxs[0]
+
+        n_candidates = min(k * self.rescore_factor, self.index.ntotal)
+        _, idxs = self.index.search(query_emb, n_candidates)
+        # Sắp id tăng dần để đọc mmap gần tuần tự
+        candidates = np.sort(idxs[0][idxs[0] >= 0])
+        exact = np.asarray(self.vectors[candidates]) @ np.asarray(query_emb, dtype=np.float32)[0]
+        top = np.argsort(-exact)[:k]
+        return exact[top], candidates[top]
 
     def search(self, query_emb, k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
-        scores, idxs = self.index.search(query_emb, k)
+        scores, idxs = self._search_ids(query_emb, k)
         return [
-            (scores[0][i], self.documents[idxs[0][i]])
-            for i in range(len(idxs[0]))
-        ]
\ No newline at end of file
+            (scores[i], self.documents[idxs[i]])
+            for i in range(len(idxs))
+        ]
+
+    def build_report(
+        self, k: int = 10, sample: int = 200, noise: float = 0.05, seed: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Kích thước file index và recall@k so với tìm kiếm chính xác (fp32). Gọi sau save() khi build.
+
+        Query = vector mẫu trong store + nhiễu Gauss (chuẩn hóa lại); chính vector mẫu
+        bị loại khỏi cả kết quả chính xác lẫn kết quả index, nếu không top-1 luôn là
+        chính nó và recall bị thổi phồng.
+        """
+        ntotal = self.index.ntotal
+        report: Dict[str, Any] = {
+            "index_type": self.index_type,
+            "vectors": ntotal,
+            "index_bytes": os.path.getsize(self.index_file) if self.index_file else None,
+            "fp32_bytes": ntotal * self.dim * 4,
+        }
+        if not self.quantized or ntotal < 2:
+            return report
+
+        k = min(k, ntotal - 1)
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        sources = rng.choice(ntotal, size=min(sample, ntotal), replace=False)
+        queries = vectors[sources] + noise * rng.standard_normal((len(sources), self.dim), dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        def without_source(ids, source: int) -> List[int]:
+            return [int(i) for i in ids if i != source and i >= 0][:k]
+
+        exact_ids = np.argsort(-(queries @ vectors.T), axis=1)[:, :k + 1]
+        exact = [without_source(row, s) for row, s in zip(exact_ids, sources)]
+        _, raw_ids = self.index.search(queries, k + 1)
+        raw = [without_source(row, s) for row, s in zip(raw_ids, sources)]
+        rescored = [
+            without_source(self._search_ids(q.reshape(1, -1), k + 1)[1], s)
+            for q, s in zip(queries, sources)
+        ]
+
+        def recall(found: List[List[int]]) -> float:
+            return float(np.mean([len(set(f) & set(e)) / k for f, e in zip(found, exact)]))
+
+        report.update({
+            "k": k,
+            "rescore_factor": self.rescore_factor,
+            "recall_at_k": round(recall(rescored), 4),
+            "recall_at_k_without_rescore": round(recall(raw), 4),
+        })
+        return report
\ No newline at end of file
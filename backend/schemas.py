@@ -34,17 +34,26 @@ class Token(BaseModel):
 class SubjectCreate(BaseModel):
     name: str = Field(..., min_length=1, max_length=255)
     description: Optional[str] = None
+    chunk_size: Optional[int] = Field(None, ge=100, le=8000)
+    chunk_overlap: Optional[int] = Field(None, ge=0, le=4000)
+    index_type: Optional[str] = Field(None, pattern="^(flat|fp16|sq8|pq)$")
 
 
 class SubjectUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
+    chunk_size: Optional[int] = Field(None, ge=100, le=8000)
+    chunk_overlap: Optional[int] = Field(None, ge=0, le=4000)
+    index_type: Optional[str] = Field(None, pattern="^(flat|fp16|sq8|pq)$")
 
 
 class SubjectRead(BaseModel):
     id: int
     name: str
     description: Optional[str]
+    chunk_size: Optional[int] = None
+    chunk_overlap: Optional[int] = None
+    index_type: Optional[str] = None
     created_at: datetime
     
     class Config:
@@ -57,6 +66,8 @@ class DocumentRead(BaseModel):
     subject_id: int
     filename: str
     file_size: Optional[int]
+    content_hash: Optional[str] = None
+    page_count: Optional[int] = None
     status: str
     created_at: datetime
     
@@ -64,6 +75,18 @@ class DocumentRead(BaseModel):
         from_attributes = True
 
 
+class DocumentHashCheck(BaseModel):
+    content_hash: str
+    exists: bool
+    challenge: str
+
+
+class DocumentFromHash(BaseModel):
+    content_hash: str = Field(..., min_length=64, max_length=64)
+    filename: str = Field(..., min_length=1, max_length=255)
+    proof: str = Field(..., min_length=64, max_length=64)
+
+
 # ============= Conversation Schemas =============
 class ConversationCreate(BaseModel):
     subject_id: int
@@ -100,6 +123,13 @@ class MessageRead(BaseModel):
         from_attributes = True
 
 
+class MessagePage(BaseModel):
+    """Một trang messages (keyset pagination theo (created_at, id))"""
+    items: List[MessageRead]
+    next_cursor: Optional[str] = None  # Truyền lại qua ?cursor= để lấy trang tiếp theo
+    has_more: bool = False
+
+
 # ============= Chat Schemas =============
 class ChatRequest(BaseModel):
     conversation_id: int
@@ -0,0 +1,98 @@
+"""
+Content Cache - Chunks + embeddings theo SHA-256 của file PDF
+
+Cùng một file PDF (cùng hash) được nhiều user upload vào nhiều môn học khác nhau.
+Kết quả parse + chunk + embed chỉ phụ thuộc vào nội dung file, model embedding và
+tham số chunk, nên được lưu một lần và dùng lại khi build vector store.
+
+Layout: INDEX_DIR/content/<hash[:2]>/<hash>/<key>.json + <key>.npy
+với key = hash(PDF_LOADER, EMBEDDING_MODEL, CHUNK_LENGTH_UNIT, chunk_size, overlap).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+ContentChunks = Tuple[List[Dict[str, Any]], np.ndarray]
+
+
+def _cache_dir(content_hash: str) -> Path:
+    return Path(settings.INDEX_DIR) / "content" / content_hash[:2] / content_hash
+
+
+def _cache_key(chunk_size: int, overlap: int) -> str:
+    raw = (
+        f"{settings.PDF_LOADER}|{settings.EMBEDDING_MODEL}|{settings.CHUNK_LENGTH_UNIT}"
+        f"|{chunk_size}|{overlap}"
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _atomic_write(path: Path, write) -> None:
+    """Ghi ra file tạm cùng thư mục rồi os.replace (không để lại file ghi dở)."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_chunks(content_hash: str, chunk_size: int, overlap: int) -> Optional[ContentChunks]:
+    """Lấy chunks + embeddings đã tính cho nội dung này (None nếu chưa có)."""
+    base = _cache_dir(content_hash) / _cache_key(chunk_size, overlap)
+    chunks_path, emb_path = base.with_suffix(".json"), base.with_suffix(".npy")
+    if not (chunks_path.exists() and emb_path.exists()):
+        return None
+
+    try:
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        embeddings = np.load(emb_path)
+    except Exception as e:
+        logger.warning("Ignoring corrupt content cache %s: %s", base, e)
+        return None
+
+    if len(chunks) != len(embeddings):
+        logger.warning("Ignoring content cache %s: %d chunks vs %d embeddings", base, len(chunks), len(embeddings))
+        return None
+    return chunks, embeddings
+
+
+def save_chunks(
+    content_hash: str,
+    chunk_size: int,
+    overlap: int,
+    chunks: List[Dict[str, Any]],
+    embeddings: np.ndarray
+) -> None:
+    """Lưu chunks (text + metadata không phụ thuộc document) và embeddings."""
+    cache_dir = _cache_dir(content_hash)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    base = cache_dir / _cache_key(chunk_size, overlap)
+
+    # Ghi embeddings trước: load_chunks chỉ coi là hit khi có đủ cả hai file
+    _atomic_write(base.with_suffix(".npy"), lambda f: np.save(f, np.asarray(embeddings, dtype=np.float32)))
+    _atomic_write(
+        base.with_suffix(".json"),
+        lambda f: f.write(json.dumps(chunks, ensure_ascii=False).encode("utf-8")),
+    )
+    logger.debug("Cached %d chunks for %s", len(chunks), content_hash)
+
+
+def remove_chunks(content_hash: str) -> None:
+    """Xóa mọi chunks/embeddings đã cache của nội dung này (mọi key)."""
+    shutil.rmtree(_cache_dir(content_hash), ignore_errors=True)
@@ -1,8 +1,14 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from fastapi import HTTPException, status
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import json
 
 from .. import models, schemas
+from ..config import settings
 
 
 def create_conversation(
@@ -105,22 +111,115 @@ def get_conversation_by_id(
     return conversation
 
 
-def get_conversation_messages(
+def get_conversation_detail(
     db: Session,
     conversation_id: int,
     user_id: int
-) -> List[models.Message]:
+) -> models.Conversation:
     """
-    Lấy tất cả messages trong conversation
+    Lấy conversation kèm documents và vector store meta của môn học
+    (eager load để tránh N+1 query khi serialize)
+    """
+    conversation = db.query(models.Conversation).options(
+        joinedload(models.Conversation.subject).joinedload(models.Subject.vector_store_meta),
+        selectinload(models.Conversation.documents).joinedload(models.ConversationDocument.document),
+    ).filter(
+        models.Conversation.id == conversation_id,
+        models.Conversation.user_id == user_id
+    ).first()
+    
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    return conversation
+
+
+def encode_message_cursor(message: models.Message) -> str:
+    """Mã hóa vị trí (created_at, id) của message thành cursor dạng chuỗi."""
+    raw = json.dumps([message.created_at.isoformat(), message.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Giải mã cursor -> (created_at, id). Cursor không hợp lệ -> 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def get_conversation_messages(
+    db: Session,
+    conversation_id: int,
+    user_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    latest_first: bool = False
+) -> Tuple[List[models.Message], Optional[str]]:
+    """
+    Lấy một trang messages trong conversation (keyset pagination theo (created_at, id))
+    
+    Args:
+        limit: Số message mỗi trang (mặc định MESSAGES_PAGE_SIZE, tối đa MESSAGES_MAX_PAGE_SIZE)
+        cursor: next_cursor của trang trước, None để lấy trang đầu
+        latest_first: True -> mới nhất trước, trang sau là các message cũ hơn
+        
+    Returns:
+        Tuple (messages, next_cursor) - next_cursor là None nếu đã hết
     """
     # Kiểm tra quyền
     get_conversation_by_id(db, conversation_id, user_id)
     
-    messages = db.query(models.Message).filter(
+    page_size = min(
+        max(limit or settings.MESSAGES_PAGE_SIZE, 1),
+        settings.MESSAGES_MAX_PAGE_SIZE
+    )
+    
+    query = db.query(models.Message).filter(
         models.Message.conversation_id == conversation_id
-    ).order_by(models.Message.created_at.asc()).all()
+    )
+    
+    if cursor:
+        cursor_created_at, cursor_id = decode_message_cursor(cursor)
+        if latest_first:
+            query = query.filter(or_(
+                models.Message.created_at < cursor_created_at,
+                and_(
+                    models.Message.created_at == cursor_created_at,
+                    models.Message.id < cursor_id
+                )
+            ))
+        else:
+            query = query.filter(or_(
+                models.Message.created_at > cursor_created_at,
+                and_(
+                    models.Message.created_at == cursor_created_at,
+                    models.Message.id > cursor_id
+                )
+            ))
+    
+    if latest_first:
+        query = query.order_by(models.Message.created_at.desc(), models.Message.id.desc())
+    else:
+        query = query.order_by(models.Message.created_at.asc(), models.Message.id.asc())
+    
+    # Lấy dư 1 bản ghi để biết còn trang sau hay không
+    messages = query.limit(page_size + 1).all()
     
-    return messages
+    next_cursor = None
+    if len(messages) > page_size:
+        messages = messages[:page_size]
+        next_cursor = encode_message_cursor(messages[-1])
+    
+    return messages, next_cursor
 
 
 def save_message(
@@ -145,6 +244,53 @@ def save_message(
     return message
 
 
+async def get_conversation_by_id_async(
+    db: AsyncSession,
+    conversation_id: int,
+    user_id: int
+) -> models.Conversation:
+    """
+    Bản async của get_conversation_by_id (dùng trên chat path khi DB_ASYNC_ENABLED)
+    """
+    result = await db.execute(
+        select(models.Conversation).where(
+            models.Conversation.id == conversation_id,
+            models.Conversation.user_id == user_id
+        )
+    )
+    conversation = result.scalars().first()
+    
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    return conversation
+
+
+async def save_message_async(
+    db: AsyncSession,
+    conversation_id: int,
+    role: str,
+    content: str
+) -> models.Message:
+    """
+    Bản async của save_message
+    """
+    message = models.Message(
+        conversation_id=conversation_id,
+        role=role,
+        content=content
+    )
+    
+    db.add(message)
+    await db.commit()
+    await db.refresh(message)
+    
+    return message
+
+
 def delete_conversation(db: Session, conversation_id: int, user_id: int) -> None:
     """
     Xóa conversation
@@ -1,91 +1,326 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status, UploadFile
 from pathlib import Path
-from typing import List
-import shutil
+from typing import List, Optional, Tuple
+import anyio
+import hashlib
+import hmac
+import logging
 import os
+import re
+import tempfile
+import threading
 
 from .. import models
 from ..config import settings
 
+logger = logging.getLogger(__name__)
 
-def get_upload_path(user_id: int, subject_id: int) -> Path:
+# Kích thước mỗi lần đọc khi stream file upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Khóa giữa bước "blob còn document nào dùng?" + xóa blob và các bước gắn document mới
+# vào blob (upload trùng nội dung, from-hash), để không xóa blob vừa được dùng lại.
+# Khóa trong process: app chạy một process (user cache, retriever cache cũng in-process).
+_blob_lock = threading.Lock()
+
+
+def get_blob_dir() -> Path:
     """
-    Tạo đường dẫn lưu file
+    Thư mục lưu file theo nội dung (content-addressed)
     """
-    upload_path = Path(settings.UPLOAD_DIR) / f"user_{user_id}" / f"subject_{subject_id}"
-    upload_path.mkdir(parents=True, exist_ok=True)
-    return upload_path
+    blob_dir = Path(settings.UPLOAD_DIR) / "blobs"
+    blob_dir.mkdir(parents=True, exist_ok=True)
+    return blob_dir
 
 
-def save_uploaded_file(
-    db: Session,
-    subject_id: int,
-    user_id: int,
-    file: UploadFile
-) -> models.Document:
+def get_blob_path(content_hash: str) -> Path:
     """
-    Lưu file PDF và tạo record Document
+    Đường dẫn blob của một file theo SHA-256: blobs/<2 ký tự đầu>/<hash>.pdf
     """
-    # Kiểm tra file type
-    if not file.filename.endswith('.pdf'):
+    return get_blob_dir() / content_hash[:2] / f"{content_hash}.pdf"
+
+
+def validate_content_hash(content_hash: str) -> str:
+    content_hash = content_hash.lower()
+    if not SHA256_RE.match(content_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only PDF files are allowed"
+            detail="content_hash must be a hex-encoded SHA-256"
         )
-    
-    # Kiểm tra subject tồn tại và thuộc về user
+    return content_hash
+
+
+def _get_user_subject(db: Session, subject_id: int, user_id: int) -> models.Subject:
     subject = db.query(models.Subject).filter(
         models.Subject.id == subject_id,
         models.Subject.user_id == user_id
     ).first()
-    
+
     if not subject:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Subject not found"
         )
+    return subject
+
+
+class PdfPageCounter:
+    """
+    Đếm số trang PDF trên luồng byte (các object "/Type /Page") trong lúc upload.
+    Giữ lại phần đuôi của mỗi chunk để không bỏ sót object nằm vắt qua ranh giới chunk.
+    PDF dùng object stream nén (PDF 1.5+) sẽ không đếm được -> count() trả None.
+    """
+    PAGE_RE = re.compile(rb"/Type\s*/Page(?![A-Za-z])")
+    TAIL = 64
+
+    def __init__(self):
+        self._pages = 0
+        self._tail = b""
+
+    def update(self, chunk: bytes) -> None:
+        data = self._tail + chunk
+        # Chỉ đếm match bắt đầu trước phần đuôi; phần đuôi được quét lại cùng chunk sau
+        boundary = max(0, len(data) - self.TAIL)
+        self._pages += sum(1 for m in self.PAGE_RE.finditer(data) if m.start() < boundary)
+        self._tail = data[boundary:]
+
+    def count(self) -> Optional[int]:
+        pages = self._pages + len(self.PAGE_RE.findall(self._tail))
+        return pages or None
+
+
+async def _receive_upload(file: UploadFile, max_bytes: int) -> Tuple[str, str, int, Optional[int]]:
+    """
+    Stream file upload ra file tạm theo từng chunk (ghi file chạy trên thread pool).
+    Trong cùng một lượt đọc: tính SHA-256, đếm trang, kiểm tra giới hạn kích thước.
+    File tạm nằm trong thư mục blob để _store_blob dùng os.replace (atomic).
+
+    Returns:
+        (content_hash, tmp_path, file_size, page_count)
+    """
+    sha256 = hashlib.sha256()
+    pages = PdfPageCounter()
+    file_size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=get_blob_dir(), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if file_size == 0 and not chunk.startswith(b"%PDF-"):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="File is not a valid PDF"
+                    )
+                file_size += len(chunk)
+                if file_size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the {settings.MAX_UPLOAD_SIZE_MB} MB limit"
+                    )
+                sha256.update(chunk)
+                pages.update(chunk)
+                await anyio.to_thread.run_sync(buffer.write, chunk)
+
+        return sha256.hexdigest(), tmp_path, file_size, pages.count()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _store_blob(tmp_path: str, content_hash: str) -> Path:
+    """
+    Đưa file tạm vào blob store (gọi khi đang giữ _blob_lock);
+    nếu nội dung đã tồn tại thì bỏ file tạm và dùng lại blob cũ.
+    """
+    blob_path = get_blob_path(content_hash)
+    if blob_path.exists():
+        os.remove(tmp_path)
+        logger.info("Reusing existing blob %s", content_hash)
+    else:
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, blob_path)
+    return blob_path
+
+
+def _create_document(
+    db: Session,
+    subject_id: int,
+    filename: str,
+    blob_path: Path,
+    file_size: int,
+    content_hash: str,
+    page_count: Optional[int] = None
+) -> models.Document:
+    db_document = models.Document(
+        subject_id=subject_id,
+        filename=filename,
+        filepath=str(blob_path),
+        file_size=file_size,
+        content_hash=content_hash,
+        page_count=page_count,
+        status="uploaded"
+    )
+
+    db.add(db_document)
+    db.commit()
+    db.refresh(db_document)
+
+    return db_document
+
+
+def _create_uploaded_document(
+    db: Session,
+    subject_id: int,
+    filename: str,
+    tmp_path: str,
+    content_hash: str,
+    file_size: int,
+    page_count: Optional[int]
+) -> models.Document:
+    """Lưu blob và tạo record trong cùng một lần giữ _blob_lock."""
+    try:
+        with _blob_lock:
+            blob_path = _store_blob(tmp_path, content_hash)
+            return _create_document(
+                db, subject_id, filename, blob_path, file_size, content_hash, page_count
+            )
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def save_uploaded_file(
+    db: Session,
+    subject_id: int,
+    user_id: int,
+    file: UploadFile
+) -> models.Document:
+    """
+    Lưu file PDF (content-addressed theo SHA-256) và tạo record Document.
+    Truy vấn DB chạy trên thread pool để không chặn event loop.
+    """
+    max_bytes = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
     
-    # Tạo đường dẫn
-    upload_path = get_upload_path(user_id, subject_id)
+    # Kiểm tra file type
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDF files are allowed"
+        )
     
-    # Tạo tên file unique
-    base_name = Path(file.filename).stem
-    extension = Path(file.filename).suffix
-    file_path = upload_path / file.filename
+    # Từ chối sớm nếu client đã khai báo kích thước
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {settings.MAX_UPLOAD_SIZE_MB} MB limit"
+        )
     
-    counter = 1
-    while file_path.exists():
-        file_path = upload_path / f"{base_name}_{counter}{extension}"
-        counter += 1
+    # Kiểm tra subject tồn tại và thuộc về user
+    await anyio.to_thread.run_sync(_get_user_subject, db, subject_id, user_id)
     
-    # Lưu file
+    # Nhận file
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        file_size = os.path.getsize(file_path)
-        
+        content_hash, tmp_path, file_size, page_count = await _receive_upload(file, max_bytes)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to save file: {str(e)}"
         )
-    
-    # Tạo Document record
-    db_document = models.Document(
-        subject_id=subject_id,
-        filename=file.filename,
-        filepath=str(file_path),
-        file_size=file_size,
-        status="uploaded"
+
+    return await anyio.to_thread.run_sync(
+        _create_uploaded_document,
+        db, subject_id, file.filename, tmp_path, content_hash, file_size, page_count
     )
-    
-    db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
-    
-    return db_document
+
+
+def find_blob(db: Session, content_hash: str) -> Optional[models.Document]:
+    """
+    Tìm một document bất kỳ có cùng nội dung và blob còn trên đĩa
+    """
+    document = db.query(models.Document).filter(
+        models.Document.content_hash == content_hash
+    ).first()
+
+    if document and os.path.exists(document.filepath):
+        return document
+    return None
+
+
+def possession_challenge(user_id: int, content_hash: str) -> str:
+    """
+    Challenge cho from-hash, cố định theo (user, hash) nên không cần lưu state.
+    Client chứng minh đang giữ file bằng proof = sha256(challenge (ASCII) + nội dung file);
+    chỉ biết hash (vd. lấy từ người khác) thì không tạo được proof.
+    """
+    return hmac.new(
+        settings.SECRET_KEY.encode("utf-8"),
+        f"{user_id}:{content_hash}".encode("ascii"),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def _verify_possession(user_id: int, content_hash: str, proof: str, file_path: str) -> bool:
+    digest = hashlib.sha256(possession_challenge(user_id, content_hash).encode("ascii"))
+    with open(file_path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return hmac.compare_digest(digest.hexdigest(), proof.lower())
+
+
+def create_document_from_hash(
+    db: Session,
+    subject_id: int,
+    user_id: int,
+    content_hash: str,
+    filename: str,
+    proof: str
+) -> models.Document:
+    """
+    Thêm tài liệu vào môn học từ một blob đã có (client không cần upload lại).
+    Yêu cầu proof-of-possession (xem possession_challenge).
+    """
+    content_hash = validate_content_hash(content_hash)
+    if not filename.endswith('.pdf'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only PDF files are allowed"
+        )
+
+    _get_user_subject(db, subject_id, user_id)
+
+    not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Content not found, please upload the file"
+    )
+    existing = find_blob(db, content_hash)
+    if not existing:
+        raise not_found
+
+    # Đọc lại blob để kiểm tra proof, ngoài khóa (file có thể lớn)
+    try:
+        valid = _verify_possession(user_id, content_hash, proof, existing.filepath)
+    except FileNotFoundError:
+        raise not_found
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid proof of possession"
+        )
+
+    with _blob_lock:
+        # Blob có thể đã bị xóa cùng document cuối cùng trong lúc kiểm tra proof
+        existing = find_blob(db, content_hash)
+        if not existing:
+            raise not_found
+        return _create_document(
+            db, subject_id, filename, Path(existing.filepath), existing.file_size, content_hash,
+            existing.page_count
+        )
 
 
 def get_subject_documents(
@@ -97,16 +332,7 @@ def get_subject_documents(
     Lấy tất cả tài liệu của môn học
     """
     # Kiểm tra quyền
-    subject = db.query(models.Subject).filter(
-        models.Subject.id == subject_id,
-        models.Subject.user_id == user_id
-    ).first()
-    
-    if not subject:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Subject not found"
-        )
+    _get_user_subject(db, subject_id, user_id)
     
     documents = db.query(models.Document).filter(
         models.Document.subject_id == subject_id
@@ -141,17 +367,33 @@ def get_document_by_id(
 
 def delete_document(db: Session, document_id: int, user_id: int) -> None:
     """
-    Xóa document
+    Xóa document (blob và cache page text / chunks của nội dung chỉ bị xóa khi
+    không còn document nào dùng chung)
     """
     document = get_document_by_id(db, document_id, user_id)
+    filepath, content_hash = document.filepath, document.content_hash
     
-    # Xóa file vật lý
-    try:
-        if os.path.exists(document.filepath):
-            os.remove(document.filepath)
-    except Exception as e:
-        print(f"Failed to delete file: {e}")
-    
-    # Xóa record
-    db.delete(document)
-    db.commit()
+    # Giữ khóa từ lúc kiểm tra dùng chung tới khi xóa file: upload / from-hash
+    # cùng nội dung không thể gắn document mới vào blob ở giữa hai bước
+    with _blob_lock:
+        shared = content_hash is not None and db.query(models.Document.id).filter(
+            models.Document.content_hash == content_hash,
+            models.Document.id != document.id
+        ).first() is not None
+        
+        # Xóa record trước, file chỉ bị xóa khi commit thành công
+        db.delete(document)
+        db.commit()
+        
+        # Xóa file vật lý và cache dẫn xuất từ nội dung (page text, chunks + embeddings)
+        if not shared:
+            try:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                if content_hash is not None:
+                    from . import content_cache, page_cache
+
+                    page_cache.remove_pages(content_hash)
+                    content_cache.remove_chunks(content_hash)
+            except Exception as e:
+                logger.warning("Failed to delete file: %s", e)
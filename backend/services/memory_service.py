@@ -0,0 +1,137 @@
+"""
+Memory Service - Bộ nhớ hội thoại có giới hạn
+
+Prompt chỉ chứa summary cuốn chiếu + N lượt gần nhất, nên kích thước không
+tăng theo độ dài conversation. Sau mỗi câu trả lời, các message vừa rơi khỏi
+cửa sổ N lượt được gộp dần vào summary (lưu trong bảng conversations).
+"""
+import logging
+
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+
+from .. import models
+from ..config import settings
+from ..db import SessionLocal
+from ..rag_pipeline.generator import generate_summary
+
+logger = logging.getLogger(__name__)
+
+# Số message tối đa gộp vào summary trong một lần cập nhật (giới hạn chi phí mỗi lần gọi LLM)
+MAX_MESSAGES_PER_FOLD = 8
+
+
+def _window_size() -> int:
+    """Số message (không phải lượt) được giữ nguyên văn trong prompt."""
+    return max(settings.MEMORY_RECENT_TURNS, 0) * 2
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "..."
+
+
+def _to_turn(message: models.Message) -> Dict[str, str]:
+    return {
+        "role": message.role,
+        "content": _truncate(message.content, settings.MEMORY_TURN_MAX_CHARS),
+    }
+
+
+def get_conversation_memory(
+    db: Session,
+    conversation: models.Conversation,
+    question: Optional[str] = None
+) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """
+    Lấy summary và các lượt gần nhất (chưa nằm trong summary) của conversation.
+
+    Args:
+        db: Database session
+        conversation: Conversation cần lấy memory
+        question: Câu hỏi hiện tại - đã được lưu trước khi gọi pipeline nên bị loại
+            khỏi danh sách recent turns
+
+    Returns:
+        Tuple (summary, recent_turns) với recent_turns là list {"role", "content"}
+    """
+    window = _window_size()
+    if window == 0:
+        return conversation.summary, []
+
+    query = db.query(models.Message).filter(
+        models.Message.conversation_id == conversation.id
+    )
+    if conversation.summary_message_id:
+        query = query.filter(models.Message.id > conversation.summary_message_id)
+
+    messages = query.order_by(models.Message.id.desc()).limit(window + 1).all()
+    messages.reverse()
+
+    if (
+        question is not None
+        and messages
+        and messages[-1].role == "user"
+        and messages[-1].content == question
+    ):
+        messages = messages[:-1]
+
+    return conversation.summary, [_to_turn(m) for m in messages[-window:]]
+
+
+def update_conversation_summary(db: Session, conversation_id: int) -> None:
+    """
+    Gộp các message đã rơi khỏi cửa sổ gần nhất vào summary của conversation.
+
+    Chỉ xử lý phần chênh lệch kể từ lần cập nhật trước (summary_message_id),
+    nên chi phí mỗi lần gọi là hằng số.
+    """
+    conversation = db.query(models.Conversation).filter(
+        models.Conversation.id == conversation_id
+    ).first()
+
+    if not conversation:
+        return
+
+    query = db.query(models.Message).filter(
+        models.Message.conversation_id == conversation_id
+    )
+    if conversation.summary_message_id:
+        query = query.filter(models.Message.id > conversation.summary_message_id)
+
+    overflow = query.count() - _window_size()
+    if overflow <= 0:
+        return
+
+    to_fold = query.order_by(models.Message.id.asc()).limit(
+        min(overflow, MAX_MESSAGES_PER_FOLD)
+    ).all()
+
+    summary = generate_summary(
+        conversation.summary,
+        [_to_turn(m) for m in to_fold],
+        model=settings.LLM_MODEL,
+        max_words=settings.MEMORY_SUMMARY_MAX_WORDS
+    )
+
+    conversation.summary = summary
+    conversation.summary_message_id = to_fold[-1].id
+    db.commit()
+
+    logger.info("Conversation %s: folded %d messages into summary", conversation_id, len(to_fold))
+
+
+def update_conversation_summary_task(conversation_id: int) -> None:
+    """
+    Wrapper cho background task: dùng session riêng vì session của request
+    đã đóng khi background task chạy. Lỗi chỉ được log (summary cũ giữ nguyên).
+    """
+    db = SessionLocal()
+    try:
+        update_conversation_summary(db, conversation_id)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Failed to update summary for conversation %s: %s", conversation_id, e)
+    finally:
+        db.close()
@@ -0,0 +1,96 @@
+"""
+Page Cache - Text đã trích của từng trang PDF, lưu nén cạnh blob upload
+
+blobs/<hash[:2]>/<hash>.pdf         <- file gốc (document_service)
+blobs/<hash[:2]>/<hash>.pages.json.gz  <- {"loader", "pages": [text trang 0, 1, ...]}
+
+Được ghi một lần lúc upload; chunking / rebuild đọc file này thay vì parse lại PDF.
+Cache chỉ hợp lệ với đúng loader đã tạo ra nó (đổi PDF_LOADER -> trích lại).
+"""
+import gzip
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from .. import models
+from ..config import settings
+from ..rag_pipeline.data_loader import iter_document
+from .document_service import get_blob_path
+
+logger = logging.getLogger(__name__)
+
+
+def get_pages_path(content_hash: str) -> Path:
+    return get_blob_path(content_hash).with_suffix(".pages.json.gz")
+
+
+def load_pages(content_hash: str) -> Optional[List[str]]:
+    """Text từng trang đã cache (None nếu chưa có hoặc tạo bởi loader khác)."""
+    path = get_pages_path(content_hash)
+    if not path.exists():
+        return None
+
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+    except Exception as e:
+        logger.warning("Ignoring corrupt page cache %s: %s", path, e)
+        return None
+
+    if payload.get("loader") != settings.PDF_LOADER:
+        return None
+    return payload["pages"]
+
+
+def save_pages(content_hash: str, pages: List[str]) -> None:
+    path = get_pages_path(content_hash)
+    payload = json.dumps({"loader": settings.PDF_LOADER, "pages": pages}, ensure_ascii=False)
+
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as f:
+            f.write(payload.encode("utf-8"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logger.debug("Cached %d pages for %s", len(pages), content_hash)
+
+
+def remove_pages(content_hash: str) -> None:
+    path = get_pages_path(content_hash)
+    if path.exists():
+        os.remove(path)
+
+
+def ensure_pages(content_hash: str, file_path: str) -> List[str]:
+    """Lấy text từng trang từ cache, trích từ PDF (và lưu cache) nếu chưa có."""
+    pages = load_pages(content_hash)
+    if pages is None:
+        pages = [doc.page_content for doc in iter_document(file_path)]
+        save_pages(content_hash, pages)
+    return pages
+
+
+def get_document_pages(document: models.Document) -> List[Document]:
+    """
+    Các trang của document dưới dạng langchain Document (metadata giống PyPDFLoader).
+    Document cũ chưa có content_hash thì parse trực tiếp, không cache.
+    """
+    if not document.content_hash:
+        return list(iter_document(document.filepath))
+
+    pages = ensure_pages(document.content_hash, document.filepath)
+    return [
+        Document(
+            page_content=text,
+            metadata={"source": document.filepath, "page": i, "total_pages": len(pages)},
+        )
+        for i, text in enumerate(pages)
+    ]
@@ -0,0 +1,120 @@
+"""Băm / xác thực mật khẩu trên executor riêng.
+
+bcrypt tốn ~250 ms CPU mỗi lần verify. Nếu chạy trong thread pool chung của FastAPI,
+một đợt đăng nhập đầu giờ học sẽ chiếm hết worker và các request chat phải chờ.
+Module này chạy bcrypt trên một ThreadPoolExecutor riêng có giới hạn số worker và
+độ dài hàng đợi, đồng thời ghi lại latency và queue depth.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+import asyncio
+import threading
+import time
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from ..config import settings
+from ..metrics import PASSWORD_HASH_SECONDS
+
+T = TypeVar("T")
+
+# Context để hash password. min/max rounds = cost factor hiện tại -> hash với cost
+# khác (cũ hơn hoặc mới hơn) bị đánh dấu needs_update và được rehash khi login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasher:
+    """Executor giới hạn cho bcrypt + thống kê latency / queue depth."""
+
+    def __init__(self, max_workers: int, max_queue: int) -> None:
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="password-hash"
+        )
+        self._max_workers = max_workers
+        self._max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pending = 0  # đang chạy + đang chờ
+        self._count = 0
+        self._rejected = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+        self._total_wait_ms = 0.0
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        with self._lock:
+            if self._pending >= self._max_workers + self._max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many authentication requests, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+
+        submitted = time.perf_counter()
+        timing = {}
+
+        def _timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                timing["wait_ms"] = (started - submitted) * 1000
+                timing["run_ms"] = (time.perf_counter() - started) * 1000
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, _timed)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if timing:
+                    self._count += 1
+                    self._total_ms += timing["run_ms"]
+                    self._total_wait_ms += timing["wait_ms"]
+                    self._max_ms = max(self._max_ms, timing["run_ms"])
+            if timing:
+                PASSWORD_HASH_SECONDS.labels(phase="wait").observe(timing["wait_ms"] / 1000)
+                PASSWORD_HASH_SECONDS.labels(phase="run").observe(timing["run_ms"] / 1000)
+
+    async def hash(self, password: str) -> str:
+        """Hash password trên executor riêng."""
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Verify password; nếu hash dùng cost factor/scheme cũ thì trả thêm hash mới.
+
+        Returns:
+            (hợp lệ, hash mới hoặc None)
+        """
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> Dict[str, float]:
+        """Thống kê: số lần hash, latency trung bình/tối đa, thời gian chờ, queue depth."""
+        with self._lock:
+            return {
+                "count": self._count,
+                "avg_ms": self._total_ms / self._count if self._count else 0.0,
+                "max_ms": self._max_ms,
+                "avg_wait_ms": self._total_wait_ms / self._count if self._count else 0.0,
+                "in_flight": self._pending,
+                "queue_depth": max(self._pending - self._max_workers, 0),
+                "rejected": self._rejected,
+            }
+
+
+password_hasher = PasswordHasher(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
@@ -1,18 +1,24 @@
 """
 RAG Service - Orchestration RAG: build index, answer question
 """
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 from fastapi import HTTPException, status
-from typing import Generator, Optional, Iterable
+from typing import Any, Dict, Generator, Optional, Iterable, Tuple
+import logging
 import os
 
+import numpy as np
+
 from .. import models
 from ..config import settings
 
 # Import RAG components
-from ..rag_pipeline.data_loader import load_document, chunk_documents
+from ..rag_pipeline.bm25_index import BM25Index
+from ..rag_pipeline.data_loader import chunk_documents
 from ..rag_pipeline.embedder import Embedder
-from ..rag_pipeline.vector_store import VectorStore
+from ..rag_pipeline.vector_store import VectorStore, delete_store_files, store_exists
+from ..rag_pipeline.text_analyzer import get_analyzer
+from ..rag_pipeline.token_counter import count_tokens
 from ..ai_deps import get_embedder
 from ..rag_pipeline.rag import (
     create_retriever, 
@@ -20,8 +26,11 @@ from ..rag_pipeline.rag import (
     validate_retriever_setup
 )
 from .vector_store_cache import vector_store_cache
+from . import content_cache, memory_service, page_cache
 from .vector_paths import get_vector_paths
 
+logger = logging.getLogger(__name__)
+
 
 def _ensure_subject_vector_meta(db: Session, subject: models.Subject) -> models.VectorStoreMeta:
     """Lấy hoặc tạo metadata cho vector store của một môn học."""
@@ -48,7 +57,9 @@ def _ensure_subject_vector_meta(db: Session, subject: models.Subject) -> models.
 def get_subject_vector_meta(db: Session, subject_id: int) -> models.VectorStoreMeta:
     """Lấy metadata vector store cho subject theo ID."""
 
-    subject = db.query(models.Subject).filter(models.Subject.id == subject_id).first()
+    subject = db.query(models.Subject).options(
+        joinedload(models.Subject.vector_store_meta)
+    ).filter(models.Subject.id == subject_id).first()
 
     if not subject:
         raise HTTPException(
@@ -58,6 +69,107 @@ def get_subject_vector_meta(db: Session, subject_id: int) -> models.VectorStoreM
 
     return _ensure_subject_vector_meta(db, subject)
 
+
+def get_vector_meta_for_subject(db: Session, subject: models.Subject) -> models.VectorStoreMeta:
+    """Lấy metadata vector store từ subject đã load sẵn (không query lại subject)."""
+
+    return _ensure_subject_vector_meta(db, subject)
+
+
+def _get_conversation_with_vector_meta(
+    db: Session,
+    conversation_id: int,
+    with_documents: bool = False
+) -> models.Conversation:
+    """Lấy conversation kèm subject + vector store meta (và documents nếu cần) trong 1-2 query."""
+
+    options = [
+        joinedload(models.Conversation.subject).joinedload(models.Subject.vector_store_meta)
+    ]
+    if with_documents:
+        options.append(selectinload(models.Conversation.documents))
+
+    conversation = db.query(models.Conversation).options(*options).filter(
+        models.Conversation.id == conversation_id
+    ).first()
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    return conversation
+
+def get_chunk_params(subject: models.Subject) -> Tuple[int, int]:
+    """Tham số chunk của môn học (mặc định theo settings)."""
+    return (
+        subject.chunk_size or settings.CHUNK_SIZE,
+        subject.chunk_overlap if subject.chunk_overlap is not None else settings.CHUNK_OVERLAP,
+    )
+
+
+def get_index_type(subject: models.Subject) -> str:
+    """Loại vector index của môn học (mặc định theo settings)."""
+    return subject.index_type or settings.VECTOR_INDEX_TYPE
+
+
+def get_build_params(subject: models.Subject) -> Tuple[int, int, str]:
+    """Các tham số mà đổi thì phải rebuild vector store."""
+    return (*get_chunk_params(subject), get_index_type(subject))
+
+
+def _load_document_chunks(
+    document: models.Document,
+    embedder: Embedder,
+    chunk_size: int,
+    overlap: int
+):
+    """
+    Chunk + embed một document. Mỗi stage chỉ chạy lại khi input của nó thay đổi:
+    - Text từng trang: page cache theo content_hash (không parse lại PDF)
+    - Chunks + embeddings: content cache theo (content_hash, loader, model, tham số chunk)
+    
+    Returns:
+        (chunks, embeddings, cached): chunks là list {"text", "metadata"} chưa gắn
+        thông tin riêng của document
+    """
+    if document.content_hash:
+        cached = content_cache.load_chunks(document.content_hash, chunk_size, overlap)
+        if cached is not None:
+            logger.debug("Content cache hit for %s", document.filename)
+            return cached[0], cached[1], True
+    
+    docs = page_cache.get_document_pages(document)
+    logger.debug("Loaded %d pages", len(docs))
+    
+    chunks = chunk_documents(docs, chunk_size=chunk_size, overlap=overlap)
+    logger.debug("Created %d chunks", len(chunks))
+    
+    records = [
+        {
+            "text": chunk.page_content,
+            "metadata": {
+                **(chunk.metadata or {}),
+                "token_count": count_tokens(chunk.page_content),
+            },
+        }
+        for chunk in chunks
+    ]
+    
+    dimension = embedder.model.get_sentence_embedding_dimension()
+    embeddings = (
+        np.asarray(embedder.encode([r["text"] for r in records], prefix="passage"), dtype=np.float32)
+        if records
+        else np.empty((0, dimension), dtype=np.float32)
+    )
+    
+    if document.content_hash:
+        content_cache.save_chunks(document.content_hash, chunk_size, overlap, records, embeddings)
+    
+    return records, embeddings, False
+
+
 def build_vector_store_for_subject(
     db: Session,
     subject_id: int,
@@ -68,14 +180,12 @@ def build_vector_store_for_subject(
     
     Steps:
     1. Load tất cả documents của môn học (có thể filter theo danh sách cho phép)
-    2. Chunk documents
-    3. Embed chunks
+    2. Chunk + embed từng document (dùng lại content cache nếu cùng nội dung)
+    3. Gộp embeddings
     4. Lưu vào FAISS index
     5. Cập nhật VectorStoreMeta
     """
-    print(f"\n{'='*60}")
-    print(f"🚀 Building vector store for subject {subject_id}")
-    print(f"{'='*60}\n")
+    logger.info("Building vector store for subject %s", subject_id)
     
     subject = db.query(models.Subject).filter(models.Subject.id == subject_id).first()
     
@@ -91,10 +201,10 @@ def build_vector_store_for_subject(
         # Cập nhật status
         vector_meta.status = "building"
         db.commit()
-        print("📝 Status: building")
+        logger.debug("Status: building")
         
         # Step 1: Load và chunk documents
-        print("\n📚 Step 1: Loading and chunking documents...")
+        logger.debug("Step 1: Loading and chunking documents...")
         all_chunks = []
         doc_count = 0
         
@@ -103,30 +213,27 @@ def build_vector_store_for_subject(
             allowed_ids = set(document_filter)
             documents = [doc for doc in documents if doc.id in allowed_ids]
         
+        embedder = get_embedder()
+        all_embeddings = []
+        reused = 0
+        chunk_size, overlap = get_chunk_params(subject)
+        logger.debug("Chunk params: size=%d, overlap=%d", chunk_size, overlap)
+        
         for document in documents:
             # Kiểm tra file tồn tại
             if not os.path.exists(document.filepath):
-                print(f"⚠️  File not found: {document.filepath}")
+                logger.warning("File not found: %s", document.filepath)
                 continue
             
-            print(f"  📄 Loading: {document.filename}")
+            logger.debug("Loading: %s", document.filename)
             
             try:
-                # Load document
-                docs = load_document(document.filepath)
-                print(f"     ✅ Loaded {len(docs)} pages")
+                chunks, embeddings, cached = _load_document_chunks(document, embedder, chunk_size, overlap)
+                reused += cached
                 
-                # Chunk documents
-                chunks = chunk_documents(
-                    docs, 
-                    chunk_size=800,  # Có thể config
-                    overlap=120
-                )
-                print(f"     ✅ Created {len(chunks)} chunks")
-                
-                # Extract text từ chunks
+                # Gắn metadata riêng của document (chunks trong cache dùng chung giữa các bản sao)
                 for chunk in chunks:
-                    metadata = chunk.metadata.copy() if chunk.metadata else {}
+                    metadata = dict(chunk["metadata"])
                     unique_chunk_id = f"{document.id}-{metadata.get('chunk_id', len(all_chunks)+1)}"
                     metadata.update(
                         {
@@ -137,49 +244,56 @@ def build_vector_store_for_subject(
                             "filename": document.filename,
                         }
                     )
-                    chunk.metadata = metadata
                     
                     all_chunks.append(
                         {
-                            "text": chunk.page_content,
+                            "text": chunk["text"],
                             "metadata": metadata,
                         }
                     )
-                    
+                
+                if len(chunks):
+                    all_embeddings.append(embeddings)
                 doc_count += 1
                 
             except Exception as e:
-                print(f"     ❌ Error loading document: {e}")
+                logger.error("Error loading document %s: %s", document.filename, e)
                 continue
         
         if not all_chunks:
             raise Exception("No texts extracted from documents")
         
-        print(f"\n✅ Total: {len(all_chunks)} chunks from {doc_count} documents")
-        
-        # Step 2: Embed texts
-        print(f"\n🔢 Step 2: Embedding texts...")
-        embedder = get_embedder()
-        print(f"  Model: {settings.EMBEDDING_MODEL}")
+        logger.info(
+            "Total: %d chunks from %d documents (%d reused from content cache)",
+            len(all_chunks), doc_count, reused
+        )
         
-        texts_for_embedding = [chunk["text"] for chunk in all_chunks]
-        embeddings = embedder.encode(texts_for_embedding, prefix="passage")
-        print(f"  ✅ Created embeddings: shape {embeddings.shape}")
+        # Step 2: Gộp embeddings (đã tính theo từng document ở trên)
+        embeddings = np.vstack(all_embeddings)
+        logger.debug("Embeddings: shape %s", embeddings.shape)
         
         # Step 3: Create và save vector store
-        print(f"\n💾 Step 3: Creating vector store...")
+        logger.debug("Step 3: Creating vector store...")
         vector_store = VectorStore(
             dim=embedder.model.get_sentence_embedding_dimension(),
             path=vector_meta.index_path,
-            meta_path=vector_meta.meta_path
+            meta_path=vector_meta.meta_path,
+            index_type=get_index_type(subject),
+            rescore_factor=settings.VECTOR_RESCORE_FACTOR
         )
         
-        print(f"  Index path: {vector_meta.index_path}")
-        print(f"  Meta path: {vector_meta.meta_path}")
+        logger.debug("Index path: %s, meta path: %s", vector_meta.index_path, vector_meta.meta_path)
         
         vector_store.add(embeddings, all_chunks)
-        vector_store.save()
-        print("  ✅ Vector store saved")
+        
+        # BM25 build một lần ở đây và lưu cùng version với FAISS index
+        analyzer = get_analyzer(settings.BM25_ANALYZER)
+        bm25 = BM25Index(analyzer.analyze(chunk["text"]) for chunk in all_chunks)
+        vector_store.save(bm25=bm25, bm25_analyzer=repr(analyzer))
+        logger.debug("Vector store saved")
+        
+        # Bộ nhớ + recall@k (index nén so với fp32) của index vừa build
+        index_report = vector_store.build_report()
         
         # Step 4: Update metadata
         vector_meta.doc_count = len(all_chunks)
@@ -189,17 +303,14 @@ def build_vector_store_for_subject(
         
         db.commit()
         
-        print(f"\n{'='*60}")
-        print("✅ Vector store built successfully!")
-        print(f"   - Chunks: {len(all_chunks)}")
-        print(f"   - Dimension: {embedder.model.get_sentence_embedding_dimension()}")
-        print("   - Status: ready")
-        print(f"{'='*60}\n")
+        logger.info(
+            "Vector store built successfully for subject %s",
+            subject_id,
+            extra={"chunks": len(all_chunks), "dimension": vector_meta.dimension, **index_report}
+        )
         
     except Exception as e:
-        print(f"{'='*60}")
-        print(f"❌ Error building vector store: {e}")
-        print(f"{'='*60}\n")
+        logger.exception("Error building vector store for subject %s: %s", subject_id, e)
         
         # Cập nhật lỗi
         vector_meta.status = "error"
@@ -217,7 +328,8 @@ def answer_question_for_conversation(
     conversation_id: int,
     question: str,
     streaming: bool = False,
-    use_reranker: bool = False
+    use_reranker: bool = False,
+    stats: Optional[Dict[str, Any]] = None
 ) -> str | Generator[str, None, None]:
     """
     Trả lời câu hỏi cho conversation
@@ -228,21 +340,16 @@ def answer_question_for_conversation(
         question: Câu hỏi của user
         streaming: True để stream response
         use_reranker: True để dùng reranker
+        stats: Dict (optional) nhận thời gian từng stage của pipeline
         
     Returns:
         str nếu streaming=False
         Generator[str] nếu streaming=True
     """
-    # Lấy conversation
-    conversation = db.query(models.Conversation).filter(
-        models.Conversation.id == conversation_id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
+    # Lấy conversation (eager load subject, vector meta và documents)
+    conversation = _get_conversation_with_vector_meta(
+        db, conversation_id, with_documents=True
+    )
     
     vector_meta = _ensure_subject_vector_meta(db, conversation.subject)
     
@@ -272,16 +379,10 @@ def answer_question_for_conversation(
         )
     
     # Kiểm tra files tồn tại
-    if not os.path.exists(vector_meta.index_path):
+    if not store_exists(vector_meta.index_path, vector_meta.meta_path):
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Vector store index file not found"
-        )
-    
-    if not os.path.exists(vector_meta.meta_path):
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Vector store meta file not found"
+            detail="Vector store files not found"
         )
     
     try:
@@ -303,6 +404,13 @@ def answer_question_for_conversation(
             conv_doc.document_id for conv_doc in conversation.documents
         }
         
+        # Conversation memory: summary cuốn chiếu + N lượt gần nhất
+        summary, recent_turns = None, None
+        if settings.MEMORY_ENABLED:
+            summary, recent_turns = memory_service.get_conversation_memory(
+                db, conversation, question=question
+            )
+        
         # Gọi RAG pipeline
         answer = answer_question_with_store(
             question=question,
@@ -311,13 +419,17 @@ def answer_question_for_conversation(
             use_reranker=use_reranker,
             reranker_top_k=3,
             detect_language=True,
-            allowed_document_ids=allowed_doc_ids or None
+            allowed_document_ids=allowed_doc_ids or None,
+            conversation_id=conversation_id,
+            stats=stats,
+            conversation_summary=summary,
+            recent_turns=recent_turns
         )
         
         return answer
         
     except Exception as e:
-        print(f"❌ Error answering question: {e}")
+        logger.exception("Error answering question: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to answer question: {str(e)}"
@@ -338,15 +450,7 @@ def get_vector_store_status(
     Returns:
         VectorStoreMeta instance
     """
-    conversation = db.query(models.Conversation).filter(
-        models.Conversation.id == conversation_id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
+    conversation = _get_conversation_with_vector_meta(db, conversation_id)
     
     vector_meta = _ensure_subject_vector_meta(db, conversation.subject)
     
@@ -364,31 +468,18 @@ def rebuild_vector_store_for_conversation(
         db: Database session
         conversation_id: ID của conversation
     """
-    print(f"\n🔄 Rebuilding vector store for conversation {conversation_id}")
+    logger.info("Rebuilding vector store for conversation %s", conversation_id)
     
-    conversation = db.query(models.Conversation).filter(
-        models.Conversation.id == conversation_id
-    ).first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
+    conversation = _get_conversation_with_vector_meta(db, conversation_id)
     
     vector_meta = _ensure_subject_vector_meta(db, conversation.subject)
     
-    # Xóa files cũ nếu có
+    # Xóa files cũ nếu có (manifest + artifact của mọi version)
     try:
-        if os.path.exists(vector_meta.index_path):
-            os.remove(vector_meta.index_path)
-            print("  ✅ Deleted old index file")
-        
-        if os.path.exists(vector_meta.meta_path):
-            os.remove(vector_meta.meta_path)
-            print("  ✅ Deleted old meta file")
+        delete_store_files(vector_meta.index_path, vector_meta.meta_path)
+        logger.debug("Deleted old vector store files")
     except Exception as e:
-        print(f"  ⚠️  Error deleting old files: {e}")
+        logger.warning("Error deleting old files: %s", e)
     
     # Reset status
     vector_meta.status = "empty"
@@ -423,7 +514,7 @@ def validate_conversation_vector_store(
         "doc_count": vector_meta.doc_count,
         "dimension": vector_meta.dimension,
         "files_exist": {
-            "index": os.path.exists(vector_meta.index_path),
+            "index": store_exists(vector_meta.index_path, vector_meta.meta_path),
             "meta": os.path.exists(vector_meta.meta_path)
         },
         "is_ready": False,
@@ -1,8 +1,19 @@
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
-from typing import List
+from typing import List, Optional
 
 from .. import models, schemas
+from ..config import settings
+
+
+def _validate_chunk_params(chunk_size: Optional[int], chunk_overlap: Optional[int]) -> None:
+    size = chunk_size or settings.CHUNK_SIZE
+    overlap = chunk_overlap if chunk_overlap is not None else settings.CHUNK_OVERLAP
+    if overlap >= size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="chunk_overlap must be smaller than chunk_size"
+        )
 
 
 def create_subject(
@@ -13,10 +24,15 @@ def create_subject(
     """
     Tạo môn học mới
     """
+    _validate_chunk_params(subject_data.chunk_size, subject_data.chunk_overlap)
+    
     db_subject = models.Subject(
         user_id=user_id,
         name=subject_data.name,
-        description=subject_data.description
+        description=subject_data.description,
+        chunk_size=subject_data.chunk_size,
+        chunk_overlap=subject_data.chunk_overlap,
+        index_type=subject_data.index_type
     )
     
     db.add(db_subject)
@@ -76,6 +92,16 @@ def update_subject(
     if subject_data.description is not None:
         subject.description = subject_data.description
     
+    if subject_data.chunk_size is not None or subject_data.chunk_overlap is not None:
+        chunk_size = subject_data.chunk_size if subject_data.chunk_size is not None else subject.chunk_size
+        chunk_overlap = subject_data.chunk_overlap if subject_data.chunk_overlap is not None else subject.chunk_overlap
+        _validate_chunk_params(chunk_size, chunk_overlap)
+        subject.chunk_size = chunk_size
+        subject.chunk_overlap = chunk_overlap
+    
+    if subject_data.index_type is not None:
+        subject.index_type = subject_data.index_type
+    
     db.commit()
     db.refresh(subject)
     
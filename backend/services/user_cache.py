@@ -0,0 +1,109 @@
+"""Cache user đã xác thực trong process.
+
+get_current_user chạy cho mọi request có xác thực. Một phiên chat stream gọi rất nhiều
+request (messages, vector-status polling, chat...), nên bảng users trở thành query nóng nhất.
+Module này giữ bản sao user (detached) theo `sub` của token trong một cache LRU có TTL ngắn;
+cache tự động bị xóa khi user được cập nhật hoặc xóa qua ORM.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from .. import models
+from ..config import settings
+
+_USER_COLUMNS = ("id", "email", "hashed_password", "full_name", "created_at", "updated_at")
+
+
+class UserCache:
+    """Cache LRU + TTL cho user, có thống kê hit-rate."""
+
+    def __init__(self, ttl_seconds: float, max_size: int) -> None:
+        self._ttl = ttl_seconds
+        self._max_size = max_size
+        self._entries: "OrderedDict[int, Tuple[float, models.User]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_size > 0
+
+    @staticmethod
+    def _snapshot(user: models.User) -> models.User:
+        """Tạo bản sao detached (không gắn với session của request) để dùng chung giữa các thread."""
+        snapshot = models.User(**{col: getattr(user, col) for col in _USER_COLUMNS})
+        make_transient_to_detached(snapshot)
+        return snapshot
+
+    def get(self, user_id: int) -> Optional[models.User]:
+        """Lấy user còn hạn trong cache (None nếu miss/hết hạn)."""
+        if not self.enabled:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[user_id]
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, user: models.User) -> None:
+        """Lưu bản sao của user vừa load từ DB."""
+        if not self.enabled:
+            return
+
+        snapshot = self._snapshot(user)
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self._ttl, snapshot)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Xóa user khỏi cache (gọi khi user bị cập nhật/xóa)."""
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Thống kê cache: hits, misses, hit_rate, size, invalidations."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / total if total else 0.0,
+                "size": len(self._entries),
+                "invalidations": self._invalidations,
+            }
+
+
+user_cache = UserCache(
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    max_size=settings.USER_CACHE_MAX_SIZE,
+)
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_cached_user(mapper, connection, target: models.User) -> None:
+    user_cache.invalidate(target.id)
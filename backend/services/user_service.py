@@ -1,31 +1,42 @@
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
 from fastapi import HTTPException, status
+import anyio
+import logging
 
 from .. import models, schemas
+from .password_hasher import password_hasher, pwd_context
 
-# Context để hash password
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password"""
+    """Verify password (đồng bộ - chỉ dùng ngoài request, ví dụ script)"""
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    """Hash password"""
+    """Hash password (đồng bộ - chỉ dùng ngoài request, ví dụ init_script)"""
     return pwd_context.hash(password)
 
 
-def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
+def _get_user_by_email(db: Session, email: str) -> models.User:
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def _save_user(db: Session, user: models.User) -> models.User:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+async def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
     """
-    Tạo user mới
+    Tạo user mới.
+    Hash password chạy trên executor riêng; truy vấn DB chạy trong worker thread.
     """
     # Kiểm tra email đã tồn tại
-    existing_user = db.query(models.User).filter(
-        models.User.email == user_data.email
-    ).first()
+    existing_user = await anyio.to_thread.run_sync(_get_user_by_email, db, user_data.email)
     
     if existing_user:
         raise HTTPException(
@@ -36,22 +47,20 @@ def create_user(db: Session, user_data: schemas.UserCreate) -> models.User:
     # Tạo user mới
     db_user = models.User(
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await password_hasher.hash(user_data.password),
         full_name=user_data.full_name
     )
     
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return db_user
+    return await anyio.to_thread.run_sync(_save_user, db, db_user)
 
 
-def authenticate_user(db: Session, email: str, password: str) -> models.User:
+async def authenticate_user(db: Session, email: str, password: str) -> models.User:
     """
-    Xác thực user
+    Xác thực user.
+    Nếu hash lưu trong DB dùng cost factor cũ (BCRYPT_ROUNDS đã đổi) thì
+    hash lại password ngay khi đăng nhập thành công.
     """
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = await anyio.to_thread.run_sync(_get_user_by_email, db, email)
     
     if not user:
         raise HTTPException(
@@ -59,12 +68,18 @@ def authenticate_user(db: Session, email: str, password: str) -> models.User:
             detail="Incorrect email or password"
         )
     
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
+    if new_hash:
+        user.hashed_password = new_hash
+        await anyio.to_thread.run_sync(_save_user, db, user)
+        logger.info("Rehashed password for user %s", user.id)
+    
     return user
 
 
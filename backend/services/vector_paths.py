@@ -1,7 +1,10 @@
+import logging
 from pathlib import Path
 from typing import Tuple
 from ..config import settings
 
+logger = logging.getLogger(__name__)
+
 
 def get_vector_paths(
     user_id: int,
@@ -26,16 +29,12 @@ def get_vector_paths(
 
 def delete_vector_files(index_path: str, meta_path: str) -> None:
     """
-    Xóa các file vector store
+    Xóa các file vector store (manifest và artifact của mọi version)
     """
-    import os
+    from ..rag_pipeline.vector_store import delete_store_files
     
     try:
-        if os.path.exists(index_path):
-            os.remove(index_path)
-        
-        if os.path.exists(meta_path):
-            os.remove(meta_path)
+        delete_store_files(index_path, meta_path)
             
     except Exception as e:
-        print(f"Failed to delete vector files: {e}")
+        logger.warning("Failed to delete vector files: %s", e)
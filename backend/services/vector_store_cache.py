@@ -5,10 +5,13 @@ cho phép người dùng chat liên tục mà không phải load lại vector st
 """
 
 from typing import Dict, Optional
-import os
+import logging
 
 from ..ai_deps import get_embedder
 from ..rag_pipeline.rag import create_retriever, RAGRetriever
+from ..rag_pipeline.vector_store import store_exists
+
+logger = logging.getLogger(__name__)
 
 
 class VectorStoreCache:
@@ -38,7 +41,7 @@ class VectorStoreCache:
         if not vector_meta or vector_meta.status != "ready":
             return
 
-        if not (os.path.exists(vector_meta.index_path) and os.path.exists(vector_meta.meta_path)):
+        if not store_exists(vector_meta.index_path, vector_meta.meta_path):
             return
 
         try:
@@ -50,7 +53,7 @@ class VectorStoreCache:
             )
             self._cache[subject_id] = retriever
         except Exception as exc:  # pragma: no cover - logging side-effect
-            print(f"⚠️  Không thể nạp vector store cho subject {subject_id}: {exc}")
+            logger.warning("Không thể nạp vector store cho subject %s: %s", subject_id, exc)
 
     def get_retriever(self, subject_id: int) -> Optional[RAGRetriever]:
         """Lấy retriever từ cache (nếu tồn tại)."""
@@ -63,5 +66,12 @@ class VectorStoreCache:
         if self._active_subject_id == subject_id:
             self._cache[subject_id] = retriever
 
+    def stats(self) -> Dict[str, int]:
+        """Thống kê cache: số retriever đang giữ và tổng số chunk đã nạp."""
+        return {
+            "size": len(self._cache),
+            "chunks": sum(len(r.retriever.store.documents) for r in self._cache.values()),
+        }
+
 
 vector_store_cache = VectorStoreCache()
\ No newline at end of file
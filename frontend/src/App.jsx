@@ -180,6 +180,7 @@ const ChatApp = () => {
   const [conversations, setConversations] = useState([]);
   const [selectedConversation, setSelectedConversation] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
   const [inputMessage, setInputMessage] = useState('');
   const [isStreaming, setIsStreaming] = useState(false);
   const [vectorStatus, setVectorStatus] = useState('ready'); 
@@ -283,11 +284,25 @@ const ChatApp = () => {
     } catch (error) { console.error(error); }
   };
 
+  // Lấy trang mới nhất (order=desc), đảo lại để hiển thị theo thời gian
   const fetchMessages = async (conversationId) => {
     try {
-      const response = await apiCall(`/conversations/${conversationId}/messages`);
+      const response = await apiCall(`/conversations/${conversationId}/messages?order=desc`);
       const data = await response.json();
-      setMessages(data);
+      setMessages([...data.items].reverse());
+      setOlderCursor(data.next_cursor);
+    } catch (error) { console.error(error); }
+  };
+
+  const fetchOlderMessages = async () => {
+    if (!selectedConversation || !olderCursor) return;
+    try {
+      const response = await apiCall(
+        `/conversations/${selectedConversation.id}/messages?order=desc&cursor=${encodeURIComponent(olderCursor)}`
+      );
+      const data = await response.json();
+      setMessages(prev => [...[...data.items].reverse(), ...prev]);
+      setOlderCursor(data.next_cursor);
     } catch (error) { console.error(error); }
   };
 
@@ -339,6 +354,7 @@ const ChatApp = () => {
       if (selectedConversation?.id === convId) {
         setSelectedConversation(null);
         setMessages([]);
+        setOlderCursor(null);
       }
     } catch (error) {
       alert("Xóa thất bại");
@@ -413,8 +429,14 @@ const ChatApp = () => {
 
         for (const line of lines) {
           if (line.startsWith('data: ')) {
-            const data = line.slice(6);
-            if (data === '[DONE]') break;
+            const raw = line.slice(6);
+            if (raw === '[DONE]') break;
+
+            // Mỗi event là JSON: {content} hoặc {error}
+            let event;
+            try { event = JSON.parse(raw); } catch { continue; }
+            const data = event.content ?? event.error ?? '';
+            if (!data) continue;
             
             // Cập nhật state an toàn
             setMessages(prev => {
@@ -536,6 +558,13 @@ const ChatApp = () => {
               )}
 
               <div className="flex-1 overflow-y-auto p-6 space-y-6 scrollbar-thin scrollbar-thumb-white/10 scrollbar-track-transparent">
+                {olderCursor && (
+                  <div className="flex justify-center">
+                    <button onClick={fetchOlderMessages} className="text-xs text-gray-400 hover:text-white">
+                      Tải tin nhắn cũ hơn
+                    </button>
+                  </div>
+                )}
                 {messages.map((msg, idx) => (
                   <div key={idx} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
                     <div className={`max-w-[85%] lg:max-w-[75%] px-6 py-4 rounded-2xl text-sm leading-relaxed shadow-lg backdrop-blur-sm ${msg.role === 'user' ? 'bg-white text-black font-medium rounded-br-none' : 'bg-[#2c2c2e]/90 text-gray-100 rounded-bl-none border border-white/5'}`}>